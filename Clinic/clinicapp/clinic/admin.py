@@ -4,7 +4,7 @@ from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import Group
 from django.utils.html import mark_safe
 
-from .models import MyUser, Shift, WorkSchedule, Appointment, Doctor, Medicine
+from .models import MyUser, Shift, WorkSchedule, ShiftCalendar, Appointment, Doctor, Medicine, EmailOutbox
 
 
 admin.site.site_header = 'Clinic Administration'
@@ -41,14 +41,13 @@ class MyUserAdmin(admin.ModelAdmin):
 
     @staticmethod
     def current_avatar(obj):
-        if obj.avatar:
-            return mark_safe(f'<img src="{obj.avatar.url}" alt={obj.fullname} width="100" height="100">')
+        if obj.avatar_detail_url:
+            return mark_safe(f'<img src="{obj.avatar_detail_url}" alt={obj.fullname} width="100" height="100">')
 
     def save_model(self, request, obj, form, change):
         obj.password = make_password(obj.password)
-        obj.groups.clear()
-        obj.groups.add(Group.objects.get(name=obj.role))
         super().save_model(request, obj, form, change)
+        obj.groups.set([Group.objects.get(name=obj.role)])
 
     class Meta:
         model = MyUser
@@ -74,6 +73,27 @@ class WorkScheduleAdmin(admin.ModelAdmin):
         model = WorkSchedule
 
 
+# Ai làm ca nào trong ngày: đọc từ lịch theo ngày sinh từ WorkSchedule nên chỉ xem, không sửa trực tiếp
+class ShiftCalendarAdmin(admin.ModelAdmin):
+    list_display = ('date', 'shift', 'employee', 'work_schedule')
+    list_filter = ('date', 'shift', 'employee__role')
+    list_select_related = ('shift', 'employee', 'work_schedule__employee')
+    date_hierarchy = 'date'
+    ordering = ('-date', 'shift__start_time', 'employee_id')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    class Meta:
+        model = ShiftCalendar
+
+
 class AppointmentAdmin(admin.ModelAdmin):
     list_display = ('id', 'patient', 'doctor', 'nurse', 'time', 'status')
     list_filter = ('patient', 'doctor', 'nurse', 'time', 'status')
@@ -106,11 +126,23 @@ class MedicineAdmin(admin.ModelAdmin):
         model = Medicine
 
 
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('id', 'recipient', 'subject', 'status', 'attempts', 'next_attempt_date', 'sent_date')
+    list_filter = ('status',)
+    search_fields = ('recipient', 'subject')
+    ordering = ('-id',)
+
+    class Meta:
+        model = EmailOutbox
+
+
 # Register your models here.
 admin.site.register(MyUser, MyUserAdmin)
 admin.site.register(Shift, ShiftAdmin)
 admin.site.register(WorkSchedule, WorkScheduleAdmin)
+admin.site.register(ShiftCalendar, ShiftCalendarAdmin)
 admin.site.register(Appointment, AppointmentAdmin)
 admin.site.register(Doctor, DoctorAdmin)
 admin.site.register(Medicine, MedicineAdmin)
+admin.site.register(EmailOutbox, EmailOutboxAdmin)
 
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ClinicConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'clinic'
+
+    def ready(self):
+        from . import metrics, signals  # noqa: F401
+        metrics.install()
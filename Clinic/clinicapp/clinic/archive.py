@@ -0,0 +1,180 @@
+import heapq
+import contextvars
+from datetime import datetime, timedelta
+from functools import cmp_to_key
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    Appointment, Prescription, PrescriptionDetail, Invoice,
+    ArchivedAppointment, ArchivedPrescription, ArchivedPrescriptionDetail, ArchivedInvoice
+)
+
+ARCHIVE_BATCH_SIZE = 500
+# Trạng thái đã đóng: không còn giữ khung giờ và không còn thay đổi
+ARCHIVE_STATUSES = ('cancelled', 'exam_completed')
+INCLUDE_ARCHIVED_PARAM = 'include_archived'
+
+
+def get_cutoff(today=None):
+    return (today or timezone.localdate()) - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+
+
+# Lịch hẹn đã đóng trước ngày cutoff; hoá đơn còn chờ thanh toán thì chưa lưu trữ
+def archivable_appointments(cutoff):
+    return Appointment.objects.filter(status__in=ARCHIVE_STATUSES, date__lt=cutoff).exclude(invoice__status='pending')
+
+
+def copied_fields(model):
+    return [field.attname for field in model._meta.concrete_fields if field.name != 'archived_date']
+
+
+def copy_rows(queryset, archive_model):
+    rows = list(queryset.values(*copied_fields(archive_model)))
+    archive_model.objects.bulk_create([archive_model(**row) for row in rows], batch_size=ARCHIVE_BATCH_SIZE)
+    return [row['id'] for row in rows]
+
+
+_archiving = contextvars.ContextVar('clinic_archiving', default=False)
+
+
+# Signal xoá lịch hẹn/hoá đơn bỏ qua cập nhật thống kê, bộ đếm khi dòng bị xoá vì đã chuyển sang bảng lưu trữ
+def is_archiving():
+    return _archiving.get()
+
+
+# Chuyển một lô lịch hẹn (kèm đơn thuốc, chi tiết đơn, hoá đơn) sang bảng lưu trữ trong một transaction.
+# Mỗi lô được commit riêng nên job dừng giữa chừng thì lần chạy sau tiếp tục từ các lịch hẹn còn lại.
+# Bảng thống kê/đếm theo ngày vẫn giữ số liệu của dữ liệu đã lưu trữ nên signal xoá không trừ lại số liệu.
+def archive_batch(cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    with transaction.atomic():
+        appointment_ids = list(archivable_appointments(cutoff).select_for_update()
+                               .order_by('id').values_list('id', flat=True)[:batch_size])
+        if not appointment_ids:
+            return 0
+
+        appointment_ids = copy_rows(Appointment.objects.filter(id__in=appointment_ids), ArchivedAppointment)
+        prescription_ids = copy_rows(Prescription.objects.filter(appointment_id__in=appointment_ids),
+                                     ArchivedPrescription)
+        detail_ids = copy_rows(PrescriptionDetail.objects.filter(prescription_id__in=prescription_ids),
+                               ArchivedPrescriptionDetail)
+        invoice_ids = copy_rows(Invoice.objects.filter(appointment_id__in=appointment_ids), ArchivedInvoice)
+
+        token = _archiving.set(True)
+        try:
+            for model, ids in ((Invoice, invoice_ids), (PrescriptionDetail, detail_ids),
+                               (Prescription, prescription_ids), (Appointment, appointment_ids)):
+                model.objects.filter(id__in=ids).delete()
+        finally:
+            _archiving.reset(token)
+    return len(appointment_ids)
+
+
+# Có đọc cả bảng lưu trữ không: khi client yêu cầu (?include_archived=true) hoặc hỏi một ngày đã quá cutoff
+def include_archived(request, day=None):
+    if request.query_params.get(INCLUDE_ARCHIVED_PARAM, '').lower() in ('1', 'true'):
+        return True
+    if day is None:
+        return False
+    if isinstance(day, str):
+        try:
+            day = datetime.strptime(day, '%Y-%m-%d').date()
+        except ValueError:
+            return False
+    return day < get_cutoff()
+
+
+def value_of(row, field, fields):
+    if isinstance(row, dict):
+        return row[field]
+    if isinstance(row, tuple):
+        return row[fields.index(field)]
+    return getattr(row, field)
+
+
+# Ghép queryset của bảng đang dùng và bảng lưu trữ thành một "queryset" chỉ đọc: filter/order_by/values...
+# được áp dụng cho từng bảng, mỗi lát cắt [start:stop] lấy tối đa stop dòng từ mỗi bảng rồi trộn theo thứ tự.
+# Đủ cho phân trang theo con trỏ (serialize_list) và đọc theo lô khoá chính (exports.iterate_rows).
+class UnionQuerySet:
+    def __init__(self, querysets, ordering=(), fields=None, flat=False):
+        self.querysets = list(querysets)
+        self.ordering = tuple(ordering)
+        self.fields = fields
+        self.flat = flat
+
+    # Hai bảng có cùng các cột nên model của bảng đang dùng đại diện cho cả hai (vd. khi đọc kiểu cột)
+    @property
+    def model(self):
+        return self.querysets[0].model
+
+    def _apply(self, method, *args, **kwargs):
+        querysets = [getattr(queryset, method)(*args, **kwargs) for queryset in self.querysets]
+        return UnionQuerySet(querysets, self.ordering, self.fields, self.flat)
+
+    def filter(self, *args, **kwargs):
+        return self._apply('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._apply('exclude', *args, **kwargs)
+
+    def select_related(self, *fields):
+        return self._apply('select_related', *fields)
+
+    def values(self, *fields):
+        union = self._apply('values', *fields)
+        union.fields, union.flat = list(fields), False
+        return union
+
+    def values_list(self, *fields, flat=False):
+        union = self._apply('values_list', *fields, flat=flat)
+        union.fields, union.flat = list(fields), flat
+        return union
+
+    def order_by(self, *ordering):
+        union = self._apply('order_by', *ordering)
+        union.ordering = ordering
+        return union
+
+    def all(self):
+        return self._apply('all')
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def exists(self):
+        return any(queryset.exists() for queryset in self.querysets)
+
+    def compare(self, a, b):
+        for field in self.ordering:
+            name = field.lstrip('-')
+            if self.flat:
+                left, right = a, b
+            else:
+                left, right = value_of(a, name, self.fields), value_of(b, name, self.fields)
+            if left != right:
+                # NULL đứng trước như khi sắp xếp tăng dần trên MySQL/SQLite
+                result = -1 if left is None or (right is not None and left < right) else 1
+                return -result if field.startswith('-') else result
+        return 0
+
+    def __getitem__(self, item):
+        if isinstance(item, int):
+            return self[item:item + 1][0]
+        if item.stop is None or item.step is not None:
+            raise TypeError('UnionQuerySet only supports bounded slices')
+        rows = self.merge(queryset[:item.stop] for queryset in self.querysets)
+        return list(islice(rows, item.start or 0, item.stop))
+
+    # Trộn k-đường các truy vấn đã sắp xếp theo cùng ordering, mỗi lần chỉ giữ một dòng của mỗi truy vấn
+    def merge(self, querysets):
+        return heapq.merge(*(queryset.iterator() for queryset in querysets), key=cmp_to_key(self.compare))
+
+    def __iter__(self):
+        return self.merge(self.querysets)
+
+
+def union(queryset, archived_queryset):
+    return UnionQuerySet([queryset, archived_queryset])
@@ -0,0 +1,102 @@
+import io
+import os
+import uuid
+from abc import ABC, abstractmethod
+
+import cloudinary
+from cloudinary import uploader
+from cloudinary.models import CloudinaryField
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.utils.module_loading import import_string
+from PIL import Image, ImageOps
+
+# Kích thước ảnh đại diện theo nơi hiển thị: danh sách (bác sĩ, ...) và trang chi tiết/hồ sơ
+AVATAR_SIZES = {
+    'list': 96,
+    'detail': 320,
+}
+
+
+# Lưu ảnh đại diện và trả về URL của ảnh gốc cùng các bản thu nhỏ. URL được tính một lần
+# khi ảnh thay đổi và lưu vào MyUser (avatar_url, avatar_list_url, avatar_detail_url).
+class AvatarStorage(ABC):
+    @abstractmethod
+    def save(self, user, file):
+        pass
+
+    @abstractmethod
+    def get_urls(self, avatar):
+        pass
+
+    def prepare(self, user, avatar):
+        if isinstance(avatar, UploadedFile):
+            avatar = self.save(user, avatar)
+        return avatar, self.get_urls(avatar)
+
+
+# Cloudinary tự sinh bản thu nhỏ theo URL biến đổi; khi tải lên ta yêu cầu sinh sẵn (eager)
+class CloudinaryAvatarStorage(AvatarStorage):
+    def transformation(self, size):
+        return {'width': size, 'height': size, 'crop': 'fill', 'gravity': 'face',
+                'fetch_format': 'auto', 'quality': 'auto'}
+
+    def save(self, user, file):
+        if hasattr(file, 'seekable') and file.seekable():
+            file.seek(0)
+        return uploader.upload_resource(file, eager=[self.transformation(size) for size in AVATAR_SIZES.values()])
+
+    def get_urls(self, avatar):
+        if not isinstance(avatar, cloudinary.CloudinaryResource):
+            avatar = CloudinaryField().to_python(str(avatar))
+        urls = {'original': avatar.build_url(secure=True)}
+        for name, size in AVATAR_SIZES.items():
+            urls[name] = avatar.build_url(secure=True, **self.transformation(size))
+        return urls
+
+
+# Thay thế cục bộ (môi trường dev/test): lưu vào default_storage và tạo bản thu nhỏ bằng Pillow
+class LocalAvatarStorage(AvatarStorage):
+    folder = 'avatars'
+
+    def thumbnail_name(self, name, size_name):
+        stem, ext = os.path.splitext(name)
+        return f'{stem}_{size_name}.jpg'
+
+    def save(self, user, file):
+        ext = os.path.splitext(file.name)[1].lower() or '.jpg'
+        name = default_storage.save(f'{self.folder}/{uuid.uuid4().hex}{ext}', file)
+        file.seek(0)
+        with Image.open(file) as image:
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            for size_name, size in AVATAR_SIZES.items():
+                thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+                buffer = io.BytesIO()
+                thumbnail.save(buffer, format='JPEG', quality=85, optimize=True)
+                default_storage.save(self.thumbnail_name(name, size_name), ContentFile(buffer.getvalue()))
+        return name
+
+    def get_urls(self, avatar):
+        name = str(avatar)
+        urls = {'original': default_storage.url(name)}
+        for size_name in AVATAR_SIZES:
+            thumbnail = self.thumbnail_name(name, size_name)
+            urls[size_name] = default_storage.url(thumbnail) if default_storage.exists(thumbnail) else urls['original']
+        return urls
+
+
+def get_avatar_storage():
+    return import_string(settings.AVATAR_STORAGE)()
+
+
+# Gọi khi lưu user có ảnh đại diện mới (xem MyUser.save)
+def update_avatar_urls(user):
+    if not user.avatar:
+        user.avatar_url = user.avatar_list_url = user.avatar_detail_url = None
+        return
+    user.avatar, urls = get_avatar_storage().prepare(user, user.avatar)
+    user.avatar_url = urls['original']
+    user.avatar_list_url = urls['list']
+    user.avatar_detail_url = urls['detail']
@@ -1,9 +1,169 @@
-from django.core.mail import send_mail
-from .models import Appointment
+from collections import Counter
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import slots, stats
+from .events import publish_appointment_event
+from .models import Appointment, DailyAppointmentCount, EmailOutbox
+
+EMAIL_MAX_ATTEMPTS = 5
+EMAIL_RETRY_DELAY = 60  # giây, nhân đôi sau mỗi lần gửi lỗi
+EMAIL_LEASE_SECONDS = 5 * 60  # thời gian worker giữ một lô đang gửi
 
 
 def is_max_appointment_per_day_reached(date):
-    return Appointment.objects.filter(date=date).count() == 100
+    return DailyAppointmentCount.objects.filter(date=date, total__gte=settings.MAX_APPOINTMENT_PER_DAY).exists()
+
+
+async def ais_max_appointment_per_day_reached(date):
+    return await DailyAppointmentCount.objects.filter(
+        date=date, total__gte=settings.MAX_APPOINTMENT_PER_DAY
+    ).aexists()
+
+
+def get_fully_booked_dates(from_date, to_date):
+    return set(DailyAppointmentCount.objects.filter(
+        date__range=(from_date, to_date),
+        total__gte=settings.MAX_APPOINTMENT_PER_DAY
+    ).values_list('date', flat=True))
+
+
+# Khoá dòng đếm của ngày để các lượt đặt cùng ngày kiểm tra giới hạn tuần tự; phải gọi trong transaction
+def reserve_appointment_day(date):
+    counter, created = DailyAppointmentCount.objects.select_for_update().get_or_create(date=date)
+    return counter.total < settings.MAX_APPOINTMENT_PER_DAY
+
+
+# Bộ đếm có thể đã lệch với dữ liệu thật (ghi/xoá trực tiếp không qua signal) nên khi giảm thì dừng ở 0.
+# Viết GREATEST(total, -delta) + delta thay vì GREATEST(total + delta, 0) vì cột không dấu trên MySQL
+# báo lỗi ngay khi total + delta âm.
+def change_appointment_count(date, delta):
+    total = F('total') + delta if delta >= 0 else Greatest(F('total'), -delta) + delta
+    with transaction.atomic():
+        updated = DailyAppointmentCount.objects.filter(date=date).update(total=total)
+        if not updated and delta > 0:
+            # Tạo dòng của ngày dưới khoá như reserve_appointment_day để hai lượt tạo đồng thời không mất số đếm
+            counter, created = DailyAppointmentCount.objects.select_for_update().get_or_create(date=date)
+            DailyAppointmentCount.objects.filter(pk=counter.pk).update(total=F('total') + delta)
+
+
+# Chuyển trạng thái nhiều lịch hẹn bằng một câu UPDATE có điều kiện; phải gọi trong transaction.
+# UPDATE không phát signal nên chỉ mục khung giờ, bộ đếm theo ngày, thống kê và email được cập nhật tại đây.
+def bulk_change_appointment_status(queryset, from_statuses, to_status, build_email, **values):
+    rows = list(queryset.filter(status__in=from_statuses).select_for_update()
+                .values_list('id', 'doctor_id', 'date', 'time', 'status'))
+    if not rows:
+        return []
+    ids = [row[0] for row in rows]
+    holds_slot = to_status in Appointment.active_statuses
+    Appointment.objects.filter(pk__in=ids, status__in=from_statuses).update(
+        status=to_status,
+        holds_slot=True if holds_slot else None,
+        updated_date=timezone.now(),
+        **values
+    )
+
+    day_deltas = Counter()
+    stat_deltas = Counter()
+    slot_doctor_ids = set()
+    for appointment_id, doctor_id, date, time, previous_status in rows:
+        stat_deltas[(date, doctor_id, previous_status)] -= 1
+        stat_deltas[(date, doctor_id, to_status)] += 1
+        if (previous_status == 'cancelled') != (to_status == 'cancelled'):
+            day_deltas[date] += -1 if to_status == 'cancelled' else 1
+        if doctor_id and (previous_status in Appointment.active_statuses) != holds_slot:
+            slot_doctor_ids.add(doctor_id)
+    if slot_doctor_ids:
+        transaction.on_commit(partial(slots.invalidate, *slot_doctor_ids))
+    for date, delta in day_deltas.items():
+        if delta:
+            change_appointment_count(date, delta)
+    stats.apply_appointment_deltas(stat_deltas)
+
+    appointments = list(Appointment.objects.filter(pk__in=ids).select_related('patient', 'doctor', 'nurse')
+                        .order_by('date', 'time', 'id'))
+    previous_statuses = {row[0]: row[4] for row in rows}
+    emails = []
+    for appointment in appointments:
+        publish_appointment_event(appointment, 'status_changed', previous_statuses[appointment.id])
+        subject, message, recipient_list = build_email(appointment)
+        emails += [EmailOutbox(subject=subject, message=message, recipient=recipient)
+                   for recipient in recipient_list if recipient]
+    EmailOutbox.objects.bulk_create(emails)
+    return appointments
+
+
+# Email được ghi vào outbox trong transaction của request, worker send_queued_emails sẽ gửi sau
+def queue_email(subject, message, recipient_list):
+    EmailOutbox.objects.bulk_create([
+        EmailOutbox(subject=subject, message=message, recipient=recipient)
+        for recipient in recipient_list if recipient
+    ])
+
+
+def retry_email_later(email, error, now):
+    email.last_error = str(error)
+    if email.attempts >= EMAIL_MAX_ATTEMPTS:
+        email.status = 'failed'
+    else:
+        email.status = 'pending'
+        email.next_attempt_date = now + timedelta(seconds=EMAIL_RETRY_DELAY * 2 ** (email.attempts - 1))
+
+
+# Nhận một lô email đến hạn trong một transaction ngắn: đánh dấu 'sending' kèm hạn giữ (next_attempt_date)
+# và tính luôn lần thử. Email 'sending' đã quá hạn (worker trước dừng giữa chừng) được nhận lại.
+def claim_queued_emails(batch_size, now):
+    with transaction.atomic():
+        ids = list(EmailOutbox.objects.select_for_update(skip_locked=True).filter(
+            status__in=('pending', 'sending'),
+            next_attempt_date__lte=now
+        ).order_by('next_attempt_date', 'id').values_list('id', flat=True)[:batch_size])
+        EmailOutbox.objects.filter(id__in=ids).update(
+            status='sending',
+            attempts=F('attempts') + 1,
+            next_attempt_date=now + timedelta(seconds=EMAIL_LEASE_SECONDS)
+        )
+    return list(EmailOutbox.objects.filter(id__in=ids).order_by('next_attempt_date', 'id'))
+
+
+# SMTP được gọi ngoài transaction nên không giữ khoá dòng trong lúc chờ máy chủ mail. Giao ít nhất một lần:
+# nếu worker dừng sau khi gửi mà chưa kịp ghi kết quả, email được gửi lại khi hết hạn giữ.
+def send_queued_emails(batch_size=50):
+    now = timezone.now()
+    emails = claim_queued_emails(batch_size, now)
+    if not emails:
+        return 0, 0
+
+    failed = 0
+    connection = get_connection()
+    try:
+        connection.open()
+        for email in emails:
+            try:
+                connection.send_messages([EmailMessage(email.subject, email.message, None, [email.recipient])])
+            except Exception as ex:
+                failed += 1
+                retry_email_later(email, ex, now)
+            else:
+                email.status = 'sent'
+                email.sent_date = timezone.now()
+    except Exception as ex:
+        # Không mở được kết nối SMTP: cả lô được thử lại sau
+        failed = len(emails)
+        for email in emails:
+            retry_email_later(email, ex, now)
+    finally:
+        connection.close()
+
+    EmailOutbox.objects.bulk_update(emails, ['status', 'next_attempt_date', 'sent_date', 'last_error'])
+    return len(emails) - failed, failed
 
 
 def send_book_appointment_success_email(appointment):
@@ -31,10 +191,10 @@ def send_book_appointment_success_email(appointment):
     Phòng khám Global Health
     """
     recipient_list = [appointment.patient.email]
-    send_mail(subject, message, None, recipient_list)
+    queue_email(subject, message, recipient_list)
 
 
-def send_confirm_appointment_success_email(appointment):
+def confirm_appointment_email(appointment):
     patient_name = appointment.patient.fullname
     doctor_name = appointment.doctor.fullname
     nurse_name = appointment.nurse.fullname
@@ -60,11 +220,14 @@ def send_confirm_appointment_success_email(appointment):
 
     Phòng khám Global Health
     """
-    recipient_list = [appointment.patient.email]
-    send_mail(subject, message, None, recipient_list)
+    return subject, message, [appointment.patient.email]
 
 
-def send_cancel_appointment_success_email(appointment):
+def send_confirm_appointment_success_email(appointment):
+    queue_email(*confirm_appointment_email(appointment))
+
+
+def cancel_appointment_email(appointment):
     patient_name = appointment.patient.fullname
     doctor_name = appointment.doctor.fullname
     date = appointment.date.strftime('%d/%m/%Y')
@@ -89,5 +252,8 @@ def send_cancel_appointment_success_email(appointment):
 
     Phòng khám Global Health
     """
-    recipient_list = [appointment.patient.email]
-    send_mail(subject, message, None, recipient_list)
\ No newline at end of file
+    return subject, message, [appointment.patient.email]
+
+
+def send_cancel_appointment_success_email(appointment):
+    queue_email(*cancel_appointment_email(appointment))
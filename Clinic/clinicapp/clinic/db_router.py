@@ -0,0 +1,118 @@
+import contextvars
+import hashlib
+import random
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Token OAuth2 vừa cấp và session vừa tạo phải đọc được ngay ở request kế tiếp nên luôn đọc từ primary
+PRIMARY_ONLY_APPS = {'oauth2_provider', 'sessions'}
+
+_state = contextvars.ContextVar('clinic_db_routing', default=None)
+
+
+# Trạng thái định tuyến của request hiện tại: replica được chọn một lần cho cả request,
+# sau lần ghi đầu tiên mọi lần đọc tiếp theo trong request đều về primary
+class RoutingState:
+    __slots__ = ('replica', 'wrote')
+
+    def __init__(self, replica=None):
+        self.replica = replica
+        self.wrote = False
+
+
+# Dữ liệu đưa vào cache dùng chung (danh mục bác sĩ, ...) phải đọc từ primary: bản dựng từ replica đang trễ
+# sẽ được phục vụ tới lần invalidate kế tiếp, mà lần invalidate của thay đổi đó có thể đã chạy rồi
+@contextmanager
+def read_from_primary():
+    token = _state.set(None)
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+        # Đọc trong transaction (select_for_update, kiểm tra rồi ghi) phải thấy đúng dữ liệu của primary
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replica là bản sao của primary nên object đọc từ replica được gắn với object của primary
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+# Client được nhận diện theo access token hoặc session (middleware chạy trước khi DRF xác thực user)
+def client_key(request):
+    credential = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credential:
+        return None
+    return f'db:sticky:{hashlib.sha256(credential.encode()).hexdigest()}'
+
+
+# Request đọc (GET/HEAD/OPTIONS) được đọc từ một replica trong DATABASE_REPLICAS. Client vừa ghi thì các request
+# của client đó đọc từ primary thêm REPLICA_STICKY_SECONDS giây để thấy ngay dữ liệu mình vừa ghi dù replica trễ.
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        key, state = self.start(request)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        self.finish(key, state)
+        return response
+
+    async def __acall__(self, request):
+        key, state = await sync_to_async(self.start)(request)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        await sync_to_async(self.finish)(key, state)
+        return response
+
+    def start(self, request):
+        key = client_key(request)
+        replica = None
+        if settings.DATABASE_REPLICAS and request.method in SAFE_METHODS and not (key and cache.get(key)):
+            replica = random.choice(settings.DATABASE_REPLICAS)
+        return key, RoutingState(replica)
+
+    def finish(self, key, state):
+        if state.wrote and key and settings.DATABASE_REPLICAS:
+            cache.set(key, True, settings.REPLICA_STICKY_SECONDS)
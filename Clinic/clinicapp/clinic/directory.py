@@ -0,0 +1,91 @@
+import hashlib
+import json
+import time as _time
+
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .db_router import read_from_primary
+
+DIRECTORY_CACHE_TIMEOUT = 60 * 60
+
+_VERSION_KEY = 'directory:doctors:version'
+
+
+# Phiên bản là thời điểm (ns) của lần sửa bác sĩ gần nhất, dùng luôn làm Last-Modified
+def get_version():
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        version = _time.time_ns()
+        if not cache.add(_VERSION_KEY, version, None):
+            version = cache.get(_VERSION_KEY, version)
+    return version
+
+
+async def aget_version():
+    version = await cache.aget(_VERSION_KEY)
+    if version is None:
+        version = _time.time_ns()
+        if not await cache.aadd(_VERSION_KEY, version, None):
+            version = await cache.aget(_VERSION_KEY, version)
+    return version
+
+
+def invalidate_directory():
+    cache.set(_VERSION_KEY, _time.time_ns(), None)
+
+
+def make_etag(data):
+    content = json.dumps(data, cls=JSONEncoder, sort_keys=True, ensure_ascii=False)
+    return f'"{hashlib.md5(content.encode()).hexdigest()}"'
+
+
+def make_cache_key(version, key):
+    return f'directory:{version}:{hashlib.md5(key.encode()).hexdigest()}'
+
+
+def conditional_response(request, version, cached, response_class=Response):
+    etag, data = cached
+    last_modified = version // 1_000_000_000
+
+    response = response_class(data)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return get_conditional_response(request, etag=etag, last_modified=last_modified, response=response) or response
+
+
+def json_response(data):
+    return JsonResponse(data, encoder=JSONEncoder, safe=False)
+
+
+# Trả response từ cache (kèm ETag/Last-Modified), chỉ gọi build() để truy vấn DB khi cache trống.
+# Client gửi lại If-None-Match / If-Modified-Since sẽ nhận 304 không có nội dung.
+# build() luôn đọc từ primary để không cache bản dựng từ replica đang trễ.
+def cached_response(request, key, build):
+    version = get_version()
+    cache_key = make_cache_key(version, key)
+    cached = cache.get(cache_key)
+    if cached is None:
+        with read_from_primary():
+            data = build()
+        cached = (make_etag(data), data)
+        cache.set(cache_key, cached, DIRECTORY_CACHE_TIMEOUT)
+    return conditional_response(request, version, cached)
+
+
+# Như cached_response cho view async: build là coroutine function, trả JsonResponse thay cho Response của DRF
+async def acached_response(request, key, build):
+    version = await aget_version()
+    cache_key = make_cache_key(version, key)
+    cached = await cache.aget(cache_key)
+    if cached is None:
+        with read_from_primary():
+            data = await build()
+        cached = (make_etag(data), data)
+        await cache.aset(cache_key, cached, DIRECTORY_CACHE_TIMEOUT)
+    return conditional_response(request, version, cached, json_response)
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import secrets
+import threading
+from abc import ABC, abstractmethod
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+NURSES_CHANNEL = 'nurses'
+SUBSCRIBER_QUEUE_SIZE = 100
+STREAM_TICKET_SECONDS = 30
+
+
+def doctor_channel(doctor_id):
+    return f'doctor:{doctor_id}'
+
+
+# Broker phát sự kiện cho các kết nối đang mở. publish() có thể được gọi từ thread bất kỳ
+# (signal chạy trong code đồng bộ), subscribe() chạy trong event loop của view bất đồng bộ.
+class Broker(ABC):
+    @abstractmethod
+    def publish(self, channels, event):
+        pass
+
+    @abstractmethod
+    def subscribe(self, channels):
+        pass
+
+    @abstractmethod
+    def unsubscribe(self, subscription):
+        pass
+
+
+class Subscription:
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = set(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.overflowed = False
+
+    def deliver(self, event):
+        if self.overflowed:
+            return
+        if self.queue.qsize() >= SUBSCRIBER_QUEUE_SIZE:
+            # Client đọc quá chậm: đóng luồng để client kết nối lại và tải lại danh sách
+            self.overflowed = True
+            event = None
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout):
+        event = await asyncio.wait_for(self.queue.get(), timeout)
+        if event is None:
+            raise ConnectionResetError('Subscriber is too slow')
+        return event
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+# Broker trong process: chỉ phục vụ các kết nối tới cùng process (một worker ASGI).
+# Khi chạy nhiều worker, thay bằng broker dùng chung (Redis pub/sub, ...) qua setting EVENT_BROKER.
+class LocalBroker(Broker):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+
+    def publish(self, channels, event):
+        channels = set(channels)
+        with self.lock:
+            targets = [subscription for subscription in self.subscriptions if subscription.channels & channels]
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # Event loop đã đóng
+                self.unsubscribe(subscription)
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels)
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+
+# EventSource không gửi được header Authorization nên client đổi access token lấy một vé ngắn hạn
+# rồi mở luồng với ?ticket=, access token không nằm trong URL (log của proxy/server).
+# Vé chỉ dùng được một lần: cache.delete() chỉ trả True cho một trong các request dùng cùng vé.
+def _ticket_key(ticket):
+    return f'events:ticket:{ticket}'
+
+
+def issue_stream_ticket(user_id):
+    ticket = secrets.token_urlsafe(32)
+    cache.set(_ticket_key(ticket), user_id, STREAM_TICKET_SECONDS)
+    return ticket
+
+
+def consume_stream_ticket(ticket):
+    user_id = cache.get(_ticket_key(ticket))
+    if user_id is None or not cache.delete(_ticket_key(ticket)):
+        return None
+    return user_id
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.EVENT_BROKER)()
+    return _broker
+
+
+def appointment_event(appointment, event_type, previous_status=None):
+    return {
+        'type': event_type,
+        'previous_status': previous_status,
+        'appointment': {
+            'id': appointment.id,
+            'patient': appointment.patient_id,
+            'doctor': appointment.doctor_id,
+            'nurse': appointment.nurse_id,
+            'date': appointment.date,
+            'time': appointment.time,
+            'status': appointment.status,
+        },
+    }
+
+
+# Y tá nhận mọi sự kiện lịch hẹn, bác sĩ chỉ nhận sự kiện của lịch hẹn của mình.
+# Sự kiện được dựng ngay nhưng chỉ phát sau khi transaction commit.
+def publish_appointment_event(appointment, event_type, previous_status=None):
+    channels = [NURSES_CHANNEL]
+    if appointment.doctor_id:
+        channels.append(doctor_channel(appointment.doctor_id))
+    event = json.dumps(appointment_event(appointment, event_type, previous_status), cls=DjangoJSONEncoder)
+    transaction.on_commit(partial(get_broker().publish, channels, event))
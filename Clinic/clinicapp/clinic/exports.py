@@ -0,0 +1,191 @@
+import csv
+import zipfile
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+from . import archive
+from .models import Appointment, Invoice, ArchivedAppointment, ArchivedInvoice
+
+EXPORT_CHUNK_SIZE = 2000
+
+INVOICE_COLUMNS = [
+    ('Mã hoá đơn', 'id'),
+    ('Ngày tạo', 'created_date'),
+    ('Mã lịch hẹn', 'appointment_id'),
+    ('Ngày khám', 'appointment__date'),
+    ('Bệnh nhân', 'patient__fullname'),
+    ('Email bệnh nhân', 'patient__email'),
+    ('Người lập', 'created_by__fullname'),
+    ('Chi phí ra toa', 'prescription_cost'),
+    ('Chi phí khám', 'examination_cost'),
+    ('Tổng tiền', 'total'),
+    ('Hình thức thanh toán', 'payment_method'),
+    ('Ngày thanh toán', 'payment_date'),
+    ('Trạng thái', 'status'),
+    ('Ghi chú', 'note'),
+]
+
+APPOINTMENT_COLUMNS = [
+    ('Mã lịch hẹn', 'id'),
+    ('Ngày khám', 'date'),
+    ('Giờ khám', 'time'),
+    ('Bệnh nhân', 'patient__fullname'),
+    ('Email bệnh nhân', 'patient__email'),
+    ('Bác sĩ', 'doctor__fullname'),
+    ('Chuyên khoa', 'doctor__doctor__speciality'),
+    ('Y tá', 'nurse__fullname'),
+    ('Trạng thái', 'status'),
+    ('Lý do huỷ', 'cancellation_reason'),
+]
+
+
+# Khoảng thời gian cũ hơn mốc lưu trữ thì đọc cả bảng lưu trữ (xem archive.py)
+def invoice_queryset(from_date, to_date):
+    start = timezone.make_aware(datetime.combine(from_date, time.min))
+    end = timezone.make_aware(datetime.combine(to_date + timedelta(days=1), time.min))
+    queryset = Invoice.objects.filter(active=True, created_date__gte=start, created_date__lt=end)
+    if from_date < archive.get_cutoff():
+        queryset = archive.union(queryset, ArchivedInvoice.objects.filter(active=True, created_date__gte=start,
+                                                                          created_date__lt=end))
+    return queryset
+
+
+def appointment_queryset(from_date, to_date):
+    queryset = Appointment.objects.filter(date__range=(from_date, to_date))
+    if from_date < archive.get_cutoff():
+        queryset = archive.union(queryset, ArchivedAppointment.objects.filter(date__range=(from_date, to_date)))
+    return queryset
+
+
+# Đọc theo từng lô khoá chính tăng dần: bộ nhớ không phụ thuộc số dòng kể cả trên MySQL,
+# nơi con trỏ mặc định của mysqlclient nạp toàn bộ kết quả vào bộ nhớ
+def iterate_rows(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    last_pk = None
+    while True:
+        batch = queryset.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        rows = list(batch.values_list('pk', *fields)[:chunk_size])
+        for row in rows:
+            yield row[1:]
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1][0]
+
+
+def format_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        value = timezone.localtime(value) if timezone.is_aware(value) else value
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def stream_csv(queryset, columns):
+    writer = csv.writer(Echo())
+    # BOM để Excel nhận đúng tiếng Việt
+    yield '﻿' + writer.writerow([title for title, field in columns])
+    for row in iterate_rows(queryset, [field for title, field in columns]):
+        yield writer.writerow([format_value(value) for value in row])
+
+
+class ChunkBuffer:
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def xlsx_row(values):
+    cells = []
+    for value in values:
+        value = format_value(value)
+        if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+            cells.append(f'<c><v>{value}</v></c>')
+        else:
+            cells.append(f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>')
+    return f'<row>{"".join(cells)}</row>'
+
+
+# Ghi file zip thẳng vào luồng không seek được: mỗi lô dòng được nén và gửi đi ngay
+def stream_xlsx(queryset, columns, chunk_size=EXPORT_CHUNK_SIZE):
+    buffer = ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        yield buffer.pop()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + xlsx_row([title for title, field in columns])
+            ).encode())
+            lines = []
+            for row in iterate_rows(queryset, [field for title, field in columns], chunk_size):
+                lines.append(xlsx_row(row))
+                if len(lines) >= chunk_size:
+                    sheet.write(''.join(lines).encode())
+                    lines = []
+                    data = buffer.pop()
+                    if data:
+                        yield data
+            sheet.write((''.join(lines) + '</sheetData></worksheet>').encode())
+    yield buffer.pop()
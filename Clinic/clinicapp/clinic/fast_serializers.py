@@ -0,0 +1,84 @@
+from rest_framework import serializers
+
+from . import metrics
+
+from .serializers import (
+    MyUserListSerializer, DoctorListSerializer,
+    AppointmentListSerializer, PrescriptionListSerializer, InvoiceListSerializer
+)
+
+
+# Đường đọc nhanh cho danh sách chỉ đọc: lấy dữ liệu bằng .values() (không dựng model instance)
+# và chuyển từng cột bằng to_representation của field DRF tương ứng. Các field được duyệt một lần
+# từ serializer gốc nên JSON trả về giống hệt serializer gốc.
+class FastListSerializer:
+    def __init__(self, serializer_class, custom_fields=None):
+        self.serializer_class = serializer_class
+        self.custom_fields = custom_fields or {}
+        self.lookups, self.build = self.compile(serializer_class(), '')
+
+    def compile(self, serializer, prefix):
+        lookups = []
+        readers = []
+        for field in serializer._readable_fields:
+            name = field.field_name
+            source = prefix + field.source.replace('.', '__')
+            if prefix == '' and name in self.custom_fields:
+                field_lookups, read = self.custom_fields[name]
+                lookups += field_lookups
+            elif isinstance(field, serializers.ModelSerializer):
+                nested_lookups, nested_build = self.compile(field, source + '__')
+                lookups += nested_lookups
+                read = nullable(source + '__pk', nested_build, whole_row=True)
+            elif isinstance(field, serializers.RelatedField):
+                # values() trả về khoá chính của quan hệ, đúng với PrimaryKeyRelatedField
+                lookups.append(source)
+                read = nullable(source, None)
+            elif not isinstance(field, serializers.SerializerMethodField):
+                lookups.append(source)
+                read = nullable(source, field.to_representation)
+            else:
+                raise TypeError(f'{serializer.__class__.__name__}.{name} needs a custom fast field')
+            readers.append((name, read))
+        if prefix:
+            lookups.append(prefix + 'pk')
+
+        def build(row):
+            return {name: read(row) for name, read in readers}
+
+        return list(dict.fromkeys(lookups)), build
+
+    def get_queryset(self, queryset, *extra_lookups):
+        return queryset.values(*dict.fromkeys([*self.lookups, *extra_lookups]))
+
+    def serialize(self, rows):
+        build = self.build
+        rows = list(rows)  # truy vấn được tính vào thời gian DB, không vào thời gian serialize
+        with metrics.timer('serializer_time'):
+            return [build(row) for row in rows]
+
+
+def nullable(key, convert, whole_row=False):
+    def read(row):
+        value = row[key]
+        if value is None or convert is None:
+            return value
+        return convert(row if whole_row else value)
+    return read
+
+
+def doctor_user(row):
+    return {
+        'id': row['user__id'],
+        'fullname': row['user__fullname'],
+        'avatar': row['user__avatar_list_url'] or row['user__avatar_url']
+    }
+
+
+fast_user_list = FastListSerializer(MyUserListSerializer)
+fast_doctor_list = FastListSerializer(DoctorListSerializer, custom_fields={
+    'user': (['user__id', 'user__fullname', 'user__avatar_list_url', 'user__avatar_url'], doctor_user)
+})
+fast_appointment_list = FastListSerializer(AppointmentListSerializer)
+fast_prescription_list = FastListSerializer(PrescriptionListSerializer)
+fast_invoice_list = FastListSerializer(InvoiceListSerializer)
@@ -0,0 +1,38 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from clinic.archive import ARCHIVE_BATCH_SIZE, archive_batch, get_cutoff
+
+
+# Chuyển lịch hẹn đã đóng (kèm đơn thuốc, hoá đơn) cũ hơn ARCHIVE_AFTER_DAYS sang bảng lưu trữ theo từng lô.
+# Có thể dừng bất cứ lúc nào, lần chạy sau tiếp tục với phần còn lại. Chạy định kỳ, vd. mỗi đêm:
+#   python manage.py archive_appointments --sleep 0.5
+class Command(BaseCommand):
+    help = 'Chuyển lịch hẹn đã đóng, đơn thuốc và hoá đơn cũ sang bảng lưu trữ theo từng lô'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, help='Số ngày, mặc định theo ARCHIVE_AFTER_DAYS')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int, help='Dừng sau số lô này')
+        parser.add_argument('--sleep', type=float, default=0, help='Số giây nghỉ giữa các lô để giảm tải DB')
+
+    def handle(self, *args, **options):
+        if options['older_than'] is not None:
+            cutoff = timezone.localdate() - timedelta(days=options['older_than'])
+        else:
+            cutoff = get_cutoff()
+
+        batches = total = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            archived = archive_batch(cutoff, options['batch_size'])
+            if not archived:
+                break
+            batches += 1
+            total += archived
+            self.stdout.write(f'Archived {total} appointments')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} appointments before {cutoff} in {batches} batches'))
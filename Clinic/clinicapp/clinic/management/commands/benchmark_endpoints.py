@@ -0,0 +1,128 @@
+import math
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from clinic import slots
+from clinic.dao import get_fully_booked_dates
+from clinic.models import MyUser, Doctor, Appointment, Medicine
+
+
+class Rollback(Exception):
+    pass
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+# Gọi lặp lại các endpoint chính qua toàn bộ middleware/view/serializer trên dữ liệu hiện có
+# (vd. sinh bằng generate_data) và báo cáo độ trễ p50/p99 cùng số truy vấn mỗi request:
+#   python manage.py generate_data --scale 0.1 && python manage.py benchmark_endpoints --repeat 200
+# Chạy được trên SQLite hoặc MySQL tuỳ DATABASES. Endpoint ghi (đặt lịch) chạy trong transaction
+# bị rollback nên dữ liệu không thay đổi giữa các lần chạy.
+class Command(BaseCommand):
+    help = 'Đo độ trễ (p50/p99) và số truy vấn của các endpoint chính trên dữ liệu hiện có'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--only', nargs='+', help='Chỉ chạy các endpoint có tên trong danh sách')
+        parser.add_argument('--cold', action='store_true', help='Xoá cache trước mỗi request')
+
+    def handle(self, *args, **options):
+        users = {role: MyUser.objects.filter(groups__name=role, is_active=True).order_by('id').first()
+                 for role in ('admin', 'nurse', 'patient')}
+        doctor = Doctor.objects.filter(user__doctor_appointments__date__gte=timezone.localdate()) \
+            .order_by('id').first()
+        medicine = Medicine.objects.filter(active=True).order_by('id').first()
+        if not all(users.values()) or doctor is None or medicine is None:
+            raise CommandError('Not enough data to benchmark, run generate_data first')
+        # Bệnh nhân có lịch hẹn gần nhất để các danh sách của bệnh nhân không rỗng
+        latest = Appointment.objects.order_by('-id').values_list('patient_id', flat=True).first()
+        users['patient'] = MyUser.objects.get(pk=latest)
+
+        today = timezone.localdate()
+        slot = self.find_free_slot(doctor.user_id, today + timedelta(days=1), today + timedelta(days=14))
+        day = (slot[0] if slot else today + timedelta(days=1)).isoformat()
+        keyword = medicine.name.split()[0][:4]
+        endpoints = [
+            ('doctors-list', 'admin', 'get', '/doctors/', None),
+            ('doctors-time-slots', 'patient', 'get', f'/doctors/{doctor.pk}/time-slots/?date={day}', None),
+            ('doctors-available-slots', 'patient', 'get',
+             f'/doctors/available-slots/?speciality={doctor.speciality}&from_date={today.isoformat()}', None),
+            ('medicines-find', 'patient', 'get', f'/medicines/find/?kw={keyword}', None),
+            ('users-list', 'admin', 'get', '/users/', None),
+            ('users-appointments (patient)', 'patient', 'get', '/users/appointments/', None),
+            ('users-appointments (nurse)', 'nurse', 'get', '/users/appointments/?status=pending_confirmation', None),
+            ('users-prescriptions', 'patient', 'get', '/users/prescriptions/', None),
+            ('users-invoices', 'patient', 'get', '/users/invoices/', None),
+        ]
+        if slot:
+            endpoints.append(('appointments-create', 'patient', 'post', '/appointments/', {
+                'doctor': doctor.user_id, 'date': slot[0].isoformat(), 'time': slot[1], 'description': 'Benchmark'
+            }))
+        else:
+            self.stdout.write(self.style.WARNING('No free slot in the next 14 days, skipping appointments-create'))
+        if options['only']:
+            endpoints = [endpoint for endpoint in endpoints if endpoint[0] in options['only']]
+
+        # REMOTE_ADDR khác INTERNAL_IPS để debug toolbar không tham gia vào phép đo
+        client = APIClient(REMOTE_ADDR='10.0.0.1')
+        self.stdout.write(f'{connection.vendor}: {Appointment.objects.count()} appointments, '
+                          f'{options["repeat"]} requests per endpoint')
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name, role, method, url, data in endpoints:
+                client.force_authenticate(users[role])
+                for i in range(options['warmup']):
+                    self.call(client, method, url, data, options['cold'])
+                elapsed = []
+                queries = []
+                for i in range(options['repeat']):
+                    duration, count, response = self.call(client, method, url, data, options['cold'])
+                    if response.status_code >= 400:
+                        raise CommandError(f'{name}: {response.status_code} {response.content[:200]!r}')
+                    elapsed.append(duration)
+                    queries.append(count)
+                self.stdout.write(self.style.SUCCESS(
+                    f'{name}: p50 {percentile(elapsed, 50) * 1000:.2f} ms, p99 {percentile(elapsed, 99) * 1000:.2f} ms, '
+                    f'queries avg {sum(queries) / len(queries):.1f} max {max(queries)}'
+                ))
+
+    def call(self, client, method, url, data, cold):
+        if cold:
+            cache.clear()
+        if method == 'get':
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = client.get(url)
+                duration = time.perf_counter() - start
+            return duration, len(context.captured_queries), response
+
+        # Ghi trong transaction rồi rollback: khung giờ vẫn trống cho lần gọi sau, on_commit không chạy
+        try:
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as context:
+                    start = time.perf_counter()
+                    response = client.post(url, data, format='json')
+                    duration = time.perf_counter() - start
+                raise Rollback
+        except Rollback:
+            pass
+        return duration, len(context.captured_queries), response
+
+    def find_free_slot(self, doctor_id, from_date, to_date):
+        results = slots.find_earliest([doctor_id], from_date, to_date, limit=1,
+                                      skip_dates=get_fully_booked_dates(from_date, to_date))
+        if not results:
+            return None
+        day, slot_time, doctor_id = results[0]
+        return day, slot_time
@@ -0,0 +1,119 @@
+import random
+import time
+from datetime import date, time as dt_time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+
+from clinic.models import MyUser, Appointment, DailyAppointmentCount, ShiftCalendar, Prescription, Invoice
+
+
+# Đo kế hoạch thực thi và thời gian của các truy vấn nóng.
+# Chạy một lần trước khi migrate 0019_hot_query_indexes và một lần sau để so sánh:
+#   python manage.py migrate clinic 0018 && python manage.py benchmark_queries
+#   python manage.py migrate clinic && python manage.py benchmark_queries
+class Command(BaseCommand):
+    help = 'Hiển thị EXPLAIN và thời gian trung bình của các truy vấn nóng trên dữ liệu hiện có'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--no-explain', action='store_true')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Sinh thêm N lịch hẹn giả lập (dùng bulk insert) trước khi đo')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed_appointments(options['seed'])
+
+        sample = Appointment.objects.exclude(doctor=None).order_by('-id').first()
+        if sample is None:
+            raise CommandError('No appointments to benchmark, use --seed N first')
+        doctor_id, patient_id, day = sample.doctor_id, sample.patient_id, sample.date
+
+        queries = {
+            'time_slots booked': Appointment.objects.filter(
+                doctor_id__in=[doctor_id], date__range=(day, day), status__in=Appointment.active_statuses
+            ).values_list('doctor_id', 'date', 'time'),
+            'shift calendar for day': ShiftCalendar.objects.filter(
+                employee_id__in=[doctor_id], date=day
+            ).values_list('employee_id', 'date', 'shift__start_time', 'shift__end_time'),
+            'staff on duty for day': ShiftCalendar.objects.filter(date=day).values_list('shift_id', 'employee_id'),
+            'nurse pending page': Appointment.objects.filter(
+                status='pending_confirmation'
+            ).order_by('-date', '-time', '-id')[:5],
+            'patient appointments page': Appointment.objects.filter(
+                patient_id=patient_id
+            ).order_by('-date', '-time', '-id')[:5],
+            'doctor appointments on date': Appointment.objects.filter(
+                doctor_id=doctor_id, date=day
+            ).order_by('-date', '-time', '-id')[:5],
+            'appointments on date': Appointment.objects.filter(date=day).order_by('-date', '-time', '-id')[:5],
+            'patient invoices by status': Invoice.objects.filter(
+                patient_id=patient_id, status='pending'
+            ).order_by('-created_date', '-id')[:5],
+            'patient prescriptions page': Prescription.objects.filter(
+                patient_id=patient_id
+            ).order_by('-created_date', '-id')[:5],
+            'prescription of appointment': Prescription.objects.filter(appointment_id=sample.id),
+        }
+
+        self.stdout.write(f'{connection.vendor}: {Appointment.objects.count()} appointments\n')
+        for name, queryset in queries.items():
+            elapsed = []
+            for i in range(options['repeat']):
+                start = time.perf_counter()
+                list(queryset.all())
+                elapsed.append(time.perf_counter() - start)
+            elapsed.sort()
+            self.stdout.write(self.style.SUCCESS(
+                f'{name}: avg {sum(elapsed) / len(elapsed) * 1000:.2f} ms, '
+                f'p50 {elapsed[len(elapsed) // 2] * 1000:.2f} ms'
+            ))
+            if not options['no_explain']:
+                self.stdout.write(queryset.explain())
+                self.stdout.write('')
+
+    def seed_appointments(self, count):
+        doctors = list(MyUser.objects.filter(role='doctor').values_list('id', flat=True))
+        patients = list(MyUser.objects.filter(role='patient').values_list('id', flat=True))
+        if not doctors or not patients:
+            raise CommandError('Seeding needs at least one doctor and one patient')
+
+        statuses = [choice for choice, label in Appointment.status_choices]
+        slots = [dt_time(hour, minute) for hour in range(7, 17) for minute in (0, 30)]
+        batch = []
+        earliest = Appointment.objects.order_by('date').values_list('date', flat=True).first()
+        day = (earliest or date.today()) - timedelta(days=1)
+        first_day = day
+        created = 0
+        while created < count:
+            # Mỗi (bác sĩ, ngày, giờ) chỉ dùng một lần để không vi phạm ràng buộc khung giờ
+            for doctor_id in doctors:
+                for slot in slots:
+                    status = random.choice(statuses)
+                    batch.append(Appointment(
+                        patient_id=random.choice(patients),
+                        doctor_id=doctor_id,
+                        date=day,
+                        time=slot,
+                        status=status,
+                        holds_slot=True if status in Appointment.active_statuses else None
+                    ))
+                    created += 1
+                    if created >= count:
+                        break
+                if created >= count:
+                    break
+            if len(batch) >= 5000 or created >= count:
+                Appointment.objects.bulk_create(batch, batch_size=5000)
+                batch = []
+            day -= timedelta(days=1)
+
+        totals = Appointment.objects.filter(date__range=(day, first_day)).exclude(status='cancelled') \
+            .values('date').annotate(total=Count('id'))
+        DailyAppointmentCount.objects.bulk_create(
+            [DailyAppointmentCount(date=row['date'], total=row['total']) for row in totals],
+            ignore_conflicts=True
+        )
+        self.stdout.write(f'Seeded {count} appointments')
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from clinic.fast_serializers import (
+    fast_user_list, fast_doctor_list, fast_appointment_list, fast_prescription_list, fast_invoice_list
+)
+from clinic.models import MyUser, Doctor, Appointment, Prescription, Invoice
+
+
+# So sánh serializer DRF với đường nhanh (fast_serializers) trên cùng dữ liệu hiện có:
+#   python manage.py benchmark_serializers --sizes 10 100 1000
+class Command(BaseCommand):
+    help = 'Đo thời gian serialize các danh sách bằng serializer DRF và bằng đường nhanh .values()'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        cases = {
+            'users': (fast_user_list, MyUser.objects.order_by('id')),
+            'doctors': (fast_doctor_list, Doctor.objects.select_related('user').order_by('id')),
+            'appointments': (fast_appointment_list,
+                             Appointment.objects.select_related('patient', 'doctor').order_by('-date', '-time', '-id')),
+            'prescriptions': (fast_prescription_list,
+                              Prescription.objects.select_related('patient', 'doctor').order_by('-created_date', '-id')),
+            'invoices': (fast_invoice_list,
+                         Invoice.objects.select_related('patient', 'created_by').order_by('-created_date', '-id')),
+        }
+
+        for name, (fast_serializer, queryset) in cases.items():
+            for size in options['sizes']:
+                page = queryset[:size]
+                rows = len(page)
+                if not rows:
+                    raise CommandError(f'No {name} to benchmark, seed data first (e.g. benchmark_queries --seed N)')
+
+                # Gồm cả truy vấn + serialize + render JSON, giống những gì một request phải làm
+                drf = self.measure(lambda: JSONRenderer().render(
+                    fast_serializer.serializer_class(list(page.all()), many=True).data
+                ), options['repeat'])
+                fast = self.measure(lambda: JSONRenderer().render(
+                    fast_serializer.serialize(fast_serializer.get_queryset(page.all()))
+                ), options['repeat'])
+                self.stdout.write(self.style.SUCCESS(
+                    f'{name} x{rows}: drf {drf * 1000:.2f} ms, fast {fast * 1000:.2f} ms, '
+                    f'speedup {drf / fast:.1f}x'
+                ))
+
+    def measure(self, func, repeat):
+        elapsed = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed.append(time.perf_counter() - start)
+        elapsed.sort()
+        return elapsed[len(elapsed) // 2]
@@ -0,0 +1,375 @@
+import random
+from collections import Counter, defaultdict
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from clinic import slots, stats
+from clinic.directory import invalidate_directory
+from clinic.models import (
+    MyUser, Doctor, Shift, WorkSchedule, ShiftCalendar, Appointment, Medicine, Prescription, PrescriptionDetail, Invoice,
+    DailyAppointmentCount, DailyAppointmentStat, DailyRevenueStat, DailyPatientStat
+)
+from clinic.search import invalidate_medicine_index
+
+# Số lượng ở scale 1; --scale nhân tất cả (tối thiểu 1 mỗi loại)
+BASE_COUNTS = {
+    'admin': 2,
+    'nurse': 40,
+    'doctor': 140,  # 10 bác sĩ cho mỗi chuyên khoa
+    'patient': 50000,
+    'medicine': 400,
+    'appointment': 1000000,
+}
+
+SHIFTS = [(dt_time(7), dt_time(11)), (dt_time(13), dt_time(17))]
+SCHEDULE_DAYS = 28  # mỗi lịch làm việc kéo dài 4 tuần
+BOTH_SHIFTS_RATE = 0.4  # tỉ lệ nhân viên làm cả hai ca, còn lại làm một ca
+FUTURE_DAYS = 14
+PAST_FILL_RATE = 0.7  # tỉ lệ khung giờ có lịch hẹn trong quá khứ
+# Các ngày sắp tới chỉ lấp một phần giới hạn MAX_APPOINTMENT_PER_DAY để vẫn còn chỗ đặt lịch khi benchmark.
+# Lịch sử thì không theo giới hạn này (giới hạn chỉ áp dụng khi đặt lịch) để đạt được số lượng lớn.
+FUTURE_FILL_RATE = 0.6
+EXAMINATION_COST = Decimal('150000')
+
+FAMILY_NAMES = ['Nguyễn', 'Trần', 'Lê', 'Phạm', 'Hoàng', 'Huỳnh', 'Phan', 'Vũ', 'Võ', 'Đặng', 'Bùi', 'Đỗ', 'Hồ', 'Ngô']
+MIDDLE_NAMES = ['Văn', 'Thị', 'Hữu', 'Minh', 'Ngọc', 'Thanh', 'Quốc', 'Gia', 'Đức', 'Thu', 'Hoài', 'Xuân']
+GIVEN_NAMES = ['An', 'Bình', 'Châu', 'Dũng', 'Giang', 'Hà', 'Hải', 'Hạnh', 'Hùng', 'Khoa', 'Lan', 'Linh', 'Long',
+               'Mai', 'Nam', 'Nga', 'Phúc', 'Quân', 'Quỳnh', 'Sơn', 'Tâm', 'Thảo', 'Trang', 'Tuấn', 'Vy', 'Yến']
+MEDICINE_NAMES = ['Paracetamol', 'Amoxicillin', 'Ibuprofen', 'Cefuroxim', 'Omeprazol', 'Loratadin', 'Metformin',
+                  'Amlodipin', 'Vitamin C', 'Salbutamol', 'Dexamethason', 'Azithromycin', 'Cetirizin', 'Domperidon',
+                  'Berberin', 'Smecta', 'Oresol', 'Acyclovir', 'Losartan', 'Atorvastatin']
+DIAGNOSES = ['Cảm cúm', 'Viêm họng', 'Viêm phế quản', 'Rối loạn tiêu hoá', 'Tăng huyết áp', 'Đau dạ dày',
+             'Viêm da dị ứng', 'Đau đầu', 'Viêm xoang', 'Đái tháo đường type 2']
+SYMPTOMS = ['Sốt, ho', 'Đau họng', 'Đau bụng', 'Mệt mỏi, chóng mặt', 'Nổi mẩn ngứa', 'Đau đầu kéo dài', None]
+
+
+# Cột của các bảng được ghi bằng insert_rows, theo đúng thứ tự của tuple dữ liệu
+COLUMNS = {
+    WorkSchedule: ['id', 'created_date', 'updated_date', 'active', 'employee', 'from_date', 'to_date'],
+    ShiftCalendar: ['employee', 'date', 'shift', 'work_schedule'],
+    Appointment: ['id', 'created_date', 'updated_date', 'active', 'patient', 'doctor', 'nurse', 'date', 'time',
+                  'description', 'cancellation_reason', 'status', 'holds_slot'],
+    Prescription: ['id', 'created_date', 'updated_date', 'active', 'appointment', 'patient', 'doctor', 'diagnosis',
+                   'days_supply', 'advice', 'follow_up_date', 'expiry_date'],
+    PrescriptionDetail: ['id', 'prescription', 'medicine', 'quantity', 'morning_dose', 'afternoon_dose',
+                         'evening_dose', 'note'],
+    Invoice: ['id', 'created_date', 'updated_date', 'active', 'appointment', 'patient', 'created_by', 'prescription',
+              'prescription_cost', 'examination_cost', 'total', 'payment_method', 'payment_date', 'status', 'note'],
+}
+
+
+def next_id(model):
+    return (model.objects.aggregate(value=Max('pk'))['value'] or 0) + 1
+
+
+# INSERT trực tiếp bằng executemany: không dựng model instance, không qua post_init/pre_save và giữ nguyên
+# created_date/updated_date giả lập (bulk_create sẽ ghi đè bằng auto_now)
+def insert_rows(model, names, rows, batch_size):
+    db = connections[DEFAULT_DB_ALIAS]  # lấy một lần, proxy `connection` tra cứu lại mỗi lần truy cập
+    fields = [model._meta.get_field(name) for name in names]
+    quote = db.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(model._meta.db_table), ', '.join(quote(field.column) for field in fields), ', '.join(['%s'] * len(fields))
+    )
+    with db.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(sql, [
+                [field.get_db_prep_save(value, db) for field, value in zip(fields, row)]
+                for row in rows[start:start + batch_size]
+            ])
+
+
+# Cộng dồn vào bảng đếm/thống kê: {(giá trị khoá, ...): {field: delta}}. Dòng đã có được cộng bằng
+# stats.increment, dòng mới được tạo bằng một bulk_create.
+def add_totals(model, key_fields, totals):
+    if not totals:
+        return
+    days = [key[0] for key in totals]
+    existing = set(model.objects.filter(date__range=(min(days), max(days))).values_list(*key_fields))
+    new_rows = []
+    for key, deltas in totals.items():
+        if key in existing:
+            stats.increment(model, dict(zip(key_fields, key)), **deltas)
+        else:
+            new_rows.append(model(**dict(zip(key_fields, key)), **deltas))
+    model.objects.bulk_create(new_rows, batch_size=1000)
+
+
+# Sinh dữ liệu giả lập có quy mô lớn bằng bulk insert (không qua signal), sau đó cập nhật các bảng
+# đếm/thống kê tương ứng. Khoá chính được gán trước nên chạy được trên cả SQLite lẫn MySQL:
+#   python manage.py generate_data --scale 0.01 --seed 42
+class Command(BaseCommand):
+    help = 'Sinh dữ liệu giả lập (người dùng, lịch làm việc, lịch hẹn, đơn thuốc, hoá đơn) theo scale và seed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--password', default='clinic123', help='Mật khẩu của mọi người dùng được sinh')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.counts = {name: max(1, round(count * options['scale'])) for name, count in BASE_COUNTS.items()}
+        self.prefix = f'gen{options["seed"]}_'
+        if MyUser.objects.filter(username__startswith=self.prefix).exists():
+            raise CommandError(f'Data for seed {options["seed"]} already exists, use another --seed')
+
+        self.now = timezone.now()
+        self.today = timezone.localdate()
+        self.create_users(options['password'])
+        self.create_medicines()
+        self.shifts = self.get_shifts()
+        self.create_calendar()
+        self.reset_sequences([MyUser, Doctor, Medicine, *COLUMNS])
+
+        # Bulk insert không qua signal nên làm mới các cache ở đây (kể cả bitmap khung giờ của bác sĩ)
+        invalidate_directory()
+        invalidate_medicine_index()
+        slots.invalidate(*self.users['doctor'])
+        self.stdout.write(self.style.SUCCESS(', '.join(f'{count} {name}s' for name, count in self.counts.items())))
+
+    def full_name(self):
+        return ' '.join([self.random.choice(FAMILY_NAMES), self.random.choice(MIDDLE_NAMES),
+                         self.random.choice(GIVEN_NAMES)])
+
+    def create_users(self, password):
+        password = make_password(password)
+        groups = {role: Group.objects.get_or_create(name=role)[0] for role in ('admin', 'doctor', 'nurse', 'patient')}
+        history_days = self.estimate_history_days()
+        user_id = next_id(MyUser)
+        self.users = {}
+        users = []
+        memberships = []
+        for role in ('admin', 'nurse', 'doctor', 'patient'):
+            self.users[role] = []
+            for i in range(self.counts[role]):
+                joined = self.now - timedelta(days=self.random.uniform(0, history_days + 30))
+                username = f'{self.prefix}{role}{i}'
+                users.append(MyUser(
+                    id=user_id, username=username, password=password, email=f'{username}@clinic.vn',
+                    fullname=self.full_name(), role=role, gender=self.random.choice(['male', 'female']),
+                    date_of_birth=self.today - timedelta(days=self.random.randint(18 * 365, 80 * 365)),
+                    phone_number=f'09{self.random.randint(0, 99999999):08d}', date_joined=joined,
+                    is_staff=role == 'admin', is_superuser=role == 'admin'
+                ))
+                memberships.append(MyUser.groups.through(myuser_id=user_id, group_id=groups[role].id))
+                self.users[role].append(user_id)
+                user_id += 1
+        self.doctors = set(self.users['doctor'])
+
+        with transaction.atomic():
+            MyUser.objects.bulk_create(users, batch_size=self.batch_size)
+            MyUser.groups.through.objects.bulk_create(memberships, batch_size=self.batch_size)
+            specialities = [choice for choice, label in Doctor.speciality_choices]
+            doctor_id = next_id(Doctor)
+            Doctor.objects.bulk_create([
+                Doctor(id=doctor_id + i, user_id=user, speciality=specialities[i % len(specialities)],
+                       description=f'Bác sĩ chuyên khoa {specialities[i % len(specialities)]}')
+                for i, user in enumerate(self.users['doctor'])
+            ], batch_size=self.batch_size)
+            patients = Counter((stats.local_date(user.date_joined),) for user in users if user.role == 'patient')
+            add_totals(DailyPatientStat, ['date'], {key: {'new_patients': total} for key, total in patients.items()})
+        self.stdout.write(f'Created {len(users)} users')
+
+    def create_medicines(self):
+        medicine_id = next_id(Medicine)
+        units = [choice for choice, label in Medicine.unit_choices]
+        medicines = []
+        for i in range(self.counts['medicine']):
+            name = f'{MEDICINE_NAMES[i % len(MEDICINE_NAMES)]} {(i // len(MEDICINE_NAMES) + 1) * 50}mg'
+            medicines.append(Medicine(id=medicine_id + i, name=name, unit=self.random.choice(units)))
+        Medicine.objects.bulk_create(medicines, batch_size=self.batch_size)
+        self.medicines = [medicine.id for medicine in medicines]
+
+    def get_shifts(self):
+        shifts = []
+        for start, end in SHIFTS:
+            shift = Shift.objects.filter(start_time=start, end_time=end, active=True).first()
+            shifts.append(shift or Shift.objects.create(start_time=start, end_time=end))
+        return shifts
+
+    def slot_times(self, shift_ids):
+        times = []
+        for shift in self.shifts:
+            if shift.id in shift_ids:
+                minute = shift.start_time.hour * 60 + shift.start_time.minute
+                end = shift.end_time.hour * 60 + shift.end_time.minute
+                while minute + 30 <= end:
+                    times.append(dt_time(minute // 60, minute % 60))
+                    minute += 30
+        return times
+
+    # Số ngày lịch sử (xấp xỉ) cần để đạt số lịch hẹn yêu cầu, dùng để rải ngày đăng ký của người dùng
+    def estimate_history_days(self):
+        slots_per_shift = sum((end.hour - start.hour) * 2 for start, end in SHIFTS) / len(SHIFTS)
+        shifts_per_day = BOTH_SHIFTS_RATE * len(SHIFTS) + (1 - BOTH_SHIFTS_RATE)
+        per_day = self.counts['doctor'] * slots_per_shift * shifts_per_day * PAST_FILL_RATE
+        return int(self.counts['appointment'] / per_day) + 1
+
+    def pick_shifts(self):
+        shift_ids = [shift.id for shift in self.shifts]
+        if self.random.random() < BOTH_SHIFTS_RATE:
+            return shift_ids
+        return [self.random.choice(shift_ids)]
+
+    # Đi lùi theo từng khối SCHEDULE_DAYS ngày bắt đầu từ FUTURE_DAYS ngày tới, mỗi khối sinh lịch làm việc
+    # rồi lịch hẹn trên các khung giờ làm việc cho tới khi đủ số lịch hẹn
+    def create_calendar(self):
+        self.ids = {model: next_id(model) for model in (WorkSchedule, Appointment, Prescription, PrescriptionDetail,
+                                                        Invoice)}
+        self.pending = {model: [] for model in (Appointment, Prescription, PrescriptionDetail, Invoice)}
+        self.appointment_stats = Counter()
+        self.day_counts = Counter()
+        self.revenue = defaultdict(Counter)
+        future_limit = int(settings.MAX_APPOINTMENT_PER_DAY * FUTURE_FILL_RATE)
+        existing = dict(DailyAppointmentCount.objects.filter(date__gte=self.today).values_list('date', 'total'))
+
+        created = 0
+        block_end = self.today + timedelta(days=FUTURE_DAYS)
+        while created < self.counts['appointment']:
+            block_start = block_end - timedelta(days=SCHEDULE_DAYS - 1)
+            calendars = self.create_schedules(block_start, block_end)
+            day = block_end
+            while day >= block_start and created < self.counts['appointment']:
+                candidates = [(doctor_id, slot_time) for doctor_id, times in calendars.items() for slot_time in times]
+                if day >= self.today:
+                    budget = max(0, future_limit - existing.get(day, 0))
+                    chosen = self.random.sample(candidates, min(budget, len(candidates)))
+                else:
+                    chosen = [candidate for candidate in candidates if self.random.random() < PAST_FILL_RATE]
+                for doctor_id, slot_time in chosen[:self.counts['appointment'] - created]:
+                    self.add_appointment(doctor_id, day, slot_time)
+                    created += 1
+                if len(self.pending[Appointment]) >= self.batch_size:
+                    self.flush()
+                    self.stdout.write(f'Created {created} appointments (back to {day})')
+                day -= timedelta(days=1)
+            block_end = block_start - timedelta(days=1)
+        self.flush()
+        self.update_counters()
+
+    def create_schedules(self, from_date, to_date):
+        calendars = {}
+        schedules = []
+        schedule_shifts = []
+        calendar_days = []  # insert trực tiếp không qua signal nên tự sinh lịch theo ngày như shift_calendar
+        days = [from_date + timedelta(days=i) for i in range((to_date - from_date).days + 1)]
+        created = self.aware(from_date - timedelta(days=7), dt_time(9))
+        for employee_id in self.users['doctor'] + self.users['nurse']:
+            shift_ids = self.pick_shifts()
+            schedule_id = self.ids[WorkSchedule]
+            self.ids[WorkSchedule] += 1
+            schedules.append((schedule_id, created, created, True, employee_id, from_date, to_date))
+            schedule_shifts += [(schedule_id, shift_id) for shift_id in shift_ids]
+            calendar_days += [(employee_id, day, shift_id, schedule_id) for day in days for shift_id in shift_ids]
+            if employee_id in self.doctors:
+                calendars[employee_id] = self.slot_times(shift_ids)
+        with transaction.atomic():
+            insert_rows(WorkSchedule, COLUMNS[WorkSchedule], schedules, self.batch_size)
+            insert_rows(WorkSchedule.shift.through, ['workschedule', 'shift'], schedule_shifts, self.batch_size)
+            insert_rows(ShiftCalendar, COLUMNS[ShiftCalendar], calendar_days, self.batch_size)
+        return calendars
+
+    def aware(self, day, value):
+        return timezone.make_aware(datetime.combine(day, value))
+
+    def pick_status(self, day):
+        value = self.random.random()
+        if day > self.today:
+            return 'pending_confirmation' if value < 0.5 else 'confirmed' if value < 0.9 else 'cancelled'
+        if day == self.today:
+            return self.random.choice(['confirmed', 'examination_in_progress', 'exam_completed', 'cancelled'])
+        return 'exam_completed' if value < 0.8 else 'cancelled'
+
+    def add_appointment(self, doctor_id, day, slot_time):
+        status = self.pick_status(day)
+        start = self.aware(day, slot_time)
+        booked = start - timedelta(days=self.random.randint(1, 14), minutes=self.random.randint(0, 600))
+        appointment_id = self.ids[Appointment]
+        self.ids[Appointment] += 1
+        patient_id = self.random.choice(self.users['patient'])
+        nurse_id = self.random.choice(self.users['nurse']) if status != 'pending_confirmation' else None
+        self.pending[Appointment].append((
+            appointment_id, booked, min(start, self.now), True, patient_id, doctor_id, nurse_id, day, slot_time,
+            self.random.choice(SYMPTOMS), 'Bệnh nhân bận' if status == 'cancelled' else None, status,
+            True if status in Appointment.active_statuses else None
+        ))
+        self.appointment_stats[(day, doctor_id, status)] += 1
+        if status != 'cancelled':
+            self.day_counts[(day,)] += 1
+        if status == 'exam_completed':
+            self.add_prescription(appointment_id, patient_id, doctor_id, day, start)
+
+    def add_prescription(self, appointment_id, patient_id, doctor_id, day, start):
+        finished = start + timedelta(minutes=30)
+        prescription_id = self.ids[Prescription]
+        self.ids[Prescription] += 1
+        days_supply = self.random.choice([3, 5, 7, 14])
+        follow_up_date = day + timedelta(days=days_supply) if self.random.random() < 0.3 else None
+        self.pending[Prescription].append((
+            prescription_id, finished, finished, True, appointment_id, patient_id, doctor_id,
+            self.random.choice(DIAGNOSES), days_supply, 'Uống thuốc đúng giờ', follow_up_date,
+            day + timedelta(days=days_supply)
+        ))
+
+        cost = Decimal(0)
+        for medicine_id in self.random.sample(self.medicines, min(len(self.medicines), self.random.randint(1, 4))):
+            morning, evening = self.random.randint(0, 2), self.random.randint(1, 2)
+            quantity = (morning + evening) * days_supply
+            cost += quantity * Decimal(self.random.choice([500, 1000, 2000, 5000]))
+            self.pending[PrescriptionDetail].append((
+                self.ids[PrescriptionDetail], prescription_id, medicine_id, quantity, morning, 0, evening, None
+            ))
+            self.ids[PrescriptionDetail] += 1
+
+        # Hoá đơn vài ngày gần đây còn chờ thanh toán, còn lại đã thanh toán (một ít bị huỷ)
+        if (self.today - day).days < 3:
+            status = 'pending'
+        else:
+            status = 'paid' if self.random.random() < 0.97 else 'cancelled'
+        payment_method = self.random.choice(['Tiền mặt', 'e-Wallet']) if status == 'paid' else None
+        payment_date = finished + timedelta(minutes=self.random.randint(5, 60)) if status == 'paid' else None
+        total = EXAMINATION_COST + cost
+        self.pending[Invoice].append((
+            self.ids[Invoice], finished, payment_date or finished, True, appointment_id, patient_id,
+            self.random.choice(self.users['nurse']), prescription_id, cost, EXAMINATION_COST, total,
+            payment_method, payment_date, status, None
+        ))
+        self.ids[Invoice] += 1
+        if status == 'paid':
+            key = (stats.local_date(payment_date), payment_method)
+            self.revenue[key]['invoice_count'] += 1
+            self.revenue[key]['revenue'] += total
+
+    def flush(self):
+        with transaction.atomic():
+            for model, rows in self.pending.items():
+                insert_rows(model, COLUMNS[model], rows, self.batch_size)
+                rows.clear()
+
+    # Bulk insert không qua signal nên cập nhật bộ đếm theo ngày và các bảng thống kê ở đây
+    def update_counters(self):
+        with transaction.atomic():
+            add_totals(DailyAppointmentCount, ['date'], {key: {'total': total}
+                                                         for key, total in self.day_counts.items()})
+            add_totals(DailyAppointmentStat, ['date', 'doctor_key', 'doctor_id', 'status'],
+                       {(day, doctor_id or 0, doctor_id, status): {'total': total}
+                        for (day, doctor_id, status), total in self.appointment_stats.items()})
+            add_totals(DailyRevenueStat, ['date', 'payment_method'], self.revenue)
+
+    # PostgreSQL không tự tăng sequence khi khoá chính được gán trước (SQLite, MySQL thì có)
+    def reset_sequences(self, models):
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
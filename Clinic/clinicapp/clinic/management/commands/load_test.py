@@ -0,0 +1,140 @@
+import asyncio
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+
+from clinic.management.commands.benchmark_endpoints import percentile
+from clinic.models import MyUser, Doctor
+
+PATH_PREFIXES = {'sync': '/', 'async': '/async/'}
+CLIENT_ERRORS = (OSError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError)
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    version, status = lines[0].split(' ', 2)[:2]
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip().lower()
+
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+        return int(status), False
+    keep_alive = version == 'HTTP/1.1' and headers.get('connection') != 'close'
+    return int(status), keep_alive
+
+
+# Một client giữ một kết nối keep-alive (mở lại khi server đóng, vd. gunicorn sync worker)
+# và gửi lần lượt các request GET cho tới hết thời gian đo
+async def run_client(index, host, port, paths, token, deadline, timeout, latencies, errors):
+    reader = writer = None
+    while time.monotonic() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        request = (f'GET {path} HTTP/1.1\r\nHost: {host}\r\nAuthorization: Bearer {token}\r\n'
+                   f'Accept: application/json\r\n\r\n').encode()
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+            writer.write(request)
+            await writer.drain()
+            status, keep_alive = await asyncio.wait_for(read_response(reader), timeout)
+        except CLIENT_ERRORS as e:
+            errors[type(e).__name__] += 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.1)
+            continue
+        if status >= 400:
+            errors[str(status)] += 1
+        else:
+            latencies.append(time.perf_counter() - start)
+        if not keep_alive:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+# Đo thông lượng của một server đang chạy với nhiều client đồng thời, để so sánh cùng số worker:
+#   gunicorn clinicapp.wsgi -w 4                                   + load_test --mode sync --workers 4
+#   gunicorn clinicapp.asgi -w 4 -k uvicorn.workers.UvicornWorker  + load_test --mode async --workers 4
+# --mode sync gọi các action của DoctorViewSet, --mode async gọi các view async tương ứng ở /async/doctors/.
+# Access token dùng để gọi được tạo cho user (mặc định bệnh nhân đầu tiên) và xoá khi đo xong.
+class Command(BaseCommand):
+    help = 'Đo thông lượng (request/giây mỗi worker) của danh mục bác sĩ và khung giờ trống dưới tải đồng thời'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--mode', choices=PATH_PREFIXES, default='async')
+        parser.add_argument('--clients', type=int, default=500)
+        parser.add_argument('--duration', type=float, default=30, help='Số giây đo')
+        parser.add_argument('--workers', type=int, default=1, help='Số worker của server được đo')
+        parser.add_argument('--timeout', type=float, default=30, help='Số giây chờ tối đa mỗi request')
+        parser.add_argument('--username', help='User dùng để gọi API (mặc định bệnh nhân đầu tiên)')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('--url must be an http:// URL')
+
+        users = MyUser.objects.filter(is_active=True)
+        user = users.filter(username=options['username']).first() if options['username'] \
+            else users.filter(groups__name='patient').order_by('id').first()
+        doctor = Doctor.objects.order_by('id').first()
+        if user is None or doctor is None:
+            raise CommandError('Not enough data to load test, run generate_data first')
+
+        prefix = url.path.rstrip('/') + PATH_PREFIXES[options['mode']]
+        day = (timezone.localdate() + timedelta(days=1)).isoformat()
+        paths = [f'{prefix}doctors/', f'{prefix}doctors/{doctor.pk}/introduce/',
+                 f'{prefix}doctors/{doctor.pk}/time-slots/?date={day}']
+
+        token = AccessToken.objects.create(
+            user=user, token=uuid.uuid4().hex, expires=timezone.now() + timedelta(hours=1), scope='read write'
+        )
+        try:
+            latencies, errors = asyncio.run(self.run(url.hostname, url.port or 80, paths, token.token, options))
+        finally:
+            token.delete()
+
+        rate = len(latencies) / options['duration']
+        self.stdout.write(f'{options["mode"]} {options["url"]}: {options["clients"]} clients, '
+                          f'{options["duration"]:g} s, {options["workers"]} workers')
+        if not latencies:
+            raise CommandError(f'No successful requests, errors: {dict(errors)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(latencies)} requests, {rate:.1f} req/s, {rate / options["workers"]:.1f} req/s per worker, '
+            f'p50 {percentile(latencies, 50) * 1000:.1f} ms, p99 {percentile(latencies, 99) * 1000:.1f} ms'
+        ))
+        if errors:
+            self.stdout.write(self.style.WARNING(f'errors: {dict(errors)}'))
+
+    async def run(self, host, port, paths, token, options):
+        latencies = []
+        errors = Counter()
+        deadline = time.monotonic() + options['duration']
+        await asyncio.gather(*(
+            run_client(i, host, port, paths, token, deadline, options['timeout'], latencies, errors)
+            for i in range(options['clients'])
+        ))
+        return latencies, errors
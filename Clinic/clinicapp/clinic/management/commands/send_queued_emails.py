@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from clinic.dao import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = 'Gửi các email đang chờ trong outbox theo lô, dùng chung một kết nối SMTP cho mỗi lô'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--loop', action='store_true', help='Chạy liên tục như một worker')
+        parser.add_argument('--interval', type=float, default=5, help='Số giây nghỉ khi outbox trống')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_queued_emails(options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f'Sent {sent}, failed {failed}')
+            # Lô chưa đầy nghĩa là outbox đã hết email đến hạn
+            if sent + failed < options['batch_size']:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
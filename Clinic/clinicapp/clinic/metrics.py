@@ -0,0 +1,216 @@
+import bisect
+import contextvars
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+from rest_framework.renderers import JSONRenderer
+
+# Ngưỡng (giây) của histogram thời gian xử lý request
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_current = contextvars.ContextVar('clinic_metrics_request', default=None)
+
+
+# Số liệu của một request, cộng dồn trong lúc xử lý rồi ghi vào registry một lần
+class RequestRecord:
+    __slots__ = ('endpoint', 'queries', 'query_time', 'serializer_time')
+
+    def __init__(self):
+        self.endpoint = None
+        self.queries = 0
+        self.query_time = 0.0
+        self.serializer_time = 0.0
+
+
+class EndpointStats:
+    __slots__ = ('statuses', 'buckets', 'duration', 'queries', 'query_time', 'serializer_time', 'response_bytes')
+
+    def __init__(self):
+        self.statuses = {}
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.duration = 0.0
+        self.queries = 0
+        self.query_time = 0.0
+        self.serializer_time = 0.0
+        self.response_bytes = 0
+
+
+# Registry trong process: mỗi worker giữ số liệu của riêng nó, Prometheus phân biệt theo instance.
+# Mỗi request chỉ giữ khoá một lần khi ghi nên chi phí đủ nhỏ để bật cả trên production.
+class Registry:
+    def __init__(self):
+        self.lock = Lock()
+        self.endpoints = {}
+
+    def observe(self, endpoint, method, status, duration, record, response_bytes):
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, duration)
+        with self.lock:
+            stats = self.endpoints.get((endpoint, method))
+            if stats is None:
+                stats = self.endpoints[(endpoint, method)] = EndpointStats()
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.buckets[bucket] += 1
+            stats.duration += duration
+            stats.queries += record.queries
+            stats.query_time += record.query_time
+            stats.serializer_time += record.serializer_time
+            stats.response_bytes += response_bytes
+
+    def clear(self):
+        with self.lock:
+            self.endpoints.clear()
+
+    def render(self):
+        with self.lock:
+            endpoints = sorted((key, self.snapshot(stats)) for key, stats in self.endpoints.items())
+
+        lines = []
+        metric(lines, 'clinic_http_requests_total', 'counter', 'Số request theo endpoint và mã trạng thái')
+        for (endpoint, method), stats in endpoints:
+            for status, count in sorted(stats.statuses.items()):
+                lines.append(f'clinic_http_requests_total{labels(endpoint, method, status=status)} {count}')
+
+        metric(lines, 'clinic_http_request_duration_seconds', 'histogram', 'Thời gian xử lý request')
+        for (endpoint, method), stats in endpoints:
+            cumulative = 0
+            for le, count in zip([*LATENCY_BUCKETS, '+Inf'], stats.buckets):
+                cumulative += count
+                lines.append(f'clinic_http_request_duration_seconds_bucket{labels(endpoint, method, le=le)} {cumulative}')
+            lines.append(f'clinic_http_request_duration_seconds_sum{labels(endpoint, method)} {stats.duration}')
+            lines.append(f'clinic_http_request_duration_seconds_count{labels(endpoint, method)} {cumulative}')
+
+        for name, kind, help_text, attr in (
+            ('clinic_db_queries_total', 'counter', 'Số truy vấn DB', 'queries'),
+            ('clinic_db_query_duration_seconds_total', 'counter', 'Tổng thời gian truy vấn DB', 'query_time'),
+            ('clinic_serializer_duration_seconds_total', 'counter', 'Tổng thời gian serialize', 'serializer_time'),
+            ('clinic_http_response_size_bytes_total', 'counter', 'Tổng kích thước response (trừ luồng)',
+             'response_bytes'),
+        ):
+            metric(lines, name, kind, help_text)
+            for (endpoint, method), stats in endpoints:
+                lines.append(f'{name}{labels(endpoint, method)} {getattr(stats, attr)}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def snapshot(stats):
+        copy = EndpointStats()
+        for attr in EndpointStats.__slots__:
+            value = getattr(stats, attr)
+            setattr(copy, attr, value.copy() if isinstance(value, (dict, list)) else value)
+        return copy
+
+
+registry = Registry()
+
+
+def metric(lines, name, kind, help_text):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+
+
+def labels(endpoint, method, **extra):
+    values = {'endpoint': endpoint, 'method': method, **extra}
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for value in values.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(values, escaped)) + '}'
+
+
+# Tên endpoint: ViewSet.action với view của DRF, tên hàm với view thường
+def endpoint_name(request, view_func):
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{cls.__name__}.{action}'
+
+
+@contextmanager
+def timer(name):
+    record = _current.get()
+    if record is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(record, name, getattr(record, name) + time.perf_counter() - start)
+
+
+def _count_query(execute, sql, params, many, context):
+    record = _current.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record.queries += 1
+        record.query_time += time.perf_counter() - start
+
+
+# Wrapper được gắn vào mọi kết nối DB (kể cả kết nối trong thread của sync_to_async khi chạy ASGI),
+# request nào đang được đo thì lấy qua context var
+def _install_query_counter(sender, connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def install():
+    connection_created.connect(_install_query_counter, dispatch_uid='clinic_metrics_query_counter')
+
+
+# serializer_time gồm thời gian dựng dữ liệu trong serialize_list (views.py) và thời gian encode JSON ở đây
+class TimedJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timer('serializer_time'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        record = RequestRecord()
+        token = _current.set(record)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.observe(request, response, record, time.perf_counter() - start)
+        return response
+
+    # Với luồng (SSE, export) chỉ đo tới lúc trả về response, không gồm thời gian stream
+    async def __acall__(self, request):
+        record = RequestRecord()
+        token = _current.set(record)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.observe(request, response, record, time.perf_counter() - start)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        record = _current.get()
+        if record is not None:
+            record.endpoint = endpoint_name(request, view_func)
+
+    def observe(self, request, response, record, duration):
+        size = 0 if response.streaming else len(response.content)
+        # Không gộp URL chưa được resolve (404, ...) theo path để tránh số nhãn tăng không giới hạn
+        registry.observe(record.endpoint or 'unmatched', request.method, response.status_code, duration, record,
+                         size)
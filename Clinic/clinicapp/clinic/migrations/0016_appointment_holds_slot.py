@@ -0,0 +1,38 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:09
+
+from django.db import migrations, models
+
+
+def release_inactive_slots(apps, schema_editor):
+    Appointment = apps.get_model('clinic', 'Appointment')
+    Appointment.objects.exclude(status__in=('pending_confirmation', 'confirmed')).update(holds_slot=None)
+
+    # Lịch hẹn trùng khung giờ đã tồn tại: chỉ lịch đặt sớm nhất giữ khung giờ
+    seen = set()
+    duplicates = []
+    for pk, doctor_id, date, time in Appointment.objects.filter(holds_slot=True).order_by('id') \
+            .values_list('id', 'doctor_id', 'date', 'time'):
+        if (doctor_id, date, time) in seen:
+            duplicates.append(pk)
+        seen.add((doctor_id, date, time))
+    Appointment.objects.filter(pk__in=duplicates).update(holds_slot=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0015_remove_workschedule_is_available'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='holds_slot',
+            field=models.BooleanField(default=True, editable=False, null=True),
+        ),
+        migrations.RunPython(release_inactive_slots, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(fields=('doctor', 'date', 'time', 'holds_slot'), name='unique_active_appointment_slot'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:10
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_existing_appointments(apps, schema_editor):
+    Appointment = apps.get_model('clinic', 'Appointment')
+    DailyAppointmentCount = apps.get_model('clinic', 'DailyAppointmentCount')
+    totals = Appointment.objects.exclude(status='cancelled').values('date').annotate(total=Count('id'))
+    DailyAppointmentCount.objects.bulk_create(
+        DailyAppointmentCount(date=row['date'], total=row['total']) for row in totals
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0016_appointment_holds_slot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAppointmentCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('total', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_existing_appointments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:11
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0017_dailyappointmentcount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_date', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_date', models.DateTimeField(auto_now=True, null=True)),
+                ('active', models.BooleanField(default=True)),
+                ('subject', models.CharField(max_length=255)),
+                ('message', models.TextField()),
+                ('recipient', models.EmailField(max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Chờ gửi'), ('sent', 'Đã gửi'), ('failed', 'Gửi thất bại')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sent_date', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_attempt_date'], name='emailoutbox_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0018_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'date', 'status', 'time'], name='appointment_doctor_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'date', 'time'], name='appointment_patient_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['status', 'date', 'time'], name='appointment_status_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['date', 'time'], name='appointment_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['patient', 'status', 'created_date'], name='invoice_patient_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['patient', 'created_date'], name='invoice_patient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['status', 'created_date'], name='invoice_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['appointment', 'status'], name='invoice_appointment_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['patient', 'created_date'], name='prescription_patient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['doctor', 'created_date'], name='prescription_doctor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workschedule',
+            index=models.Index(fields=['employee', 'from_date', 'to_date'], name='workschedule_employee_idx'),
+        ),
+    ]
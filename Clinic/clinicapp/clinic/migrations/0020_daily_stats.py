@@ -0,0 +1,92 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+
+
+def local_date(value):
+    return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+
+
+# Tổng hợp dữ liệu hiện có vào các bảng thống kê
+def backfill_stats(apps, schema_editor):
+    Appointment = apps.get_model('clinic', 'Appointment')
+    Invoice = apps.get_model('clinic', 'Invoice')
+    MyUser = apps.get_model('clinic', 'MyUser')
+    DailyAppointmentStat = apps.get_model('clinic', 'DailyAppointmentStat')
+    DailyRevenueStat = apps.get_model('clinic', 'DailyRevenueStat')
+    DailyPatientStat = apps.get_model('clinic', 'DailyPatientStat')
+
+    rows = Appointment.objects.values('date', 'doctor_id', 'status').annotate(total=Count('id')).order_by()
+    DailyAppointmentStat.objects.bulk_create([DailyAppointmentStat(**row) for row in rows], batch_size=1000)
+
+    # Ngày thanh toán được quy về múi giờ địa phương nên cộng dồn trong Python
+    revenue = {}
+    invoices = Invoice.objects.filter(status='paid', payment_date__isnull=False) \
+        .values_list('payment_date', 'payment_method', 'total')
+    for payment_date, payment_method, total in invoices.iterator(chunk_size=2000):
+        key = (local_date(payment_date), payment_method)
+        count, amount = revenue.get(key, (0, 0))
+        revenue[key] = (count + 1, amount + total)
+    DailyRevenueStat.objects.bulk_create([
+        DailyRevenueStat(date=day, payment_method=method, invoice_count=count, revenue=amount)
+        for (day, method), (count, amount) in revenue.items()
+    ], batch_size=1000)
+
+    patients = {}
+    for date_joined in MyUser.objects.filter(role='patient').values_list('date_joined', flat=True).iterator(chunk_size=2000):
+        day = local_date(date_joined)
+        patients[day] = patients.get(day, 0) + 1
+    DailyPatientStat.objects.bulk_create(
+        [DailyPatientStat(date=day, new_patients=total) for day, total in patients.items()], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0019_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyPatientStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('new_patients', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyRevenueStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('payment_method', models.CharField(choices=[('Tiền mặt', 'Tiền mặt'), ('e-Wallet', 'e-Wallet')], max_length=20, null=True)),
+                ('invoice_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyAppointmentStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('pending_confirmation', 'Chờ xác nhận'), ('confirmed', 'Đã xác nhận'), ('cancelled', 'Đã huỷ'), ('examination_in_progress', 'Đang khám'), ('exam_completed', 'Đã khám')], max_length=40)),
+                ('total', models.IntegerField(default=0)),
+                ('doctor', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='appointment_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrevenuestat',
+            constraint=models.UniqueConstraint(fields=('date', 'payment_method'), name='unique_daily_revenue_stat'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyappointmentstat',
+            constraint=models.UniqueConstraint(fields=('date', 'doctor', 'status'), name='unique_daily_appointment_stat'),
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:27
+
+from django.db import migrations, models
+
+
+# Ảnh đại diện hiện có đều nằm trên Cloudinary nên URL được dựng lại bằng CloudinaryAvatarStorage
+def backfill_avatar_urls(apps, schema_editor):
+    from clinic.avatars import CloudinaryAvatarStorage
+
+    MyUser = apps.get_model('clinic', 'MyUser')
+    storage = CloudinaryAvatarStorage()
+    users = []
+    for user in MyUser.objects.exclude(avatar__isnull=True).exclude(avatar='').iterator(chunk_size=500):
+        urls = storage.get_urls(user.avatar)
+        user.avatar_url, user.avatar_list_url, user.avatar_detail_url = urls['original'], urls['list'], urls['detail']
+        users.append(user)
+        if len(users) >= 500:
+            MyUser.objects.bulk_update(users, ['avatar_url', 'avatar_list_url', 'avatar_detail_url'])
+            users = []
+    MyUser.objects.bulk_update(users, ['avatar_url', 'avatar_list_url', 'avatar_detail_url'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0020_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myuser',
+            name='avatar_detail_url',
+            field=models.CharField(blank=True, editable=False, max_length=500, null=True),
+        ),
+        migrations.AddField(
+            model_name='myuser',
+            name='avatar_list_url',
+            field=models.CharField(blank=True, editable=False, max_length=500, null=True),
+        ),
+        migrations.AddField(
+            model_name='myuser',
+            name='avatar_url',
+            field=models.CharField(blank=True, editable=False, max_length=500, null=True),
+        ),
+        migrations.RunPython(backfill_avatar_urls, migrations.RunPython.noop),
+    ]
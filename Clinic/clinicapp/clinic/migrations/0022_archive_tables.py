@@ -0,0 +1,117 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0021_avatar_urls'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAppointment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('created_date', models.DateTimeField(null=True)),
+                ('updated_date', models.DateTimeField(null=True)),
+                ('active', models.BooleanField(default=True)),
+                ('date', models.DateField()),
+                ('time', models.TimeField()),
+                ('description', models.TextField(null=True)),
+                ('cancellation_reason', models.CharField(blank=True, max_length=150, null=True)),
+                ('status', models.CharField(choices=[('pending_confirmation', 'Chờ xác nhận'), ('confirmed', 'Đã xác nhận'), ('cancelled', 'Đã huỷ'), ('examination_in_progress', 'Đang khám'), ('exam_completed', 'Đã khám')], max_length=40)),
+                ('archived_date', models.DateTimeField(auto_now_add=True)),
+                ('doctor', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('nurse', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedPrescription',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('created_date', models.DateTimeField(null=True)),
+                ('updated_date', models.DateTimeField(null=True)),
+                ('active', models.BooleanField(default=True)),
+                ('diagnosis', models.TextField()),
+                ('days_supply', models.IntegerField()),
+                ('advice', models.TextField()),
+                ('follow_up_date', models.DateField(null=True)),
+                ('expiry_date', models.DateField(blank=True, null=True)),
+                ('archived_date', models.DateTimeField(auto_now_add=True)),
+                ('appointment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prescription', to='clinic.archivedappointment')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedInvoice',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('created_date', models.DateTimeField(null=True)),
+                ('updated_date', models.DateTimeField(null=True)),
+                ('active', models.BooleanField(default=True)),
+                ('prescription_cost', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('examination_cost', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('total', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('payment_method', models.CharField(choices=[('Tiền mặt', 'Tiền mặt'), ('e-Wallet', 'e-Wallet')], max_length=20, null=True)),
+                ('payment_date', models.DateTimeField(null=True)),
+                ('status', models.CharField(choices=[('pending', 'Chờ thanh toán'), ('paid', 'Đã thanh toán'), ('cancelled', 'Đã huỷ')], max_length=20)),
+                ('note', models.CharField(blank=True, max_length=150, null=True)),
+                ('archived_date', models.DateTimeField(auto_now_add=True)),
+                ('appointment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invoice', to='clinic.archivedappointment')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('prescription', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='invoice', to='clinic.archivedprescription')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedPrescriptionDetail',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.IntegerField()),
+                ('morning_dose', models.IntegerField(default=0)),
+                ('afternoon_dose', models.IntegerField(default=0)),
+                ('evening_dose', models.IntegerField(default=0)),
+                ('note', models.TextField(null=True)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='clinic.medicine')),
+                ('prescription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prescription_details', to='clinic.archivedprescription')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedappointment',
+            index=models.Index(fields=['patient', 'date', 'time'], name='archived_appt_patient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedappointment',
+            index=models.Index(fields=['doctor', 'date', 'time'], name='archived_appt_doctor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedappointment',
+            index=models.Index(fields=['date', 'time'], name='archived_appt_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedprescription',
+            index=models.Index(fields=['patient', 'created_date'], name='archived_presc_patient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedprescription',
+            index=models.Index(fields=['doctor', 'created_date'], name='archived_presc_doctor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedinvoice',
+            index=models.Index(fields=['patient', 'status', 'created_date'], name='archived_inv_patient_st_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedinvoice',
+            index=models.Index(fields=['patient', 'created_date'], name='archived_inv_patient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedinvoice',
+            index=models.Index(fields=['created_date'], name='archived_inv_created_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:53
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_existing_calendar(apps, schema_editor):
+    WorkSchedule = apps.get_model('clinic', 'WorkSchedule')
+    ShiftCalendar = apps.get_model('clinic', 'ShiftCalendar')
+    schedules = WorkSchedule.objects.filter(active=True, from_date__isnull=False, to_date__isnull=False) \
+        .prefetch_related('shift')
+    rows = []
+    for schedule in schedules.iterator(chunk_size=500):
+        for i in range((schedule.to_date - schedule.from_date).days + 1):
+            for shift in schedule.shift.all():
+                rows.append(ShiftCalendar(employee_id=schedule.employee_id, date=schedule.from_date + timedelta(days=i),
+                                          shift_id=shift.id, work_schedule_id=schedule.id))
+        if len(rows) >= 1000:
+            ShiftCalendar.objects.bulk_create(rows)
+            rows = []
+    ShiftCalendar.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0022_archive_tables'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShiftCalendar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shift_calendar', to=settings.AUTH_USER_MODEL)),
+                ('shift', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_days', to='clinic.shift')),
+                ('work_schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_days', to='clinic.workschedule')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['employee', 'date'], name='shiftcalendar_employee_idx'), models.Index(fields=['date', 'shift'], name='shiftcalendar_date_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shiftcalendar',
+            constraint=models.UniqueConstraint(fields=('work_schedule', 'date', 'shift'), name='unique_shift_calendar_day'),
+        ),
+        migrations.RunPython(build_existing_calendar, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:14
+
+from django.db import migrations, models
+from django.db.models import F, Q
+
+
+# Gộp các dòng trùng khoá (do khoá có cột NULL) vào dòng có id nhỏ nhất
+def merge_rows(model, rows, key_fields, sum_fields):
+    keep = {}
+    for row in rows.order_by('id'):
+        key = tuple(getattr(row, field) for field in key_fields)
+        if key not in keep:
+            keep[key] = row
+            continue
+        for field in sum_fields:
+            setattr(keep[key], field, getattr(keep[key], field) + getattr(row, field))
+        row.delete()
+    model.objects.bulk_update(keep.values(), sum_fields)
+
+
+def fill_stat_keys(apps, schema_editor):
+    DailyAppointmentStat = apps.get_model('clinic', 'DailyAppointmentStat')
+    DailyRevenueStat = apps.get_model('clinic', 'DailyRevenueStat')
+    DailyAppointmentStat.objects.filter(doctor__isnull=False).update(doctor_key=F('doctor_id'))
+    merge_rows(DailyAppointmentStat, DailyAppointmentStat.objects.filter(doctor__isnull=True),
+               ['date', 'status'], ['total'])
+    merge_rows(DailyRevenueStat, DailyRevenueStat.objects.filter(Q(payment_method__isnull=True) | Q(payment_method='')),
+               ['date'], ['invoice_count', 'revenue'])
+    DailyRevenueStat.objects.filter(payment_method__isnull=True).update(payment_method='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0024_emailoutbox_sending'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='dailyappointmentstat',
+            name='unique_daily_appointment_stat',
+        ),
+        migrations.AddField(
+            model_name='dailyappointmentstat',
+            name='doctor_key',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_stat_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='dailyrevenuestat',
+            name='payment_method',
+            field=models.CharField(blank=True, choices=[('Tiền mặt', 'Tiền mặt'), ('e-Wallet', 'e-Wallet')], default='', max_length=20),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyappointmentstat',
+            constraint=models.UniqueConstraint(fields=('date', 'doctor_key', 'status'), name='unique_daily_appointment_stat'),
+        ),
+    ]
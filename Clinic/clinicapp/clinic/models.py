@@ -1,7 +1,11 @@
 from django.contrib.auth.models import AbstractUser
+from django.core.files.uploadedfile import UploadedFile
 from django.db import models
+from django.utils import timezone
 from cloudinary.models import CloudinaryField
 
+from .avatars import update_avatar_urls
+
 
 # Create your models here.
 class MyUser(AbstractUser):
@@ -23,6 +27,10 @@ class MyUser(AbstractUser):
     phone_number = models.CharField(max_length=15, null=True)
     email = models.EmailField(max_length=255, null=True, unique=True)
     avatar = CloudinaryField('avatar', null=True)
+    # URL ảnh đại diện (gốc và bản thu nhỏ) được tính một lần khi ảnh thay đổi, xem avatars.py
+    avatar_url = models.CharField(max_length=500, null=True, blank=True, editable=False)
+    avatar_list_url = models.CharField(max_length=500, null=True, blank=True, editable=False)
+    avatar_detail_url = models.CharField(max_length=500, null=True, blank=True, editable=False)
     role = models.CharField(
         max_length=10,
         choices=role_choices,
@@ -33,6 +41,17 @@ class MyUser(AbstractUser):
     def __str__(self):
         return self.fullname
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        avatar_changed = isinstance(self.avatar, UploadedFile) \
+            or (str(self.avatar) if self.avatar else None) != getattr(self, '_original_avatar', None)
+        if avatar_changed and (update_fields is None or 'avatar' in update_fields):
+            update_avatar_urls(self)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'avatar_url', 'avatar_list_url', 'avatar_detail_url'}
+        super().save(*args, **kwargs)
+        self._original_avatar = str(self.avatar) if self.avatar else None
+
 
 class Doctor(models.Model):
     speciality_choices = [
@@ -91,10 +110,36 @@ class WorkSchedule(BaseModel):
     from_date = models.DateField(null=True)  # null!
     to_date = models.DateField(null=True)  # null!
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['employee', 'from_date', 'to_date'], name='workschedule_employee_idx'),
+        ]
+
     def __str__(self):
         return f'{self.employee} - {self.from_date} - {self.to_date}'
 
 
+# Lịch làm việc theo từng ngày: mỗi dòng là một ca của nhân viên trong một ngày, sinh ra từ WorkSchedule
+# (xem shift_calendar.py) để tra "ngày D nhân viên X làm ca nào" bằng một truy vấn theo chỉ mục (employee, date)
+class ShiftCalendar(models.Model):
+    employee = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='shift_calendar')
+    date = models.DateField()
+    shift = models.ForeignKey(Shift, on_delete=models.CASCADE, related_name='calendar_days')
+    work_schedule = models.ForeignKey(WorkSchedule, on_delete=models.CASCADE, related_name='calendar_days')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['work_schedule', 'date', 'shift'], name='unique_shift_calendar_day'),
+        ]
+        indexes = [
+            models.Index(fields=['employee', 'date'], name='shiftcalendar_employee_idx'),
+            models.Index(fields=['date', 'shift'], name='shiftcalendar_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.employee} - {self.date} - {self.shift}'
+
+
 class Appointment(BaseModel):
     status_choices = [
         ('pending_confirmation', 'Chờ xác nhận'),
@@ -103,6 +148,8 @@ class Appointment(BaseModel):
         ('examination_in_progress', 'Đang khám'),
         ('exam_completed', 'Đã khám'),
     ]
+    # Các trạng thái đang giữ khung giờ của bác sĩ
+    active_statuses = ('pending_confirmation', 'confirmed')
 
     patient = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='patient_appointments', null=False)
     doctor = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='doctor_appointments', null=True)
@@ -112,10 +159,67 @@ class Appointment(BaseModel):
     description = models.TextField(null=True)  # triệu chứng ban đầu
     cancellation_reason = models.CharField(max_length=150, null=True, blank=True)  # lý do huỷ
     status = models.CharField(max_length=40, choices=status_choices, default='Chờ xác nhận')
+    # True khi lịch hẹn đang giữ khung giờ, NULL khi đã huỷ/đã khám để khung giờ được giải phóng
+    holds_slot = models.BooleanField(null=True, default=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'date', 'time', 'holds_slot'], name='unique_active_appointment_slot'),
+        ]
+        indexes = [
+            # Bao phủ truy vấn dựng chỉ mục khung giờ (doctor, date, status -> time)
+            models.Index(fields=['doctor', 'date', 'status', 'time'], name='appointment_doctor_day_idx'),
+            # Lịch sử theo trang của bệnh nhân / y tá (lọc theo trạng thái)
+            models.Index(fields=['patient', 'date', 'time'], name='appointment_patient_day_idx'),
+            models.Index(fields=['status', 'date', 'time'], name='appointment_status_day_idx'),
+            models.Index(fields=['date', 'time'], name='appointment_day_idx'),
+        ]
 
     def __str__(self):
         return f'{self.patient} - {self.doctor} - {self.date} - {self.time}'
 
+    def save(self, *args, **kwargs):
+        self.holds_slot = True if self.status in self.active_statuses else None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'status' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'holds_slot'}
+        super().save(*args, **kwargs)
+
+
+class DailyAppointmentCount(models.Model):
+    date = models.DateField(unique=True)
+    total = models.PositiveIntegerField(default=0)  # số lịch hẹn chưa huỷ trong ngày
+
+    def __str__(self):
+        return f'{self.date} - {self.total}'
+
+
+class EmailOutbox(BaseModel):
+    status_choices = [
+        ('pending', 'Chờ gửi'),
+        ('sending', 'Đang gửi'),
+        ('sent', 'Đã gửi'),
+        ('failed', 'Gửi thất bại'),
+    ]
+
+    subject = models.CharField(max_length=255, null=False)
+    message = models.TextField(null=False)
+    recipient = models.EmailField(max_length=255, null=False)
+    status = models.CharField(max_length=20, choices=status_choices, default='pending')
+    attempts = models.PositiveIntegerField(default=0)  # số lần đã thử gửi
+    # thời điểm được thử gửi lại; khi đang gửi là hạn giữ email của worker, quá hạn thì worker khác nhận lại
+    next_attempt_date = models.DateTimeField(default=timezone.now)
+    sent_date = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_date'], name='emailoutbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipient} - {self.subject}'
+
 
 class Medicine(BaseModel):
     unit_choices = [
@@ -145,6 +249,12 @@ class Prescription(BaseModel):
     follow_up_date = models.DateField(null=True)  # ngày tái khám
     expiry_date = models.DateField(null=True, blank=True)  # ngày hết hạn
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'created_date'], name='prescription_patient_idx'),
+            models.Index(fields=['doctor', 'created_date'], name='prescription_doctor_idx'),
+        ]
+
     def __str__(self):
         return f'{self.patient} - {self.doctor} - {self.created_date}'
 
@@ -204,6 +314,151 @@ class Invoice(BaseModel):
     status = models.CharField(max_length=20, choices=status_choices, default='Chờ thanh toán')
     note = models.CharField(max_length=150, null=True, blank=True)  # ghi chú
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'status', 'created_date'], name='invoice_patient_status_idx'),
+            models.Index(fields=['patient', 'created_date'], name='invoice_patient_idx'),
+            models.Index(fields=['status', 'created_date'], name='invoice_status_idx'),
+            models.Index(fields=['appointment', 'status'], name='invoice_appointment_idx'),
+        ]
+
+
+# Các bảng thống kê tổng hợp theo ngày, được cập nhật dần khi lịch hẹn/hoá đơn/người dùng thay đổi
+class DailyAppointmentStat(models.Model):
+    date = models.DateField(null=False)
+    doctor = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='appointment_stats', null=True)
+    # Khoá duy nhất không dùng cột NULL được (NULL khác nhau nên hai lượt ghi đầu tiên tạo hai dòng):
+    # doctor_key là doctor_id, 0 khi lịch hẹn chưa có bác sĩ
+    doctor_key = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=40, choices=Appointment.status_choices)
+    total = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'doctor_key', 'status'], name='unique_daily_appointment_stat'),
+        ]
+
+    def __str__(self):
+        return f'{self.date} - {self.doctor} - {self.status} - {self.total}'
+
+
+class DailyRevenueStat(models.Model):
+    date = models.DateField(null=False)  # ngày thanh toán
+    # '' khi hoá đơn không có hình thức thanh toán, không để NULL vì cột nằm trong khoá duy nhất
+    payment_method = models.CharField(max_length=20, choices=Invoice.payment_method_choices, blank=True, default='')
+    invoice_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'payment_method'], name='unique_daily_revenue_stat'),
+        ]
+
+    def __str__(self):
+        return f'{self.date} - {self.payment_method} - {self.revenue}'
+
+
+class DailyPatientStat(models.Model):
+    date = models.DateField(unique=True)
+    new_patients = models.IntegerField(default=0)  # số bệnh nhân đăng ký mới
+
+    def __str__(self):
+        return f'{self.date} - {self.new_patients}'
+
+
+# Lưu trữ: lịch hẹn đã đóng (huỷ/đã khám) quá ARCHIVE_AFTER_DAYS ngày cùng đơn thuốc, hoá đơn được chuyển
+# sang các bảng dưới đây (giữ nguyên id và tên cột) để bảng đang dùng chỉ chứa dữ liệu gần đây, xem archive.py
+class ArchivedAppointment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    created_date = models.DateTimeField(null=True)
+    updated_date = models.DateTimeField(null=True)
+    active = models.BooleanField(default=True)
+    patient = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='+', null=False)
+    doctor = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='+', null=True)
+    nurse = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='+', null=True)
+    date = models.DateField(null=False)
+    time = models.TimeField(null=False)
+    description = models.TextField(null=True)
+    cancellation_reason = models.CharField(max_length=150, null=True, blank=True)
+    status = models.CharField(max_length=40, choices=Appointment.status_choices)
+    archived_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'date', 'time'], name='archived_appt_patient_idx'),
+            models.Index(fields=['doctor', 'date', 'time'], name='archived_appt_doctor_idx'),
+            models.Index(fields=['date', 'time'], name='archived_appt_day_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.patient} - {self.doctor} - {self.date} - {self.time}'
+
+
+class ArchivedPrescription(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    created_date = models.DateTimeField(null=True)
+    updated_date = models.DateTimeField(null=True)
+    active = models.BooleanField(default=True)
+    appointment = models.ForeignKey(ArchivedAppointment, on_delete=models.CASCADE, related_name='prescription')
+    patient = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='+', null=False)
+    doctor = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='+', null=False)
+    diagnosis = models.TextField(null=False)
+    days_supply = models.IntegerField(null=False)
+    advice = models.TextField(null=False)
+    follow_up_date = models.DateField(null=True)
+    expiry_date = models.DateField(null=True, blank=True)
+    archived_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'created_date'], name='archived_presc_patient_idx'),
+            models.Index(fields=['doctor', 'created_date'], name='archived_presc_doctor_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.patient} - {self.doctor} - {self.created_date}'
+
+
+class ArchivedPrescriptionDetail(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    prescription = models.ForeignKey(ArchivedPrescription, on_delete=models.CASCADE,
+                                     related_name='prescription_details')
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='+')
+    quantity = models.IntegerField(null=False)
+    morning_dose = models.IntegerField(default=0)
+    afternoon_dose = models.IntegerField(default=0)
+    evening_dose = models.IntegerField(default=0)
+    note = models.TextField(null=True)
+
+    def __str__(self):
+        return f'{self.prescription} - {self.medicine} - {self.quantity}'
+
+
+class ArchivedInvoice(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    created_date = models.DateTimeField(null=True)
+    updated_date = models.DateTimeField(null=True)
+    active = models.BooleanField(default=True)
+    appointment = models.ForeignKey(ArchivedAppointment, on_delete=models.CASCADE, related_name='invoice')
+    patient = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='+', null=False)
+    created_by = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='+', null=False)
+    prescription = models.ForeignKey(ArchivedPrescription, on_delete=models.CASCADE, related_name='invoice', null=True)
+    prescription_cost = models.DecimalField(max_digits=10, decimal_places=2, null=False)
+    examination_cost = models.DecimalField(max_digits=10, decimal_places=2, null=False)
+    total = models.DecimalField(max_digits=10, decimal_places=2, null=False)
+    payment_method = models.CharField(max_length=20, choices=Invoice.payment_method_choices, null=True)
+    payment_date = models.DateTimeField(null=True)
+    status = models.CharField(max_length=20, choices=Invoice.status_choices)
+    note = models.CharField(max_length=150, null=True, blank=True)
+    archived_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'status', 'created_date'], name='archived_inv_patient_st_idx'),
+            models.Index(fields=['patient', 'created_date'], name='archived_inv_patient_idx'),
+            models.Index(fields=['created_date'], name='archived_inv_created_idx'),
+        ]
+
 # class Notification(BaseModel):
 #     appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name='notifications', null=False)
 #     content = models.TextField(null=False)
@@ -0,0 +1,134 @@
+import hashlib
+import pickle
+import time as _time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from oauth2_provider.oauth2_validators import OAuth2Validator
+
+TOKEN_CACHE_TIMEOUT = 5 * 60  # cache dùng chung
+TOKEN_LOCAL_CACHE_TIMEOUT = 30  # cache trong process, mỗi lần dùng vẫn đối chiếu version của user trên cache dùng chung
+TOKEN_LOCAL_CACHE_SIZE = 10000
+
+
+# LRU trong process, mỗi mục có hạn riêng (không quá hạn của access token) và ghi kèm version của user lúc cache
+class TokenCache:
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, user_id, user_version, value = entry
+            if expires <= _time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return user_id, user_version, value
+
+    def set(self, key, value, timeout, user_id, user_version):
+        with self.lock:
+            self.entries[key] = (_time.monotonic() + timeout, user_id, user_version, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def delete_user(self, user_id):
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if entry[1] == user_id]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_local_cache = TokenCache(TOKEN_LOCAL_CACHE_SIZE)
+
+
+def _token_key(token):
+    return f'oauth2:token:{hashlib.sha256(token.encode()).hexdigest()}'
+
+
+def _user_version_key(user_id):
+    return f'oauth2:user:{user_id}'
+
+
+def _user_version(user_id):
+    return cache.get(_user_version_key(user_id), 0)
+
+
+# Access token được lưu kèm user và application (đã select_related) dưới dạng pickle,
+# mỗi request nhận một bản sao riêng nên việc sửa request.user không ảnh hưởng tới cache.
+# Thu hồi token hay sửa user ở process khác tăng version của user trên cache dùng chung,
+# mục trong LRU của process này bị bỏ ngay ở lần dùng kế tiếp.
+class CachedOAuth2Validator(OAuth2Validator):
+    def _load_access_token(self, token):
+        key = _token_key(token)
+        value = self._get_local(key)
+        if value is None and settings.OAUTH2_TOKEN_SHARED_CACHE:
+            value = self._get_shared(key)
+        if value is not None:
+            return pickle.loads(value)
+
+        access_token = super()._load_access_token(token)
+        # Không cache token không tồn tại/hết hạn để token mới cấp được nhận ngay
+        if access_token is None or access_token.is_expired():
+            return access_token
+
+        timeout = min(TOKEN_CACHE_TIMEOUT, (access_token.expires - timezone.now()).total_seconds())
+        value = pickle.dumps(access_token)
+        user_version = _user_version(access_token.user_id)
+        _local_cache.set(key, value, min(timeout, TOKEN_LOCAL_CACHE_TIMEOUT), access_token.user_id, user_version)
+        if settings.OAUTH2_TOKEN_SHARED_CACHE:
+            cache.set(key, (access_token.user_id, user_version, access_token.expires, value), timeout)
+        return access_token
+
+    def _get_local(self, key):
+        entry = _local_cache.get(key)
+        if entry is None:
+            return None
+        user_id, user_version, value = entry
+        if _user_version(user_id) != user_version:
+            _local_cache.delete(key)
+            return None
+        return value
+
+    def _get_shared(self, key):
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        user_id, user_version, expires, value = entry
+        # User đã thay đổi sau khi token được cache
+        if _user_version(user_id) != user_version:
+            cache.delete(key)
+            return None
+        timeout = min(TOKEN_LOCAL_CACHE_TIMEOUT, (expires - timezone.now()).total_seconds())
+        if timeout > 0:
+            _local_cache.set(key, value, timeout, user_id, user_version)
+        return value
+
+
+# Truyền user_id để LRU của các process khác cũng bỏ token này (cùng các token khác của user, nạp lại từ DB)
+def invalidate_access_token(token, user_id=None):
+    key = _token_key(token)
+    _local_cache.delete(key)
+    cache.delete(key)
+    if user_id is not None:
+        cache.set(_user_version_key(user_id), _time.time_ns(), None)
+
+
+def invalidate_user_tokens(user_id):
+    _local_cache.delete_user(user_id)
+    cache.set(_user_version_key(user_id), _time.time_ns(), None)
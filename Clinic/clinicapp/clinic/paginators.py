@@ -0,0 +1,118 @@
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, _reverse_ordering
+
+
+# Dòng đứng sau giá trị value của một cột theo thứ tự sắp xếp, None nếu không có dòng nào.
+# NULL đứng trước khi tăng dần và đứng sau khi giảm dần như trên MySQL/SQLite.
+def after_value(name, value, descending):
+    if value is None:
+        return None if descending else Q(**{f'{name}__isnull': False})
+    after = Q(**{f'{name}__lt' if descending else f'{name}__gt': value})
+    return after | Q(**{f'{name}__isnull': True}) if descending else after
+
+
+# Điều kiện keyset trên nhiều cột: (c1 sau v1) OR (c1 = v1 AND c2 sau v2) OR ...
+def keyset_filter(ordering, values):
+    conditions = []
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        after = after_value(name, value, field.startswith('-'))
+        if after is not None:
+            conditions.append(equal & after)
+        equal &= Q(**{f'{name}__isnull': True}) if value is None else Q(**{name: value})
+    return reduce(or_, conditions) if conditions else Q(pk__in=[])
+
+
+# Phân trang theo con trỏ (keyset): mỗi trang là một truy vấn theo chỉ mục, không COUNT(*) và không OFFSET.
+# Con trỏ lưu giá trị của mọi cột trong ordering (cột cuối là khoá duy nhất) nên vị trí luôn xác định một dòng,
+# khác CursorPagination của DRF chỉ lọc theo cột đầu rồi bù bằng offset.
+class ClinicCursorPagination(CursorPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    total_query_param = 'with_total'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.total = None
+        if request.query_params.get(self.total_query_param, '').lower() in ('1', 'true'):
+            self.total = queryset.count()
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor else None
+
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(keyset_filter(ordering, self.decode_position(queryset.model, position)))
+
+        # Lấy thêm một dòng để biết còn trang tiếp theo
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > len(self.page)
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_following
+        else:
+            self.has_next, self.has_previous = has_following, position is not None
+        self.position = position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = self._get_position_from_instance(self.page[-1], self.ordering) if self.page else self.position
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = self._get_position_from_instance(self.page[0], self.ordering) if self.page else self.position
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def decode_position(self, model, position):
+        try:
+            values = json.loads(position)
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            return [None if value is None else model._meta.get_field(field.lstrip('-')).to_python(value)
+                    for field, value in zip(self.ordering, values)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            name = field.lstrip('-')
+            value = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+            values.append(None if value is None else str(value))
+        return json.dumps(values)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.total is not None:
+            response.data['count'] = self.total
+        return response
+
+
+class AppointmentCursorPagination(ClinicCursorPagination):
+    ordering = ('-date', '-time', '-id')
+
+
+class CreatedDateCursorPagination(ClinicCursorPagination):
+    ordering = ('-created_date', '-id')
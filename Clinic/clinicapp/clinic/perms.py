@@ -1,24 +1,53 @@
+from django.core.cache import cache
 from rest_framework.permissions import BasePermission
 
+ROLE_CACHE_TIMEOUT = 5 * 60
+
+
+def _role_cache_key(user_id):
+    return f'roles:{user_id}'
+
+
+# Nhóm của user được nạp một lần cho mỗi request (gắn vào request.user) và lưu cache dùng chung có TTL
+def get_user_roles(user):
+    if not user.is_authenticated:
+        return frozenset()
+    roles = getattr(user, '_cached_roles', None)
+    if roles is None:
+        roles = cache.get(_role_cache_key(user.pk))
+        if roles is None:
+            roles = frozenset(user.groups.values_list('name', flat=True))
+            cache.set(_role_cache_key(user.pk), roles, ROLE_CACHE_TIMEOUT)
+        user._cached_roles = roles
+    return roles
+
+
+def has_role(user, role):
+    return role in get_user_roles(user)
+
+
+def invalidate_user_roles(*user_ids):
+    cache.delete_many([_role_cache_key(user_id) for user_id in user_ids])
+
 
 class IsAdmin(BasePermission):
     def has_permission(self, request, view):
-        return request.user.is_authenticated and request.user.groups.filter(name='admin').exists()
+        return has_role(request.user, 'admin')
 
     def has_object_permission(self, request, view, obj):
-        return request.user.is_authenticated and request.user.groups.filter(name='admin').exists()
+        return has_role(request.user, 'admin')
 
 
 class IsDoctor(BasePermission):
     def has_permission(self, request, view):
-        return request.user.is_authenticated and request.user.groups.filter(name='doctor').exists()
+        return has_role(request.user, 'doctor')
 
 
 class IsNurse(BasePermission):
     def has_permission(self, request, view):
-        return request.user.is_authenticated and request.user.groups.filter(name='nurse').exists()
+        return has_role(request.user, 'nurse')
 
 
 class IsPatient(BasePermission):
     def has_permission(self, request, view):
-        return request.user.is_authenticated and request.user.groups.filter(name='patient').exists()
+        return has_role(request.user, 'patient')
@@ -0,0 +1,133 @@
+import re
+import time as _time
+import unicodedata
+from collections import defaultdict
+from threading import Lock
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Medicine
+
+MAX_PREFIX_LENGTH = 20
+MIN_TRIGRAM_SIMILARITY = 0.3
+
+_VERSION_KEY = 'search:medicine:version'
+_lock = Lock()
+_index = None
+
+
+# Bỏ dấu tiếng Việt để "thuoc ho" khớp với "Thuốc ho"
+def normalize(text):
+    text = unicodedata.normalize('NFD', text.lower()).replace('đ', 'd')
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    return re.findall(r'[a-z0-9]+', normalize(text))
+
+
+def trigrams(token):
+    padded = f'  {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class MedicineIndex:
+    def __init__(self, medicines, version=None):
+        self.version = version
+        self.names = {}
+        self.tokens = {}
+        self.prefixes = defaultdict(set)
+        self.trigrams = defaultdict(set)
+        for medicine_id, name in medicines:
+            tokens = tokenize(name)
+            self.names[medicine_id] = ' '.join(tokens)
+            self.tokens[medicine_id] = tokens
+            for token in tokens:
+                for length in range(1, min(len(token), MAX_PREFIX_LENGTH) + 1):
+                    self.prefixes[token[:length]].add(medicine_id)
+                for gram in trigrams(token):
+                    self.trigrams[gram].add(medicine_id)
+
+    def _prefix_matches(self, token):
+        matches = self.prefixes.get(token[:MAX_PREFIX_LENGTH], set())
+        if len(token) > MAX_PREFIX_LENGTH:
+            matches = {medicine_id for medicine_id in matches
+                       if any(t.startswith(token) for t in self.tokens[medicine_id])}
+        return matches
+
+    # limit=None trả về mọi kết quả (phân trang ở view)
+    def search(self, query, limit=None):
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+        phrase = ' '.join(query_tokens)
+
+        # Mọi từ khoá phải là tiền tố của một từ trong tên thuốc
+        candidates = None
+        for token in query_tokens:
+            matches = self._prefix_matches(token)
+            candidates = matches if candidates is None else candidates & matches
+            if not candidates:
+                break
+
+        ranked = []
+        for medicine_id in candidates or ():
+            name = self.names[medicine_id]
+            ranked.append((
+                0 if name == phrase else 1 if name.startswith(phrase) else 2,
+                len(name),
+                name,
+                medicine_id
+            ))
+        ranked.sort()
+        results = [medicine_id for *key, medicine_id in ranked[:limit]]
+
+        # Gõ sai chính tả: bổ sung kết quả gần đúng theo n-gram, xếp sau các kết quả khớp tiền tố
+        if limit is None or len(results) < limit:
+            query_grams = set().union(*(trigrams(token) for token in query_tokens))
+            overlap = defaultdict(int)
+            for gram in query_grams:
+                for medicine_id in self.trigrams.get(gram, ()):
+                    overlap[medicine_id] += 1
+            found = set(results)
+            fuzzy = []
+            for medicine_id, shared in overlap.items():
+                if medicine_id in found:
+                    continue
+                name_grams = set().union(*(trigrams(token) for token in self.tokens[medicine_id]))
+                similarity = shared / len(query_grams | name_grams)
+                if similarity >= MIN_TRIGRAM_SIMILARITY:
+                    fuzzy.append((-similarity, self.names[medicine_id], medicine_id))
+            fuzzy.sort()
+            results += [medicine_id for *key, medicine_id in fuzzy[:None if limit is None else limit - len(results)]]
+
+        return results
+
+
+# Chỉ mục được giữ trong từng process và dựng lại khi phiên bản trong cache dùng chung thay đổi
+def get_medicine_index():
+    global _index
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        version = _time.time_ns()
+        if not cache.add(_VERSION_KEY, version, None):
+            version = cache.get(_VERSION_KEY, version)
+
+    index = _index
+    if index is None or index.version != version:
+        with _lock:
+            if _index is None or _index.version != version:
+                # Chỉ mục được giữ tới lần thay đổi kế tiếp nên đọc từ primary
+                medicines = Medicine.objects.using(DEFAULT_DB_ALIAS).filter(active=True).values_list('id', 'name')
+                _index = MedicineIndex(medicines, version)
+            index = _index
+    return index
+
+
+def search_medicines(query, limit=None):
+    return get_medicine_index().search(query, limit)
+
+
+def invalidate_medicine_index():
+    cache.set(_VERSION_KEY, _time.time_ns(), None)
@@ -4,8 +4,6 @@ from rest_framework import serializers
 
 from .models import MyUser, Doctor, Appointment, Medicine, Prescription, PrescriptionDetail, Invoice
 
-CLOUDINARY_DOMAIN = 'https://res.cloudinary.com/dyuafq1hx/'
-
 
 class MyUserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -39,18 +37,18 @@ class MyUserSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         if 'password' in validated_data:
             validated_data['password'] = make_password(validated_data.get('password'))
-        if validated_data.get('role') != instance.role:
-            instance.groups.clear()
-            instance.groups.add(Group.objects.get_or_create(name=validated_data.get('role')))
+        role = validated_data.get('role')
+        if role and role != instance.role:
+            group, created = Group.objects.get_or_create(name=role)
+            instance.groups.set([group])
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
 
-        # Check if avatar is present in data and not empty
-        if 'avatar' in data and data['avatar']:
-            # Append Cloudinary domain to avatar URL
-            data['avatar'] = f"{CLOUDINARY_DOMAIN}{data['avatar']}"
+        # URL đã được tính sẵn khi tải ảnh lên; hồ sơ dùng bản thu nhỏ cỡ chi tiết
+        if 'avatar' in data:
+            data['avatar'] = instance.avatar_detail_url or instance.avatar_url
 
         return data
 
@@ -79,12 +77,10 @@ class DoctorListSerializer(serializers.ModelSerializer):
         fields = ('id', 'user', 'speciality')
 
     def get_user(self, obj):
-        if obj.user.avatar:
-            obj.user.avatar = f"{CLOUDINARY_DOMAIN}{obj.user.avatar}"
         user = {
             'id': obj.user.id,
             'fullname': obj.user.fullname,
-            'avatar': obj.user.avatar
+            'avatar': obj.user.avatar_list_url or obj.user.avatar_url
         }
         return user
 
@@ -179,8 +175,14 @@ class MedicineSerializer(serializers.ModelSerializer):
         }
 
 
+class MedicineIdField(serializers.IntegerField):
+    # Nhận id thuốc khi ghi (được PrescriptionSerializer tra cứu một lần cho cả đơn), trả về thông tin thuốc khi đọc
+    def to_representation(self, value):
+        return MedicineSerializer(value).data
+
+
 class PrescriptionDetailSerializer(serializers.ModelSerializer):
-    medicine = MedicineSerializer(read_only=True)
+    medicine = MedicineIdField()
 
     class Meta:
         model = PrescriptionDetail
@@ -202,7 +204,7 @@ class PrescriptionDetailSerializer(serializers.ModelSerializer):
 
 
 class PrescriptionSerializer(serializers.ModelSerializer):
-    prescription_details = PrescriptionDetailSerializer(many=True, read_only=True)
+    prescription_details = PrescriptionDetailSerializer(many=True)
     patient = MyUserListSerializer(read_only=True)
     doctor = MyUserListSerializer(read_only=True)
 
@@ -227,11 +229,28 @@ class PrescriptionSerializer(serializers.ModelSerializer):
             'appointment': {
                 'required': True
             },
-            'prescription_details': {
-                'required': True
-            },
         }
 
+    def validate_prescription_details(self, value):
+        medicine_ids = {detail['medicine'] for detail in value}
+        medicines = Medicine.objects.filter(active=True).in_bulk(medicine_ids)
+        missing = medicine_ids - medicines.keys()
+        if missing:
+            raise serializers.ValidationError(f'Invalid medicine: {", ".join(map(str, sorted(missing)))}')
+        for detail in value:
+            detail['medicine'] = medicines[detail['medicine']]
+        return value
+
+    def create(self, validated_data):
+        details_data = validated_data.pop('prescription_details')
+        prescription = super().create(validated_data)
+        details = PrescriptionDetail.objects.bulk_create([
+            PrescriptionDetail(prescription=prescription, **detail) for detail in details_data
+        ])
+        # Gắn sẵn chi tiết vừa tạo để serializer.data không phải truy vấn lại
+        prescription._prefetched_objects_cache = {'prescription_details': details}
+        return prescription
+
 
 class PrescriptionListSerializer(serializers.ModelSerializer):
     patient = MyUserListSerializer(read_only=True)
@@ -297,10 +316,7 @@ class InvoiceSerializer(serializers.ModelSerializer):
         validated_data['created_by'] = self.context['request'].user
         validated_data['status'] = 'pending'
         validated_data['patient'] = validated_data['appointment'].patient
-        if Prescription.objects.filter(appointment=validated_data['appointment']).exists():
-            validated_data['prescription'] = Prescription.objects.get(appointment=validated_data['appointment'])
-        else:
-            validated_data['prescription'] = None
+        validated_data['prescription'] = Prescription.objects.filter(appointment=validated_data['appointment']).first()
 
         return super().create(validated_data)
 
@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from .models import ShiftCalendar, WorkSchedule
+
+SHIFT_CALENDAR_BATCH_SIZE = 1000
+
+
+def schedule_days(schedule, shift_ids):
+    if not schedule.active or schedule.from_date is None or schedule.to_date is None:
+        return set()
+    days = (schedule.to_date - schedule.from_date).days + 1
+    return {(schedule.from_date + timedelta(days=i), shift_id) for i in range(days) for shift_id in shift_ids}
+
+
+# Đồng bộ các ngày làm việc của một lịch làm việc với khoảng ngày, ca và trạng thái hiện tại:
+# chỉ xoá các ngày/ca không còn và thêm các ngày/ca mới, không sinh lại cả lịch
+def sync_schedule(schedule):
+    schedule_id = schedule.pk
+    wanted = schedule_days(schedule, list(schedule.shift.values_list('id', flat=True)))
+    existing = {(day, shift_id): row_id for row_id, day, shift_id in
+                ShiftCalendar.objects.filter(work_schedule_id=schedule_id).values_list('id', 'date', 'shift_id')}
+
+    stale = [row_id for key, row_id in existing.items() if key not in wanted]
+    if stale:
+        ShiftCalendar.objects.filter(id__in=stale).delete()
+    ShiftCalendar.objects.filter(work_schedule_id=schedule_id).exclude(employee_id=schedule.employee_id) \
+        .update(employee_id=schedule.employee_id)
+    ShiftCalendar.objects.bulk_create([
+        ShiftCalendar(employee_id=schedule.employee_id, date=day, shift_id=shift_id, work_schedule_id=schedule_id)
+        for day, shift_id in sorted(wanted - existing.keys())
+    ], batch_size=SHIFT_CALENDAR_BATCH_SIZE)
+
+
+def sync_schedules(schedule_ids):
+    for schedule in WorkSchedule.objects.filter(pk__in=schedule_ids):
+        sync_schedule(schedule)
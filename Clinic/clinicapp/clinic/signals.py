@@ -0,0 +1,210 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from oauth2_provider.models import AccessToken
+
+from . import archive, shift_calendar, slots, stats
+from .directory import invalidate_directory
+from .events import publish_appointment_event
+from .oauth2 import invalidate_access_token, invalidate_user_tokens
+from .search import invalidate_medicine_index
+from .dao import change_appointment_count
+from .models import MyUser, Doctor, Appointment, Shift, WorkSchedule, Medicine, Invoice
+from .perms import invalidate_user_roles
+
+
+def held_slot(appointment):
+    if appointment.doctor_id and appointment.status in Appointment.active_statuses:
+        return appointment.doctor_id, appointment.date, appointment.time
+    return None
+
+
+def counted_day(appointment):
+    return appointment.date if appointment.status != 'cancelled' else None
+
+
+# Ghi nhớ trạng thái lúc nạp để biết lịch hẹn đã thay đổi gì khi lưu
+@receiver(post_init, sender=Appointment)
+def remember_appointment(sender, instance, **kwargs):
+    instance._original_slot = held_slot(instance)
+    instance._original_day = counted_day(instance)
+    instance._original_stat = stats.appointment_stat_key(instance)
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, created, **kwargs):
+    previous = None if created else instance._original_slot
+    current = held_slot(instance)
+    if previous != current:
+        doctor_ids = [slot[0] for slot in (previous, current) if slot]
+        transaction.on_commit(partial(slots.invalidate, *doctor_ids))
+    instance._original_slot = current
+
+    previous_day = None if created else instance._original_day
+    current_day = counted_day(instance)
+    if previous_day != current_day:
+        if previous_day:
+            change_appointment_count(previous_day, -1)
+        if current_day:
+            change_appointment_count(current_day, 1)
+    instance._original_day = current_day
+
+    current_stat = stats.appointment_stat_key(instance)
+    previous_status = instance._original_stat[2]
+    stats.apply_appointment_change(None if created else instance._original_stat, current_stat)
+    instance._original_stat = current_stat
+
+    if created:
+        publish_appointment_event(instance, 'created')
+    elif previous_status != instance.status:
+        publish_appointment_event(instance, 'status_changed', previous_status)
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, **kwargs):
+    if archive.is_archiving():
+        return
+    if instance._original_slot:
+        transaction.on_commit(partial(slots.invalidate, instance._original_slot[0]))
+    if instance._original_day:
+        change_appointment_count(instance._original_day, -1)
+    stats.apply_appointment_change(instance._original_stat, None)
+
+
+@receiver(post_init, sender=Invoice)
+def remember_invoice(sender, instance, **kwargs):
+    instance._original_stat = stats.revenue_stat_key(instance)
+
+
+@receiver(post_save, sender=Invoice)
+def invoice_saved(sender, instance, created, **kwargs):
+    current = stats.revenue_stat_key(instance)
+    stats.apply_revenue_change(None if created else instance._original_stat, current)
+    instance._original_stat = current
+
+
+@receiver(post_delete, sender=Invoice)
+def invoice_deleted(sender, instance, **kwargs):
+    if archive.is_archiving():
+        return
+    stats.apply_revenue_change(instance._original_stat, None)
+
+
+@receiver(post_init, sender=MyUser)
+def remember_user(sender, instance, **kwargs):
+    instance._original_patient_day = stats.patient_stat_key(instance)
+    instance._original_role = instance.role
+    instance._original_avatar = str(instance.avatar) if instance.avatar else None
+
+
+@receiver(post_save, sender=MyUser)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    current = stats.patient_stat_key(instance)
+    stats.apply_patient_change(None if created else instance._original_patient_day, current)
+    instance._original_patient_day = current
+
+    # Đăng nhập chỉ cập nhật last_login, không ảnh hưởng danh mục bác sĩ và token đã cache
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    if not created:
+        invalidate_user_tokens(instance.pk)
+        transaction.on_commit(partial(invalidate_user_tokens, instance.pk))
+    if 'doctor' in (instance.role, instance._original_role):
+        transaction.on_commit(invalidate_directory)
+    instance._original_role = instance.role
+
+
+@receiver(post_delete, sender=MyUser)
+def user_deleted(sender, instance, **kwargs):
+    stats.apply_patient_change(instance._original_patient_day, None)
+    invalidate_user_tokens(instance.pk)
+    if instance._original_role == 'doctor':
+        transaction.on_commit(invalidate_directory)
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def doctor_changed(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_directory)
+
+
+@receiver(post_init, sender=WorkSchedule)
+def remember_work_schedule(sender, instance, **kwargs):
+    instance._original_employee_id = instance.employee_id
+
+
+# Lịch theo ngày được cập nhật trong cùng transaction với lịch làm việc, xoá lịch thì các ngày bị xoá theo (CASCADE)
+@receiver(post_save, sender=WorkSchedule)
+def work_schedule_saved(sender, instance, **kwargs):
+    shift_calendar.sync_schedule(instance)
+
+
+@receiver(post_save, sender=WorkSchedule)
+@receiver(post_delete, sender=WorkSchedule)
+def work_schedule_changed(sender, instance, **kwargs):
+    employee_ids = {instance.employee_id, instance._original_employee_id} - {None}
+    transaction.on_commit(partial(slots.invalidate, *employee_ids))
+    instance._original_employee_id = instance.employee_id
+
+
+@receiver(m2m_changed, sender=WorkSchedule.shift.through)
+def work_schedule_shifts_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+    if action == 'pre_clear':
+        # Sau khi xoá hết quan hệ thì không còn biết ca này thuộc những lịch nào
+        if reverse:
+            schedules = WorkSchedule.objects.filter(shift=instance)
+            instance._cleared_schedule_ids = list(schedules.values_list('pk', flat=True))
+        return
+    if not reverse:
+        schedule_ids = [instance.pk]
+    elif action == 'post_clear':
+        schedule_ids = instance.__dict__.pop('_cleared_schedule_ids', [])
+    else:
+        schedule_ids = pk_set
+    shift_calendar.sync_schedules(schedule_ids)
+    employee_ids = set(WorkSchedule.objects.filter(pk__in=schedule_ids).values_list('employee_id', flat=True))
+    if employee_ids:
+        transaction.on_commit(partial(slots.invalidate, *employee_ids))
+
+
+@receiver(post_save, sender=Shift)
+@receiver(pre_delete, sender=Shift)
+def shift_changed(sender, instance, **kwargs):
+    employee_ids = set(WorkSchedule.objects.filter(shift=instance).values_list('employee_id', flat=True))
+    if employee_ids:
+        transaction.on_commit(partial(slots.invalidate, *employee_ids))
+
+
+@receiver(m2m_changed, sender=MyUser.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+    if not reverse:
+        user_ids = [instance.pk]
+        instance.__dict__.pop('_cached_roles', None)
+    elif action == 'pre_clear':
+        user_ids = list(instance.user_set.values_list('pk', flat=True))
+    else:
+        user_ids = list(pk_set or [])
+    if user_ids:
+        invalidate_user_roles(*user_ids)
+        transaction.on_commit(partial(invalidate_user_roles, *user_ids))
+
+
+@receiver(post_save, sender=Medicine)
+@receiver(post_delete, sender=Medicine)
+def medicine_changed(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_medicine_index)
+
+
+# Token bị thu hồi (revoke() xoá dòng) hoặc thay đổi hạn/scope phải bị loại khỏi cache xác thực
+@receiver(post_save, sender=AccessToken)
+@receiver(post_delete, sender=AccessToken)
+def access_token_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        invalidate_access_token(instance.token, instance.user_id)
+        transaction.on_commit(partial(invalidate_access_token, instance.token, instance.user_id))
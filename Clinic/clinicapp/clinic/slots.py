@@ -0,0 +1,201 @@
+import time as _time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Appointment, ShiftCalendar
+
+# Mỗi bác sĩ/ngày được cache thành hai bitmap đánh theo phút trong ngày: `working` có bit ở mỗi phút
+# một khung 30 phút có thể bắt đầu, `booked` có bit ở mỗi phút đã có lịch hẹn còn hiệu lực giữ chỗ.
+# Khoá cache gắn với version của bác sĩ; mọi thay đổi chỉ tăng version (cache.incr, nguyên tử trên cache
+# dùng chung) chứ không sửa bitmap, nên nhiều worker không ghi đè nhau và bitmap cũ không được dùng lại.
+SLOT_MINUTES = 30
+SLOT_CACHE_TIMEOUT = 10 * 60
+
+
+def minute_of(value):
+    return value.hour * 60 + value.minute
+
+
+def shift_mask(start_time, end_time):
+    mask = 0
+    current = minute_of(start_time)
+    end = minute_of(end_time)
+    while current + SLOT_MINUTES <= end:
+        mask |= 1 << current
+        current += SLOT_MINUTES
+    return mask
+
+
+def mask_to_times(mask):
+    times = []
+    while mask:
+        low = mask & -mask
+        minute = low.bit_length() - 1
+        times.append(f'{minute // 60:02d}:{minute % 60:02d}')
+        mask ^= low
+    return times
+
+
+# Ca làm việc theo ngày đọc từ lịch đã sinh sẵn (ShiftCalendar), một ngày chỉ cần so sánh bằng trên chỉ mục (employee, date).
+# Bitmap được cache nên luôn đọc từ primary, không dựng từ replica đang trễ.
+def calendar_queryset(doctor_ids, from_date, to_date):
+    days = {'date': from_date} if from_date == to_date else {'date__range': (from_date, to_date)}
+    return ShiftCalendar.objects.using(DEFAULT_DB_ALIAS).filter(employee_id__in=doctor_ids, **days) \
+        .values_list('employee_id', 'date', 'shift__start_time', 'shift__end_time')
+
+
+def booked_queryset(doctor_ids, from_date, to_date):
+    return Appointment.objects.using(DEFAULT_DB_ALIAS).filter(
+        doctor_id__in=doctor_ids,
+        date__range=(from_date, to_date),
+        status__in=Appointment.active_statuses
+    ).values_list('doctor_id', 'date', 'time')
+
+
+def fold_masks(doctor_ids, from_date, to_date, calendar_days, booked_appointments):
+    days = [from_date + timedelta(days=i) for i in range((to_date - from_date).days + 1)]
+    masks = {(doctor_id, day): [0, 0] for doctor_id in doctor_ids for day in days}
+
+    for doctor_id, day, start_time, end_time in calendar_days:
+        masks[(doctor_id, day)][0] |= shift_mask(start_time, end_time)
+
+    for doctor_id, day, time in booked_appointments:
+        masks[(doctor_id, day)][1] |= 1 << minute_of(time)
+
+    return {key: tuple(value) for key, value in masks.items()}
+
+
+# Tính bitmap (working, booked) cho mọi bác sĩ/ngày trong khoảng, chỉ với 2 câu truy vấn
+def build_masks(doctor_ids, from_date, to_date):
+    return fold_masks(doctor_ids, from_date, to_date, calendar_queryset(doctor_ids, from_date, to_date),
+                      booked_queryset(doctor_ids, from_date, to_date))
+
+
+async def abuild_masks(doctor_ids, from_date, to_date):
+    calendar_days = [row async for row in calendar_queryset(doctor_ids, from_date, to_date)]
+    booked_appointments = [row async for row in booked_queryset(doctor_ids, from_date, to_date)]
+    return fold_masks(doctor_ids, from_date, to_date, calendar_days, booked_appointments)
+
+
+def _version_key(doctor_id):
+    return f'slots:version:{doctor_id}'
+
+
+def _get_version(doctor_id):
+    version = cache.get(_version_key(doctor_id))
+    if version is None:
+        version = _time.time_ns()
+        if not cache.add(_version_key(doctor_id), version, None):
+            version = cache.get(_version_key(doctor_id), version)
+    return version
+
+
+async def _aget_version(doctor_id):
+    version = await cache.aget(_version_key(doctor_id))
+    if version is None:
+        version = _time.time_ns()
+        if not await cache.aadd(_version_key(doctor_id), version, None):
+            version = await cache.aget(_version_key(doctor_id), version)
+    return version
+
+
+def _day_key(doctor_id, date, version):
+    return f'slots:{doctor_id}:{version}:{date.isoformat()}'
+
+
+def get_day(doctor_id, date):
+    key = _day_key(doctor_id, date, _get_version(doctor_id))
+    masks = cache.get(key)
+    if masks is None:
+        masks = build_masks([doctor_id], date, date)[(doctor_id, date)]
+        cache.set(key, masks, SLOT_CACHE_TIMEOUT)
+    return masks
+
+
+async def aget_day(doctor_id, date):
+    key = _day_key(doctor_id, date, await _aget_version(doctor_id))
+    masks = await cache.aget(key)
+    if masks is None:
+        masks = (await abuild_masks([doctor_id], date, date))[(doctor_id, date)]
+        await cache.aset(key, masks, SLOT_CACHE_TIMEOUT)
+    return masks
+
+
+# Đưa các bitmap đã tính sẵn (vd. từ build_masks) vào cache
+def store_days(masks):
+    versions = {}
+    entries = {}
+    for (doctor_id, date), value in masks.items():
+        if doctor_id not in versions:
+            versions[doctor_id] = _get_version(doctor_id)
+        entries[_day_key(doctor_id, date, versions[doctor_id])] = value
+    cache.set_many(entries, SLOT_CACHE_TIMEOUT)
+
+
+def window_mask(from_minute=0, to_minute=24 * 60):
+    return ((1 << to_minute) - 1) ^ ((1 << from_minute) - 1)
+
+
+# Tìm các khung giờ trống sớm nhất của nhiều bác sĩ trong nhiều ngày, tính một lần cho cả khoảng
+def find_earliest(doctor_ids, from_date, to_date, window=None, limit=20, skip_dates=()):
+    masks = build_masks(doctor_ids, from_date, to_date)
+    store_days(masks)
+
+    window = window_mask() if window is None else window
+    results = []
+    day = from_date
+    while day <= to_date and len(results) < limit:
+        if day not in skip_dates:
+            candidates = []
+            for doctor_id in doctor_ids:
+                working, booked = masks[(doctor_id, day)]
+                for slot_time in mask_to_times(working & ~booked & window):
+                    candidates.append((slot_time, doctor_id))
+            candidates.sort()
+            results.extend((day, slot_time, doctor_id) for slot_time, doctor_id in candidates[:limit - len(results)])
+        day += timedelta(days=1)
+    return results
+
+
+def available_slots(doctor_id, date):
+    working, booked = get_day(doctor_id, date)
+    return mask_to_times(working & ~booked)
+
+
+async def aavailable_slots(doctor_id, date):
+    working, booked = await aget_day(doctor_id, date)
+    return mask_to_times(working & ~booked)
+
+
+def is_slot_available(doctor_id, date, time):
+    working, booked = get_day(doctor_id, date)
+    bit = 1 << minute_of(time)
+    return bool(working & bit) and not booked & bit
+
+
+def is_working_slot(doctor_id, date, time):
+    working, booked = get_day(doctor_id, date)
+    return bool(working & 1 << minute_of(time))
+
+
+def is_slot_booked(doctor_id, date, time):
+    working, booked = get_day(doctor_id, date)
+    return bool(booked & 1 << minute_of(time))
+
+
+def _bump_version(doctor_id):
+    key = _version_key(doctor_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Version đã bị xoá khỏi cache: bắt đầu lại từ thời điểm hiện tại, lớn hơn mọi version cũ
+        if not cache.add(key, _time.time_ns(), None):
+            cache.incr(key)
+
+
+# Gọi sau khi commit thay đổi lịch hẹn/lịch làm việc của bác sĩ: các ngày đã cache được tính lại ở lần đọc sau
+def invalidate(*doctor_ids):
+    for doctor_id in set(doctor_ids):
+        _bump_version(doctor_id)
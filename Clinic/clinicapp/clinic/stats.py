@@ -0,0 +1,160 @@
+from datetime import date, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import DailyAppointmentStat, DailyRevenueStat, DailyPatientStat
+
+
+def local_date(value):
+    if value is None:
+        return None
+    if hasattr(value, 'tzinfo'):
+        return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+    return value
+
+
+def increment(model, lookup, **deltas):
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # Dòng vừa được tạo bởi request khác
+        model.objects.filter(**lookup).update(**updates)
+
+
+# Khoá thống kê của một lịch hẹn / hoá đơn; None nghĩa là không được tính
+def appointment_stat_key(appointment):
+    return appointment.date, appointment.doctor_id, appointment.status
+
+
+def revenue_stat_key(invoice):
+    if invoice.status != 'paid' or invoice.payment_date is None:
+        return None
+    return local_date(invoice.payment_date), invoice.payment_method or '', invoice.total
+
+
+def patient_stat_key(user):
+    return local_date(user.date_joined) if user.role == 'patient' else None
+
+
+# Dòng thống kê được tìm theo khoá duy nhất (doctor_key) và tạo kèm doctor
+def appointment_stat_lookup(day, doctor_id, status):
+    return {'date': day, 'doctor_key': doctor_id or 0, 'doctor_id': doctor_id, 'status': status}
+
+
+def apply_appointment_change(previous, current):
+    if previous == current:
+        return
+    if previous:
+        increment(DailyAppointmentStat, appointment_stat_lookup(*previous), total=-1)
+    if current:
+        increment(DailyAppointmentStat, appointment_stat_lookup(*current), total=1)
+
+
+# Áp dụng nhiều thay đổi cùng lúc: {(date, doctor_id, status): delta}
+def apply_appointment_deltas(deltas):
+    for key, delta in deltas.items():
+        if delta:
+            increment(DailyAppointmentStat, appointment_stat_lookup(*key), total=delta)
+
+
+def apply_revenue_change(previous, current):
+    if previous == current:
+        return
+    if previous:
+        increment(DailyRevenueStat, {'date': previous[0], 'payment_method': previous[1]},
+                  invoice_count=-1, revenue=-previous[2])
+    if current:
+        increment(DailyRevenueStat, {'date': current[0], 'payment_method': current[1]},
+                  invoice_count=1, revenue=current[2])
+
+
+def apply_patient_change(previous, current):
+    if previous == current:
+        return
+    if previous:
+        increment(DailyPatientStat, {'date': previous}, new_patients=-1)
+    if current:
+        increment(DailyPatientStat, {'date': current}, new_patients=1)
+
+
+def get_period_range(period, year, number=None):
+    if period == 'year':
+        return date(year, 1, 1), date(year, 12, 31)
+    if period == 'quarter':
+        first_month = (number - 1) * 3 + 1
+        start = date(year, first_month, 1)
+    elif period == 'month':
+        first_month = number
+        start = date(year, number, 1)
+    else:
+        raise ValueError('Invalid period')
+    months = 3 if period == 'quarter' else 1
+    next_month = first_month + months
+    end = date(year + (next_month - 1) // 12, (next_month - 1) % 12 + 1, 1) - timedelta(days=1)
+    return start, end
+
+
+# Chuỗi theo ngày cho tháng, theo tháng cho quý/năm
+def series(queryset, period, **sums):
+    if period == 'month':
+        rows = queryset.values('date').annotate(**{name: Sum(field) for name, field in sums.items()}).order_by('date')
+        return [{'date': row['date'], **{name: row[name] for name in sums}} for row in rows]
+    rows = queryset.annotate(month=TruncMonth('date')).values('month') \
+        .annotate(**{name: Sum(field) for name, field in sums.items()}).order_by('month')
+    return [{'month': row['month'].strftime('%Y-%m'), **{name: row[name] for name in sums}} for row in rows]
+
+
+def appointment_stats(from_date, to_date, period):
+    stats = DailyAppointmentStat.objects.filter(date__range=(from_date, to_date), total__gt=0)
+    by_status = {row['status']: row['total'] for row in stats.values('status').annotate(total=Sum('total'))}
+    by_doctor = [
+        {'doctor': row['doctor'], 'fullname': row['doctor__fullname'], 'total': row['total']}
+        for row in stats.values('doctor', 'doctor__fullname').annotate(total=Sum('total')).order_by('-total')
+    ]
+    by_speciality = [
+        {'speciality': row['doctor__doctor__speciality'], 'total': row['total']}
+        for row in stats.values('doctor__doctor__speciality').annotate(total=Sum('total')).order_by('-total')
+    ]
+    return {
+        'from_date': from_date,
+        'to_date': to_date,
+        'total': sum(by_status.values()),
+        'by_status': by_status,
+        'by_doctor': by_doctor,
+        'by_speciality': by_speciality,
+        'series': series(stats, period, total='total'),
+    }
+
+
+def revenue_stats(from_date, to_date, period):
+    stats = DailyRevenueStat.objects.filter(date__range=(from_date, to_date))
+    by_payment_method = [
+        {'payment_method': row['payment_method'] or None, 'invoice_count': row['invoice_count'], 'revenue': row['revenue']}
+        for row in stats.values('payment_method')
+        .annotate(invoice_count=Sum('invoice_count'), revenue=Sum('revenue')).order_by('payment_method')
+    ]
+    return {
+        'from_date': from_date,
+        'to_date': to_date,
+        'invoice_count': sum(row['invoice_count'] for row in by_payment_method),
+        'revenue': sum((row['revenue'] for row in by_payment_method), 0),
+        'by_payment_method': by_payment_method,
+        'series': series(stats, period, invoice_count='invoice_count', revenue='revenue'),
+    }
+
+
+def patient_stats(from_date, to_date, period):
+    stats = DailyPatientStat.objects.filter(date__range=(from_date, to_date))
+    return {
+        'from_date': from_date,
+        'to_date': to_date,
+        'new_patients': stats.aggregate(total=Sum('new_patients'))['total'] or 0,
+        'series': series(stats, period, new_patients='new_patients'),
+    }
@@ -1,3 +1,1294 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import uuid
+import zipfile
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+from xml.etree import ElementTree
+
+import cloudinary
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.test import LiveServerTestCase, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+from PIL import Image
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import BaseSerializer
+from rest_framework.test import APIClient
+
+from .fast_serializers import (
+    fast_user_list, fast_doctor_list, fast_appointment_list, fast_prescription_list, fast_invoice_list
+)
+from . import archive, dao, db_router, events, exports, metrics, oauth2, search, slots, views
+from .db_router import PrimaryReplicaRouter
+from .models import (
+    MyUser, Doctor, Appointment, Medicine, Prescription, PrescriptionDetail, Invoice, Shift, WorkSchedule, ShiftCalendar,
+    DailyAppointmentCount, DailyAppointmentStat, DailyRevenueStat, EmailOutbox,
+    ArchivedAppointment, ArchivedPrescription, ArchivedPrescriptionDetail, ArchivedInvoice
+)
+from .perms import IsNurse, IsPatient
+from .serializers import DoctorListSerializer, MyUserSerializer
+
 
 # Create your tests here.
+class ClinicTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        groups = {name: Group.objects.create(name=name) for name in ('admin', 'doctor', 'nurse', 'patient')}
+
+        def create_user(username, role):
+            user = MyUser.objects.create(username=username, fullname=username, email=f'{username}@clinic.vn', role=role)
+            user.groups.add(groups[role])
+            return user
+
+        cls.admin = create_user('admin', 'admin')
+        cls.nurse = create_user('nurse', 'nurse')
+        cls.patient = create_user('patient', 'patient')
+        cls.doctors = [create_user(f'doctor{i}', 'doctor') for i in range(3)]
+        for doctor in cls.doctors:
+            Doctor.objects.create(user=doctor, speciality='Nội khoa')
+        cls.medicine = Medicine.objects.create(name='Paracetamol', unit='Viên')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def create_records(self, count):
+        for i in range(count):
+            appointment = Appointment.objects.create(
+                patient=self.patient,
+                doctor=self.doctors[i % len(self.doctors)],
+                nurse=self.nurse,
+                date=date.today() - timedelta(days=i + 1),
+                time=time(8),
+                status='exam_completed'
+            )
+            prescription = Prescription.objects.create(
+                appointment=appointment,
+                patient=self.patient,
+                doctor=appointment.doctor,
+                diagnosis='Cảm cúm',
+                days_supply=3,
+                advice='Nghỉ ngơi'
+            )
+            PrescriptionDetail.objects.create(prescription=prescription, medicine=self.medicine, quantity=6)
+            Invoice.objects.create(
+                appointment=appointment,
+                patient=self.patient,
+                created_by=self.nurse,
+                prescription=prescription,
+                prescription_cost=Decimal('50000'),
+                examination_cost=Decimal('150000'),
+                total=Decimal('200000'),
+                status='pending'
+            )
+
+
+class QueryBudgetTestCase(ClinicTestCase):
+    # Số câu truy vấn tối đa cho mỗi endpoint, không phụ thuộc số dòng trên một trang.
+    # Quyền đã được cache (xem perms.get_user_roles) nên không tính vào budget.
+    QUERY_BUDGETS = {
+        'users-list': 2,  # COUNT + trang
+        'users-appointments': 1,  # trang theo con trỏ (kèm patient, doctor)
+        'users-prescriptions': 1,  # trang theo con trỏ (kèm patient, doctor)
+        'users-invoices': 1,  # trang theo con trỏ (kèm patient, created_by)
+        'doctors-list': 0,  # danh mục bác sĩ được cache (xem directory.py)
+        'doctors-detail': 0,
+        'doctors-introduce': 0,
+        'appointments-detail': 1,  # kèm patient, doctor, nurse
+        'prescriptions-detail': 2,  # đơn thuốc + chi tiết kèm thuốc
+        'invoices-detail': 1,  # kèm patient, created_by
+    }
+
+    def assertWithinBudget(self, name, user, url):
+        self.client.force_authenticate(user)
+        self.client.get(url)  # làm nóng cache quyền
+        with self.assertNumQueries(self.QUERY_BUDGETS[name]):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def assertListWithinBudget(self, name, user, url):
+        # Budget phải giữ nguyên dù trang có 1 dòng hay đầy trang
+        self.create_records(1)
+        self.assertWithinBudget(name, user, url)
+        self.create_records(10)
+        self.assertWithinBudget(name, user, url)
+
+    def test_users_list(self):
+        self.assertListWithinBudget('users-list', self.admin, '/users/')
+
+    def test_users_appointments(self):
+        self.assertListWithinBudget('users-appointments', self.nurse, '/users/appointments/')
+
+    def test_users_prescriptions(self):
+        self.assertListWithinBudget('users-prescriptions', self.patient, '/users/prescriptions/')
+
+    def test_users_invoices(self):
+        self.assertListWithinBudget('users-invoices', self.patient, '/users/invoices/')
+
+    def test_doctors_list(self):
+        self.assertListWithinBudget('doctors-list', self.patient, '/doctors/')
+
+    def test_doctors_detail(self):
+        doctor = self.doctors[0].doctor
+        self.assertWithinBudget('doctors-detail', self.patient, f'/doctors/{doctor.id}/')
+        self.assertWithinBudget('doctors-introduce', self.patient, f'/doctors/{doctor.id}/introduce/')
+
+    def test_appointments_detail(self):
+        self.create_records(1)
+        appointment = Appointment.objects.get()
+        self.assertWithinBudget('appointments-detail', self.patient, f'/appointments/{appointment.id}/')
+
+    def test_prescriptions_detail(self):
+        self.create_records(1)
+        prescription = Prescription.objects.get()
+        PrescriptionDetail.objects.create(prescription=prescription, medicine=self.medicine, quantity=3)
+        response = self.assertWithinBudget(
+            'prescriptions-detail', self.patient, f'/prescriptions/{prescription.id}/'
+        )
+        self.assertEqual(len(response.data['prescription_details']), 2)
+
+    def test_invoices_detail(self):
+        self.create_records(1)
+        invoice = Invoice.objects.get()
+        self.assertWithinBudget('invoices-detail', self.patient, f'/invoices/{invoice.id}/')
+
+
+class PrescriptionCreateTestCase(ClinicTestCase):
+    def setUp(self):
+        super().setUp()
+        self.appointment = Appointment.objects.create(patient=self.patient, doctor=self.doctors[0], nurse=self.nurse,
+                                                      date=date.today(), time=time(8), status='exam_completed')
+        self.vitamin = Medicine.objects.create(name='Vitamin C', unit='Viên')
+        self.client.force_authenticate(self.doctors[0])
+
+    def create(self, *medicine_ids):
+        return self.client.post('/prescriptions/', {
+            'appointment': self.appointment.id,
+            'diagnosis': 'Cảm cúm',
+            'days_supply': 3,
+            'advice': 'Nghỉ ngơi',
+            'prescription_details': [{'medicine': medicine_id, 'quantity': 6, 'morning_dose': 1, 'evening_dose': 1}
+                                     for medicine_id in medicine_ids]
+        }, format='json')
+
+    def test_create_with_details(self):
+        response = self.create(self.medicine.id, self.vitamin.id)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([detail['medicine']['id'] for detail in response.data['prescription_details']],
+                         [self.medicine.id, self.vitamin.id])
+        prescription = Prescription.objects.get()
+        self.assertEqual((prescription.patient, prescription.doctor), (self.patient, self.doctors[0]))
+        self.assertEqual(sorted(prescription.prescription_details.values_list('medicine_id', flat=True)),
+                         [self.medicine.id, self.vitamin.id])
+
+    def test_invalid_medicine_creates_nothing(self):
+        self.vitamin.active = False
+        self.vitamin.save()
+        response = self.create(self.medicine.id, self.vitamin.id, 999999)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(f'{self.vitamin.id}, 999999', str(response.data['prescription_details']))
+        self.assertFalse(Prescription.objects.exists())
+
+    def test_failed_detail_insert_rolls_back_prescription(self):
+        self.client.raise_request_exception = False
+        with mock.patch.object(PrescriptionDetail.objects, 'bulk_create', side_effect=IntegrityError):
+            response = self.create(self.medicine.id)
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(Prescription.objects.exists())
+        self.assertEqual(self.create(self.medicine.id).status_code, 201)
+
+
+class CursorPaginationTestCase(ClinicTestCase):
+    def test_appointments_pages(self):
+        self.create_records(12)
+        self.client.force_authenticate(self.nurse)
+
+        response = self.client.get('/users/appointments/', {'page_size': 5, 'with_total': 'true'})
+        self.assertEqual(response.data['count'], 12)
+        dates = [item['date'] for item in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            dates += [item['date'] for item in response.data['results']]
+
+        self.assertEqual(dates, sorted({str(date.today() - timedelta(days=i + 1)) for i in range(12)}, reverse=True))
+
+    def walk(self, url, **params):
+        response = self.client.get(url, params)
+        pages = [[item['id'] for item in response.data['results']]]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            self.assertEqual(response.status_code, 200)
+            pages.append([item['id'] for item in response.data['results']])
+        previous_pages = [pages[-1]]
+        while response.data['previous']:
+            response = self.client.get(response.data['previous'])
+            previous_pages.insert(0, [item['id'] for item in response.data['results']])
+        self.assertEqual(previous_pages, pages)
+        return [item for page in pages for item in page]
+
+    def test_same_day_appointments_are_not_skipped(self):
+        # Nhiều lịch hẹn trùng ngày, trùng giờ: con trỏ phải phân biệt theo cả (date, time, id)
+        day = date.today()
+        ids = [Appointment.objects.create(patient=self.patient, doctor=doctor, date=day, time=time(hour),
+                                          status='exam_completed').id
+               for hour in (8, 9) for doctor in self.doctors]
+        self.client.force_authenticate(self.nurse)
+        expected = sorted(ids, key=lambda i: (-Appointment.objects.get(pk=i).time.hour, -i))
+        self.assertEqual(self.walk('/users/appointments/', page_size=2), expected)
+
+    def test_null_created_date(self):
+        self.create_records(5)
+        ids = list(Prescription.objects.order_by('id').values_list('id', flat=True))
+        Prescription.objects.filter(id__in=ids[1:3]).update(created_date=None)
+        self.client.force_authenticate(self.patient)
+        # DESC trên MySQL/SQLite: NULL đứng cuối
+        expected = sorted(ids[3:] + ids[:1], reverse=True) + sorted(ids[1:3], reverse=True)
+        self.assertEqual(self.walk('/users/prescriptions/', page_size=2), expected)
+
+    def test_invalid_cursor(self):
+        self.client.force_authenticate(self.patient)
+        response = self.client.get('/users/prescriptions/', {'cursor': 'cD0lNUIlMjJ4JTIyJTVE'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_size_is_bounded(self):
+        self.create_records(3)
+        self.client.force_authenticate(self.patient)
+        response = self.client.get('/users/invoices/', {'page_size': 10000})
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIsNone(response.data['next'])
+
+
+class DoctorDirectoryCacheTestCase(ClinicTestCase):
+    def test_conditional_get(self):
+        self.client.force_authenticate(self.patient)
+        url = f'/doctors/{self.doctors[0].doctor.id}/'
+        response = self.client.get(url)
+        self.assertIn('Last-Modified', response)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalidated_on_change(self):
+        self.client.force_authenticate(self.patient)
+        doctor = self.doctors[0]
+        response = self.client.get('/doctors/')
+        etag = response['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            doctor.fullname = 'Bác sĩ Minh'
+            doctor.save()
+
+        response = self.client.get('/doctors/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['user']['fullname'], 'Bác sĩ Minh')
+
+    def test_last_login_does_not_invalidate(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.doctors[0].save(update_fields=['last_login'])
+        self.assertEqual(callbacks, [])
+
+
+class FastListSerializerTestCase(ClinicTestCase):
+    def assertSameOutput(self, fast_serializer, queryset):
+        rows = fast_serializer.serialize(fast_serializer.get_queryset(queryset))
+        expected = fast_serializer.serializer_class(queryset, many=True).data
+        self.assertEqual(JSONRenderer().render(rows), JSONRenderer().render(expected))
+
+    def test_same_output_as_serializers(self):
+        self.create_records(3)
+        Appointment.objects.create(patient=self.patient, date=date.today(), time=time(9), status='pending_confirmation')
+        Invoice.objects.update(payment_method='e-Wallet', note=None)
+        self.doctors[0].avatar = 'image/upload/v1/avatar.jpg'
+        self.doctors[0].save()
+
+        self.assertSameOutput(fast_user_list, MyUser.objects.order_by('id'))
+        self.assertSameOutput(fast_doctor_list, Doctor.objects.select_related('user').order_by('id'))
+        self.assertSameOutput(fast_appointment_list, Appointment.objects.select_related('patient', 'doctor').order_by('id'))
+        self.assertSameOutput(fast_prescription_list, Prescription.objects.select_related('patient', 'doctor').order_by('id'))
+        self.assertSameOutput(fast_invoice_list, Invoice.objects.select_related('patient', 'created_by').order_by('id'))
+
+
+class AvatarTestCase(ClinicTestCase):
+    def test_cloudinary_urls(self):
+        doctor = self.doctors[0]
+        doctor.avatar = 'image/upload/v1/avatar.jpg'
+        doctor.save()
+        self.assertTrue(doctor.avatar_url.endswith('/image/upload/v1/avatar.jpg'))
+        self.assertIn('w_96', doctor.avatar_list_url)
+
+        self.client.force_authenticate(self.patient)
+        response = self.client.get('/doctors/')
+        self.assertEqual(response.data['results'][0]['user']['avatar'], doctor.avatar_list_url)
+        # Serialize lại không được gắn thêm tiền tố vào URL
+        self.assertEqual(DoctorListSerializer(doctor.doctor).data['user']['avatar'], doctor.avatar_list_url)
+        self.assertEqual(DoctorListSerializer(doctor.doctor).data['user']['avatar'], doctor.avatar_list_url)
+
+    def upload_avatar(self):
+        image = io.BytesIO()
+        Image.new('RGB', (1200, 800), 'red').save(image, format='PNG')
+        self.client.force_authenticate(self.patient)
+        response = self.client.patch('/users/update-profile/', {
+            'avatar': SimpleUploadedFile('me.png', image.getvalue(), content_type='image/png')
+        }, format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.patient.refresh_from_db()
+        self.assertEqual(response.data['avatar'], self.patient.avatar_detail_url)
+
+    def test_local_thumbnails(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(AVATAR_STORAGE='clinic.avatars.LocalAvatarStorage', MEDIA_ROOT=media_root):
+            self.upload_avatar()
+
+        for url, size in ((self.patient.avatar_list_url, 96), (self.patient.avatar_detail_url, 320)):
+            self.assertTrue(url.startswith(settings.MEDIA_URL))
+            with Image.open(f'{media_root}/{url.removeprefix(settings.MEDIA_URL)}') as image:
+                self.assertEqual(image.size, (size, size))
+
+    def test_cloudinary_thumbnails(self):
+        uploaded = cloudinary.CloudinaryResource('avatar', format='jpg', version='1', type='upload',
+                                                 resource_type='image')
+        with mock.patch('clinic.avatars.uploader.upload_resource', return_value=uploaded) as upload:
+            self.upload_avatar()
+
+        # Các bản thu nhỏ được yêu cầu sinh sẵn khi tải lên, URL trỏ đúng phép biến đổi đó
+        eager = upload.call_args.kwargs['eager']
+        self.assertEqual([transformation['width'] for transformation in eager], [96, 320])
+        self.assertIn('w_96', self.patient.avatar_list_url)
+        self.assertIn('w_320', self.patient.avatar_detail_url)
+        self.assertTrue(self.patient.avatar_url.endswith('/image/upload/v1/avatar.jpg'))
+
+    def test_admin_and_media_urls_render(self):
+        self.assertNotEqual(settings.MEDIA_URL, settings.STATIC_URL)
+        response = self.client.get('/admin/login/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, settings.STATIC_URL)
+
+
+class BulkAppointmentStatusTestCase(ClinicTestCase):
+    def create_appointments(self, count, status='pending_confirmation'):
+        return [
+            Appointment.objects.create(
+                patient=self.patient, doctor=self.doctors[0], date=date.today() + timedelta(days=1),
+                time=time(8 + i), status=status
+            )
+            for i in range(count)
+        ]
+
+    def test_bulk_confirm(self):
+        appointments = self.create_appointments(3)
+        done = self.create_appointments(1, status='exam_completed')[0]
+        self.client.force_authenticate(self.nurse)
+
+        # Số truy vấn không phụ thuộc số lịch hẹn: khoá + một UPDATE + thống kê + nạp lại + một INSERT email
+        with self.assertNumQueries(13):
+            response = self.client.post('/appointments/bulk-confirm/', {
+                'ids': [appointment.id for appointment in appointments] + [done.id, 999999]
+            }, format='json')
+
+        self.assertEqual(response.data['updated'], 3)
+        results = {result['id']: result for result in response.data['results']}
+        self.assertFalse(results[done.id]['success'])
+        self.assertEqual(results[999999]['error'], 'Appointment not found')
+        self.assertEqual(Appointment.objects.filter(status='confirmed', nurse=self.nurse).count(), 3)
+        self.assertEqual(EmailOutbox.objects.count(), 3)
+        self.assertEqual(DailyAppointmentStat.objects.get(status='confirmed').total, 3)
+
+    def test_bulk_cancel_releases_slots(self):
+        appointment = self.create_appointments(2)[0]
+        day = appointment.date
+        self.client.force_authenticate(self.nurse)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/appointments/bulk-cancel/', {
+                'date': str(day), 'doctor': self.doctors[0].id, 'cancellation_reason': 'Bác sĩ nghỉ'
+            }, format='json')
+
+        self.assertEqual(response.data['updated'], 2)
+        self.assertFalse(slots.is_slot_booked(self.doctors[0].id, day, appointment.time))
+        self.assertEqual(DailyAppointmentCount.objects.get(date=day).total, 0)
+        # Khung giờ đã được giải phóng nên có thể đặt lại
+        Appointment.objects.create(patient=self.patient, doctor=self.doctors[0], date=day, time=appointment.time,
+                                   status='pending_confirmation')
+
+    def test_patients_cannot_bulk_cancel(self):
+        self.client.force_authenticate(self.patient)
+        response = self.client.post('/appointments/bulk-cancel/', {'ids': [1]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class AppointmentEventsTestCase(ClinicTestCase):
+    def create_token(self, user):
+        return AccessToken.objects.create(
+            user=user, token=uuid.uuid4().hex, expires=timezone.now() + timedelta(hours=1), scope='read write'
+        ).token
+
+    async def read_event(self, stream):
+        while True:
+            chunk = await asyncio.wait_for(anext(stream), 1)
+            if chunk.startswith(b'event:'):
+                return json.loads(chunk.decode().split('data: ', 1)[1])
+
+    def create_ticket(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.create_token(user)}')
+        return client.post('/users/event-ticket/')
+
+    async def test_nurse_receives_created_and_status_events(self):
+        ticket = (await sync_to_async(self.create_ticket)(self.nurse)).data['ticket']
+        response = await self.async_client.get('/events/appointments/', {'ticket': ticket})
+        self.assertEqual(response.status_code, 200)
+        stream = aiter(response.streaming_content)
+        await anext(stream)  # retry
+
+        def book_and_confirm():
+            with self.captureOnCommitCallbacks(execute=True):
+                appointment = Appointment.objects.create(
+                    patient=self.patient, doctor=self.doctors[0], date=date.today() + timedelta(days=1), time=time(9),
+                    status='pending_confirmation'
+                )
+            with self.captureOnCommitCallbacks(execute=True):
+                appointment.status = 'confirmed'
+                appointment.save()
+
+        await sync_to_async(book_and_confirm)()
+        created = await self.read_event(stream)
+        changed = await self.read_event(stream)
+        await stream.aclose()
+
+        self.assertEqual(created['type'], 'created')
+        self.assertEqual(changed['previous_status'], 'pending_confirmation')
+        self.assertEqual(changed['appointment']['status'], 'confirmed')
+
+    async def test_patients_cannot_subscribe(self):
+        token = await sync_to_async(self.create_token)(self.patient)
+        response = await self.async_client.get('/events/appointments/', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 403)
+        response = await self.async_client.get('/events/appointments/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_ticket_is_single_use(self):
+        self.assertEqual(self.create_ticket(self.patient).status_code, 403)
+        response = self.create_ticket(self.doctors[0])
+        self.assertEqual(response.status_code, 201)
+        request = RequestFactory().get('/events/appointments/', {'ticket': response.data['ticket']})
+
+        user, channels = views.authenticate_event_stream(request)
+        self.assertEqual((user, channels), (self.doctors[0], [events.doctor_channel(self.doctors[0].id)]))
+        with self.assertRaises(AuthenticationFailed):
+            views.authenticate_event_stream(request)
+
+    async def test_access_token_in_url_is_rejected(self):
+        token = await sync_to_async(self.create_token)(self.nurse)
+        response = await self.async_client.get('/events/appointments/', {'access_token': token})
+        self.assertEqual(response.status_code, 401)
+
+    def test_broker_interface(self):
+        self.assertRaises(TypeError, events.Broker)
+        self.assertTrue(issubclass(events.LocalBroker, events.Broker))
+
+
+
+class MedicineSearchTestCase(ClinicTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cough = Medicine.objects.create(name='Thuốc ho Bảo Thanh', unit='Chai')
+        self.client.force_authenticate(self.patient)
+
+    def find(self, kw, **params):
+        return self.client.get('/medicines/find/', {'kw': kw, **params})
+
+    def test_prefix_match_without_diacritics(self):
+        response = self.find('thuoc ho')
+        self.assertEqual([item['id'] for item in response.data['results']], [self.cough.id])
+        response = self.find('para')
+        self.assertEqual([item['name'] for item in response.data['results']], ['Paracetamol'])
+
+    def test_trigram_match_for_typos(self):
+        response = self.find('paracetamon')
+        self.assertEqual([item['id'] for item in response.data['results']], [self.medicine.id])
+
+    def test_count_covers_all_results(self):
+        # Nhiều hơn một trang và hơn 100 kết quả: count không bị cắt trước khi phân trang
+        vitamins = Medicine.objects.bulk_create(Medicine(name=f'Vitamin C {i}', unit='Viên') for i in range(105))
+        search.invalidate_medicine_index()
+        response = self.find('vitamin', page=21)
+        self.assertEqual(response.data['count'], 105)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(response.data['next'])
+        self.assertEqual({item['id'] for item in response.data['results']} - {m.id for m in vitamins}, set())
+
+    def test_missing_kw(self):
+        self.assertEqual(self.client.get('/medicines/find/').status_code, 400)
+        self.assertEqual(self.find('  ').status_code, 400)
+
+    def test_index_is_rebuilt_on_save(self):
+        self.assertEqual(self.find('siro').data['count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cough.name = 'Siro ho Bảo Thanh'
+            self.cough.save()
+        self.assertEqual([item['id'] for item in self.find('siro').data['results']], [self.cough.id])
+        self.assertEqual(self.find('thuoc ho').data['count'], 0)
+
+
+class SlotCacheTestCase(ClinicTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = self.doctors[0]
+        self.day = date.today() + timedelta(days=1)
+        schedule = WorkSchedule.objects.create(employee=self.doctor, from_date=self.day, to_date=self.day)
+        schedule.shift.add(Shift.objects.create(start_time=time(7), end_time=time(9)))
+
+    def save(self, appointment, **changes):
+        with self.captureOnCommitCallbacks(execute=True):
+            for name, value in changes.items():
+                setattr(appointment, name, value)
+            appointment.save()
+        return appointment
+
+    def test_bitmap_follows_create_reschedule_and_cancel(self):
+        self.assertEqual(slots.available_slots(self.doctor.id, self.day), ['07:00', '07:30', '08:00', '08:30'])
+
+        appointment = self.save(Appointment(patient=self.patient, doctor=self.doctor, date=self.day, time=time(7, 30),
+                                            status='pending_confirmation'))
+        self.assertEqual(slots.available_slots(self.doctor.id, self.day), ['07:00', '08:00', '08:30'])
+        self.assertTrue(slots.is_slot_booked(self.doctor.id, self.day, time(7, 30)))
+
+        self.save(appointment, time=time(8))
+        self.assertEqual(slots.available_slots(self.doctor.id, self.day), ['07:00', '07:30', '08:30'])
+        self.assertFalse(slots.is_slot_available(self.doctor.id, self.day, time(8)))
+
+        self.save(appointment, status='cancelled')
+        self.assertEqual(slots.available_slots(self.doctor.id, self.day), ['07:00', '07:30', '08:00', '08:30'])
+
+    def test_invalidate_bumps_shared_version(self):
+        version = slots._get_version(self.doctor.id)
+        slots.invalidate(self.doctor.id, self.doctor.id)
+        self.assertEqual(slots._get_version(self.doctor.id), version + 1)
+        cache.delete(slots._version_key(self.doctor.id))
+        slots.invalidate(self.doctor.id)
+        self.assertGreater(slots._get_version(self.doctor.id), version + 1)
+
+
+class BookingTestCase(ClinicTestCase):
+    def setUp(self):
+        super().setUp()
+        self.day = date.today() + timedelta(days=1)
+        schedule = WorkSchedule.objects.create(employee=self.doctors[0], from_date=self.day, to_date=self.day)
+        schedule.shift.add(Shift.objects.create(start_time=time(7), end_time=time(9)))
+        self.client.force_authenticate(self.patient)
+
+    def book(self, slot='08:00'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/appointments/', {
+                'doctor': self.doctors[0].id, 'date': self.day.isoformat(), 'time': slot, 'description': 'Khám'
+            }, format='json')
+
+    def test_double_booking_returns_conflict(self):
+        self.assertEqual(self.book().status_code, 201)
+        self.assertEqual(self.book().status_code, 409)
+        # Ngoài ca làm việc vẫn là yêu cầu không hợp lệ
+        self.assertEqual(self.book('10:00').status_code, 400)
+
+        # Lượt đặt song song: bitmap trong cache còn trống nhưng ràng buộc unique chặn lại và rollback bộ đếm ngày
+        self.assertEqual(self.book('07:30').status_code, 201)
+        Appointment.objects.bulk_create([Appointment(patient=self.nurse, doctor=self.doctors[0], date=self.day,
+                                                     time=time(8, 30), status='pending_confirmation')])
+        self.assertEqual(self.book('08:30').status_code, 409)
+        self.assertEqual(DailyAppointmentCount.objects.get(date=self.day).total, 2)
+        self.assertEqual(Appointment.objects.filter(date=self.day, time=time(8, 30)).count(), 1)
+
+    def test_cancelled_slot_can_be_booked_again(self):
+        appointment_id = self.book().data['id']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/appointments/{appointment_id}/cancel/', {'cancellation_reason': 'Bận'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(Appointment.objects.get(pk=appointment_id).holds_slot)
+
+        response = self.book()
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Appointment.objects.get(pk=response.data['id']).holds_slot)
+
+    def test_day_cap_is_enforced(self):
+        self.assertEqual(self.book().status_code, 201)
+        self.assertEqual(DailyAppointmentCount.objects.get(date=self.day).total, 1)
+        DailyAppointmentCount.objects.filter(date=self.day).update(total=settings.MAX_APPOINTMENT_PER_DAY)
+
+        response = self.book('07:00')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Maximum appointment per day reached')
+        response = self.client.get(f'/doctors/{self.doctors[0].doctor.id}/time-slots/', {'date': self.day.isoformat()})
+        self.assertEqual(response.status_code, 400)
+
+    def test_count_is_kept_non_negative(self):
+        appointment_id = self.book().data['id']
+        # Bộ đếm lệch (vd. sau khi lưu trữ/xoá trực tiếp): huỷ lịch không được làm lỗi ràng buộc số không âm
+        DailyAppointmentCount.objects.filter(date=self.day).update(total=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/appointments/{appointment_id}/cancel/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(DailyAppointmentCount.objects.get(date=self.day).total, 0)
+
+
+class EmailOutboxTestCase(ClinicTestCase):
+    def setUp(self):
+        super().setUp()
+        dao.queue_email('Xác nhận', 'Nội dung', ['patient@clinic.vn'])
+        self.email = EmailOutbox.objects.get()
+
+    def test_queued_email_is_sent(self):
+        self.assertEqual(dao.send_queued_emails(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['patient@clinic.vn'])
+        self.email.refresh_from_db()
+        self.assertEqual((self.email.status, self.email.attempts), ('sent', 1))
+        self.assertIsNotNone(self.email.sent_date)
+        self.assertEqual(dao.send_queued_emails(), (0, 0))
+
+    @mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('SMTP down'))
+    def test_failures_back_off_then_fail(self, send_messages):
+        for attempt in range(1, dao.EMAIL_MAX_ATTEMPTS + 1):
+            before = timezone.now()
+            self.assertEqual(dao.send_queued_emails(), (0, 1))
+            self.email.refresh_from_db()
+            self.assertEqual(self.email.attempts, attempt)
+            self.assertEqual(self.email.last_error, 'SMTP down')
+            if attempt < dao.EMAIL_MAX_ATTEMPTS:
+                self.assertEqual(self.email.status, 'pending')
+                delay = self.email.next_attempt_date - before
+                self.assertGreaterEqual(delay, timedelta(seconds=dao.EMAIL_RETRY_DELAY * 2 ** (attempt - 1)))
+                # Chưa tới hạn thử lại thì không gửi
+                self.assertEqual(dao.send_queued_emails(), (0, 0))
+                EmailOutbox.objects.update(next_attempt_date=timezone.now())
+        self.assertEqual(self.email.status, 'failed')
+        self.assertEqual(send_messages.call_count, dao.EMAIL_MAX_ATTEMPTS)
+
+    def test_expired_lease_is_reclaimed(self):
+        EmailOutbox.objects.update(status='sending', next_attempt_date=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(dao.send_queued_emails(), (0, 0))
+        EmailOutbox.objects.update(next_attempt_date=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(dao.send_queued_emails(), (1, 0))
+        self.assertEqual(EmailOutbox.objects.get().status, 'sent')
+
+
+class AvailableSlotsTestCase(ClinicTestCase):
+    def setUp(self):
+        super().setUp()
+        self.day = date.today() + timedelta(days=1)
+        shift = Shift.objects.create(start_time=time(7), end_time=time(8))
+        self.doctors[2].doctor.speciality = 'Nhi khoa'
+        self.doctors[2].doctor.save()
+        for doctor in self.doctors:
+            schedule = WorkSchedule.objects.create(employee=doctor, from_date=self.day,
+                                                   to_date=self.day + timedelta(days=2))
+            schedule.shift.add(shift)
+        self.client.force_authenticate(self.patient)
+
+    def search(self, **params):
+        return self.client.get('/doctors/available-slots/', {'from_date': self.day.isoformat(), **params})
+
+    def test_filters_by_speciality_and_skips_full_days(self):
+        DailyAppointmentCount.objects.create(date=self.day, total=settings.MAX_APPOINTMENT_PER_DAY)
+        response = self.search(speciality='Nội khoa', to_date=(self.day + timedelta(days=1)).isoformat())
+        self.assertEqual(response.status_code, 200)
+        results = [(row['date'], row['time'], row['doctor']['user']['id']) for row in response.json()['available_slots']]
+        tomorrow = (self.day + timedelta(days=1)).isoformat()
+        self.assertEqual(results, [(tomorrow, '07:00', self.doctors[0].id), (tomorrow, '07:00', self.doctors[1].id),
+                                   (tomorrow, '07:30', self.doctors[0].id), (tomorrow, '07:30', self.doctors[1].id)])
+
+    def test_limit_and_validation(self):
+        response = self.search(speciality='Nội khoa', limit=3)
+        self.assertEqual(len(response.data['available_slots']), 3)
+        self.assertEqual({row['date'] for row in response.json()['available_slots']}, {self.day.isoformat()})
+
+        self.assertEqual(self.search(speciality='Không có').status_code, 400)
+        self.assertEqual(self.search(speciality='Nội khoa', limit='x').status_code, 400)
+        self.assertEqual(self.search(speciality='Nội khoa', to_date=(self.day + timedelta(days=40)).isoformat())
+                         .status_code, 400)
+
+
+class ShiftCalendarTestCase(ClinicTestCase):
+    def setUp(self):
+        super().setUp()
+        self.day = date.today() + timedelta(days=1)
+        self.morning = Shift.objects.create(start_time=time(7), end_time=time(8))
+        self.afternoon = Shift.objects.create(start_time=time(13), end_time=time(14))
+        self.schedule = WorkSchedule.objects.create(employee=self.doctors[0], from_date=self.day,
+                                                    to_date=self.day + timedelta(days=1))
+        self.schedule.shift.add(self.morning, self.afternoon)
+
+    def calendar(self):
+        return set(ShiftCalendar.objects.values_list('employee_id', 'date', 'shift_id'))
+
+    def test_follows_work_schedule_changes(self):
+        doctor, day = self.doctors[0].id, self.day
+        self.assertEqual(len(self.calendar()), 4)
+
+        self.schedule.to_date = day
+        self.schedule.save()
+        self.assertEqual(self.calendar(), {(doctor, day, self.morning.id), (doctor, day, self.afternoon.id)})
+
+        self.schedule.shift.remove(self.afternoon)
+        self.schedule.employee = self.doctors[1]
+        self.schedule.save()
+        self.assertEqual(self.calendar(), {(self.doctors[1].id, day, self.morning.id)})
+
+        self.morning.work_schedules.clear()
+        self.assertEqual(self.calendar(), set())
+        self.morning.work_schedules.add(self.schedule)
+        self.assertEqual(len(self.calendar()), 1)
+
+        self.schedule.active = False
+        self.schedule.save()
+        self.assertEqual(self.calendar(), set())
+        self.schedule.active = True
+        self.schedule.save()
+        self.schedule.delete()
+        self.assertEqual(self.calendar(), set())
+
+    def test_slots_read_from_calendar(self):
+        self.assertEqual(slots.available_slots(self.doctors[0].id, self.day), ['07:00', '07:30', '13:00', '13:30'])
+        cache.clear()
+        with self.assertNumQueries(2):
+            slots.build_masks([self.doctors[0].id], self.day, self.day)
+
+
+class AsyncDoctorViewsTestCase(ClinicTestCase):
+    def setUp(self):
+        super().setUp()
+        self.day = date.today() + timedelta(days=1)
+        schedule = WorkSchedule.objects.create(employee=self.doctors[0], from_date=self.day, to_date=self.day)
+        schedule.shift.add(Shift.objects.create(start_time=time(7), end_time=time(9)))
+        Appointment.objects.create(patient=self.patient, doctor=self.doctors[0], date=self.day, time=time(8),
+                                   status='confirmed')
+        self.token = AccessToken.objects.create(
+            user=self.patient, token=uuid.uuid4().hex, expires=timezone.now() + timedelta(hours=1), scope='read write'
+        ).token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    async def get(self, url, data=None, **extra):
+        return await self.async_client.get(url, data, AUTHORIZATION=f'Bearer {self.token}', **extra)
+
+    async def assertSameAsSync(self, path):
+        expected = await sync_to_async(self.client.get)(path)
+        response = await self.get(f'/async{path}')
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.json(), json.loads(expected.content))
+        return response
+
+    async def test_same_output_as_sync_views(self):
+        doctor_id = (await Doctor.objects.aget(user=self.doctors[0])).id
+        response = await self.assertSameAsSync(f'/doctors/{doctor_id}/time-slots/?date={self.day.isoformat()}')
+        self.assertEqual(response.json()['available_time_slots'], ['07:00', '07:30', '08:30'])
+        await self.assertSameAsSync(f'/doctors/{doctor_id}/time-slots/?date=2024-13-01')
+        await self.assertSameAsSync(f'/doctors/{doctor_id}/introduce/')
+        await self.assertSameAsSync('/doctors/999/introduce/')
+
+        for i in range(3, 6):
+            await Doctor.objects.acreate(user=await MyUser.objects.acreate(username=f'doctor{i}'), speciality='Nhi khoa')
+        response = await self.get('/async/doctors/', {'page': 2})
+        expected = await sync_to_async(self.client.get)('/doctors/', {'page': 2})
+        self.assertEqual(response.json()['results'], expected.json()['results'])
+        self.assertEqual(response.json()['count'], 6)
+        self.assertEqual(response.json()['previous'], 'http://testserver/async/doctors/')
+        response = await self.get('/async/doctors/', {'page': 3})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_conditional_get_and_authentication(self):
+        response = await self.get('/async/doctors/')
+        response = await self.get('/async/doctors/', IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = await self.async_client.get('/async/doctors/')
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.post('/async/doctors/', AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(response.status_code, 405)
+
+
+# Nạp clinicapp/asgi.py trong process riêng (settings đọc CLINIC_ASGI khi nạp), DEBUG bật để Django
+# ghi log mỗi middleware phải chuyển sang thread
+ASGI_CHAIN_SCRIPT = """
+import logging
+import clinicapp.asgi
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+logging.getLogger('django.request').setLevel(logging.DEBUG)
+logging.getLogger('django.request').addHandler(logging.StreamHandler())
+settings.DEBUG = True
+ASGIHandler()
+"""
+
+
+class ASGIMiddlewareTestCase(TestCase):
+    def test_asgi_chain_has_no_adapted_middleware(self):
+        env = {k: v for k, v in os.environ.items() if k != 'CLINIC_ASGI'}
+        result = subprocess.run([sys.executable, '-c', ASGI_CHAIN_SCRIPT], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True, check=True)
+        self.assertNotIn('adapted for middleware', result.stderr)
+        self.assertNotIn('debug_toolbar', result.stderr)
+
+
+class LoadTestCommandTestCase(LiveServerTestCase):
+    def test_reports_throughput(self):
+        Group.objects.create(name='patient').user_set.add(MyUser.objects.create(username='patient', role='patient'))
+        Doctor.objects.create(user=MyUser.objects.create(username='doctor', role='doctor'), speciality='Nội khoa')
+        for mode in ('sync', 'async'):
+            out = io.StringIO()
+            call_command('load_test', url=self.live_server_url, mode=mode, clients=4, duration=0.5, stdout=out)
+            self.assertIn('req/s per worker', out.getvalue())
+            self.assertNotIn('errors', out.getvalue())
+        self.assertFalse(AccessToken.objects.exists())
+
+
+class CachedTokenTestCase(ClinicTestCase):
+    def setUp(self):
+        super().setUp()
+        self.token = AccessToken.objects.create(
+            user=self.patient, token=uuid.uuid4().hex, expires=timezone.now() + timedelta(hours=1), scope='read write'
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token.token}')
+
+    def test_authentication_is_cached(self):
+        self.client.get('/users/profile/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/users/profile/')
+        self.assertEqual(response.data['id'], self.patient.id)
+
+    def test_revoked_token_is_rejected(self):
+        self.client.get('/users/profile/')
+        self.token.revoke()
+        self.assertEqual(self.client.get('/users/profile/').status_code, 401)
+
+    def test_revoked_token_is_rejected_by_other_processes(self):
+        self.client.get('/users/profile/')
+        entries = dict(oauth2._local_cache.entries)
+        self.token.revoke()
+        # LRU của process khác vẫn giữ token: dựng lại mục đã bị xoá trong process này
+        oauth2._local_cache.entries.update(entries)
+        self.assertEqual(self.client.get('/users/profile/').status_code, 401)
+
+    def test_user_changes_are_visible(self):
+        self.client.get('/users/profile/')
+        self.patient.fullname = 'Nguyễn Văn A'
+        self.patient.save()
+        self.assertEqual(self.client.get('/users/profile/').data['fullname'], 'Nguyễn Văn A')
+
+
+class RoleCacheTestCase(ClinicTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = MyUser.objects.create(username='staff', fullname='staff', email='staff@clinic.vn', role='patient')
+        self.user.groups.add(Group.objects.get(name='patient'))
+        token = AccessToken.objects.create(
+            user=self.user, token=uuid.uuid4().hex, expires=timezone.now() + timedelta(hours=1), scope='read write'
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token.token}')
+
+    def bulk_confirm(self):
+        return self.client.post('/appointments/bulk-confirm/', {'ids': []}, format='json')
+
+    def test_group_change_refreshes_cached_role(self):
+        self.assertEqual(self.bulk_confirm().status_code, 403)
+
+        # Đổi nhóm qua serializer (update-profile, trang quản trị cũng đổi qua groups.set)
+        serializer = MyUserSerializer(instance=MyUser.objects.get(pk=self.user.pk), data={'role': 'nurse'},
+                                      partial=True)
+        serializer.is_valid(raise_exception=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            serializer.save()
+        self.assertEqual(self.bulk_confirm().status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.set([Group.objects.get(name='patient')])
+        self.assertEqual(self.bulk_confirm().status_code, 403)
+
+    def test_roles_are_loaded_once_per_request(self):
+        request = RequestFactory().get('/')
+        request.user = MyUser.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            self.assertFalse(IsNurse().has_permission(request, None))
+            self.assertTrue(IsPatient().has_permission(request, None))
+
+        # Request sau đọc nhóm từ cache dùng chung
+        request.user = MyUser.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(IsPatient().has_permission(request, None))
+
+
+class StatsTestCase(ClinicTestCase):
+    def setUp(self):
+        super().setUp()
+        day = date(2025, 3, 10)
+        paid_date = timezone.make_aware(datetime(2025, 3, 10, 10))
+        for i, (doctor, payment_method) in enumerate([(self.doctors[0], 'Tiền mặt'), (self.doctors[0], 'e-Wallet'),
+                                                      (None, None), (None, None)]):
+            appointment = Appointment.objects.create(patient=self.patient, doctor=doctor, date=day, time=time(8 + i),
+                                                     status='exam_completed')
+            Invoice.objects.create(appointment=appointment, patient=self.patient, created_by=self.nurse,
+                                   prescription_cost=Decimal('50000'), examination_cost=Decimal('150000'),
+                                   total=Decimal('200000'), status='paid', payment_method=payment_method,
+                                   payment_date=paid_date)
+        MyUser.objects.create(username='new_patient', role='patient', date_joined=paid_date)
+
+    def get(self, kind, user=None, **params):
+        self.client.force_authenticate(user or self.admin)
+        return self.client.get(f'/stats/{kind}/', {'period': 'month', 'year': 2025, 'month': 3, **params})
+
+    def test_appointment_stats(self):
+        response = self.get('appointments')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total'], 4)
+        self.assertEqual(response.data['by_status'], {'exam_completed': 4})
+        self.assertEqual({row['doctor']: row['total'] for row in response.data['by_doctor']},
+                         {self.doctors[0].id: 2, None: 2})
+        self.assertEqual(response.data['series'], [{'date': date(2025, 3, 10), 'total': 4}])
+        # Lịch hẹn chưa có bác sĩ dùng chung một dòng thống kê
+        self.assertEqual(DailyAppointmentStat.objects.filter(doctor=None).count(), 1)
+
+    def test_revenue_stats(self):
+        response = self.get('revenue', period='quarter', quarter=1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['invoice_count'], 4)
+        self.assertEqual(response.data['revenue'], Decimal('800000'))
+        self.assertEqual({row['payment_method']: row['invoice_count'] for row in response.data['by_payment_method']},
+                         {None: 2, 'Tiền mặt': 1, 'e-Wallet': 1})
+        self.assertEqual(response.data['series'][0]['month'], '2025-03')
+
+    def test_patient_stats(self):
+        response = self.get('patients', period='year')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['new_patients'], 1)
+
+    def test_admin_only_and_invalid_period(self):
+        for kind in ('appointments', 'revenue', 'patients'):
+            self.assertEqual(self.get(kind, user=self.nurse).status_code, 403)
+            self.assertEqual(self.get(kind, month='x').status_code, 400)
+
+    def test_null_keys_are_unique(self):
+        for model, values in ((DailyAppointmentStat, {'doctor': None, 'status': 'confirmed'}),
+                              (DailyRevenueStat, {'payment_method': ''})):
+            model.objects.create(date=date(2025, 1, 1), **values)
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                model.objects.create(date=date(2025, 1, 1), **values)
+
+
+class ExportTestCase(ClinicTestCase):
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.localdate()
+        self.appointments = [
+            Appointment.objects.create(patient=self.patient, doctor=self.doctors[0], nurse=self.nurse, date=self.today,
+                                       time=time(8 + i), status='exam_completed')
+            for i in range(3)
+        ]
+        self.invoice = Invoice.objects.create(
+            appointment=self.appointments[0], patient=self.patient, created_by=self.nurse,
+            prescription_cost=Decimal('50000'), examination_cost=Decimal('150000'), total=Decimal('200000'),
+            status='paid', payment_method='Tiền mặt', payment_date=timezone.now(), note='Khách "VIP", <ưu tiên>'
+        )
+        self.client.force_authenticate(self.admin)
+
+    def export(self, name, file_type):
+        return self.client.get(f'/{name}/export/', {'type': file_type, 'period': 'month', 'year': self.today.year,
+                                                     'month': self.today.month})
+
+    def read_csv(self, response):
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(content.startswith('\ufeff'))
+        return list(csv.reader(io.StringIO(content[1:])))
+
+    def read_xlsx(self, response):
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as workbook:
+            sheet = ElementTree.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+        ns = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+        return [[''.join(cell.itertext()) for cell in row.iter(f'{ns}c')] for row in sheet.iter(f'{ns}row')]
+
+    def assertAttachment(self, response, name, file_type, content_type):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], content_type)
+        period = f'{self.today.replace(day=1):%Y%m%d}-'
+        self.assertTrue(response['Content-Disposition'].startswith(f'attachment; filename="{name}-{period}'))
+        self.assertTrue(response['Content-Disposition'].endswith(f'.{file_type}"'))
+
+    def test_appointments_csv(self):
+        response = self.export('appointments', 'csv')
+        self.assertAttachment(response, 'appointments', 'csv', 'text/csv; charset=utf-8')
+        rows = self.read_csv(response)
+        self.assertEqual(rows[0], [title for title, field in exports.APPOINTMENT_COLUMNS])
+        self.assertEqual([row[0] for row in rows[1:]], [str(appointment.id) for appointment in self.appointments])
+        self.assertEqual(rows[1][1:7], [str(self.today), '08:00:00', 'patient', 'patient@clinic.vn', 'doctor0',
+                                        'Nội khoa'])
+
+    def test_invoices_xlsx(self):
+        response = self.export('invoices', 'xlsx')
+        self.assertAttachment(response, 'invoices', 'xlsx',
+                              'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        rows = self.read_xlsx(response)
+        self.assertEqual(rows[0], [title for title, field in exports.INVOICE_COLUMNS])
+        self.assertEqual(len(rows), 2)
+        row = dict(zip(rows[0], rows[1]))
+        self.assertEqual(row['Mã hoá đơn'], str(self.invoice.id))
+        self.assertEqual(row['Tổng tiền'], '200000.00')
+        self.assertEqual(row['Hình thức thanh toán'], 'Tiền mặt')
+        self.assertEqual(row['Ghi chú'], 'Khách "VIP", <ưu tiên>')
+
+    def test_invoices_csv_and_appointments_xlsx(self):
+        rows = self.read_csv(self.export('invoices', 'csv'))
+        self.assertEqual(rows[1][0], str(self.invoice.id))
+        self.assertEqual(rows[1][-1], 'Khách "VIP", <ưu tiên>')
+        rows = self.read_xlsx(self.export('appointments', 'xlsx'))
+        self.assertEqual(len(rows), 4)
+
+    def test_admin_only_and_invalid_params(self):
+        self.assertEqual(self.client.get('/invoices/export/', {'type': 'pdf'}).status_code, 400)
+        self.assertEqual(self.client.get('/appointments/export/', {'period': 'week'}).status_code, 400)
+        for user in (self.nurse, self.doctors[0], self.patient):
+            self.client.force_authenticate(user)
+            self.assertEqual(self.export('appointments', 'csv').status_code, 403)
+            self.assertEqual(self.export('invoices', 'xlsx').status_code, 403)
+
+
+class MetricsTestCase(ClinicTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.registry.clear()
+
+    def test_requests_are_recorded_per_action(self):
+        self.create_records(2)
+        self.client.force_authenticate(self.admin)
+        self.client.get('/users/')
+        self.client.get('/users/')
+        self.client.get('/no-such-url/')
+
+        stats = metrics.registry.endpoints[('MyUserViewSet.list', 'GET')]
+        self.assertEqual(stats.statuses, {200: 2})
+        self.assertEqual(sum(stats.buckets), 2)
+        self.assertGreater(stats.queries, 0)
+        self.assertGreater(stats.serializer_time, 0)
+        self.assertGreater(stats.response_bytes, 0)
+        self.assertIn(('unmatched', 'GET'), metrics.registry.endpoints)
+
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('clinic_http_requests_total{endpoint="MyUserViewSet.list",method="GET",status="200"} 2', body)
+        self.assertIn('clinic_http_request_duration_seconds_count{endpoint="MyUserViewSet.list",method="GET"} 2', body)
+
+    def test_list_serialization_is_timed_without_patching_drf(self):
+        self.create_records(2)
+        self.client.force_authenticate(self.patient)
+        with mock.patch.object(metrics.TimedJSONRenderer, 'render', JSONRenderer.render):
+            self.client.get('/users/appointments/')
+        self.assertGreater(metrics.registry.endpoints[('MyUserViewSet.appointments', 'GET')].serializer_time, 0)
+        self.assertEqual(BaseSerializer.data.fget.__module__, 'rest_framework.serializers')
+
+    @override_settings(FAST_LIST_SERIALIZERS=True)
+    def test_serializer_time_excludes_queries(self):
+        self.create_records(30)
+        self.client.force_authenticate(self.nurse)
+        for _ in range(3):
+            self.client.get('/users/appointments/', {'page_size': 100})
+        stats = metrics.registry.endpoints[('MyUserViewSet.appointments', 'GET')]
+        self.assertGreater(stats.serializer_time, 0)
+        self.assertLessEqual(stats.serializer_time, stats.duration - stats.query_time)
+
+    def test_metrics_are_admin_only(self):
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+
+class GenerateDataTestCase(ClinicTestCase):
+    def test_generated_data_is_consistent_and_benchmarkable(self):
+        with mock.patch.object(slots, 'invalidate', wraps=slots.invalidate) as invalidate:
+            call_command('generate_data', scale=0.0005, seed=1, stdout=io.StringIO())
+        doctor_ids = set(MyUser.objects.filter(username__startswith='gen1_doctor').values_list('id', flat=True))
+        self.assertEqual(set(invalidate.call_args.args), doctor_ids)
+
+        self.assertEqual(Appointment.objects.filter(patient__username__startswith='gen1_').count(), 500)
+        self.assertEqual(DailyAppointmentStat.objects.aggregate(total=Sum('total'))['total'],
+                         Appointment.objects.count())
+        self.assertEqual(DailyAppointmentCount.objects.aggregate(total=Sum('total'))['total'],
+                         Appointment.objects.exclude(status='cancelled').count())
+        self.assertEqual(Prescription.objects.count(), Appointment.objects.filter(status='exam_completed').count())
+        self.assertEqual(DailyRevenueStat.objects.aggregate(total=Sum('revenue'))['total'],
+                         Invoice.objects.filter(status='paid').aggregate(total=Sum('total'))['total'])
+        schedule = WorkSchedule.objects.order_by('id').first()
+        self.assertEqual(ShiftCalendar.objects.filter(work_schedule=schedule).count(),
+                         ((schedule.to_date - schedule.from_date).days + 1) * schedule.shift.count())
+        with self.assertRaises(CommandError):
+            call_command('generate_data', scale=0.0005, seed=1, stdout=io.StringIO())
+
+        out = io.StringIO()
+        count = Appointment.objects.count()
+        call_command('benchmark_endpoints', repeat=2, warmup=0, stdout=out)
+        self.assertIn('appointments-create: p50', out.getvalue())
+        self.assertEqual(Appointment.objects.count(), count)
+
+
+class ArchiveTestCase(ClinicTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_records(6)
+        Appointment.objects.update(date=F('date') - timedelta(days=400))
+        Invoice.objects.update(status='paid')
+        self.pending = Appointment.objects.order_by('id')[2]
+        Invoice.objects.filter(appointment=self.pending).update(status='pending')
+        self.ordered_ids = list(Appointment.objects.order_by('-date', '-time', '-id').values_list('id', flat=True))
+
+    def test_closed_appointments_are_archived_in_batches(self):
+        stats_total = DailyAppointmentStat.objects.aggregate(total=Sum('total'))['total']
+        revenue = DailyRevenueStat.objects.aggregate(total=Sum('revenue'))['total']
+        day_counts = list(DailyAppointmentCount.objects.values_list('date', 'total'))
+        out = io.StringIO()
+        call_command('archive_appointments', batch_size=2, stdout=out)
+
+        self.assertIn('Archived 5 appointments', out.getvalue())
+        self.assertEqual(list(Appointment.objects.values_list('id', flat=True)), [self.pending.id])
+        self.assertEqual(ArchivedAppointment.objects.count(), 5)
+        self.assertEqual(ArchivedPrescription.objects.count(), 5)
+        self.assertEqual(ArchivedPrescriptionDetail.objects.count(), 5)
+        self.assertEqual(ArchivedInvoice.objects.count(), 5)
+        self.assertEqual(Prescription.objects.count(), 1)
+        # Số liệu thống kê vẫn tính cả dữ liệu đã lưu trữ
+        self.assertEqual(DailyAppointmentStat.objects.aggregate(total=Sum('total'))['total'], stats_total)
+        self.assertEqual(DailyRevenueStat.objects.aggregate(total=Sum('revenue'))['total'], revenue)
+        self.assertEqual(list(DailyAppointmentCount.objects.values_list('date', 'total')), day_counts)
+
+        # Chạy lại không còn gì để chuyển
+        call_command('archive_appointments', stdout=out)
+        self.assertEqual(ArchivedAppointment.objects.count(), 5)
+
+    def test_history_reads_union_live_and_archived(self):
+        call_command('archive_appointments', batch_size=2, stdout=io.StringIO())
+        self.client.force_authenticate(self.patient)
+
+        response = self.client.get('/users/appointments/')
+        self.assertEqual([row['id'] for row in response.data['results']], [self.pending.id])
+
+        ids = []
+        url = '/users/appointments/?include_archived=true&page_size=2'
+        while url:
+            response = self.client.get(url)
+            ids += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, self.ordered_ids)
+
+        response = self.client.get('/users/invoices/?include_archived=true&with_total=true')
+        self.assertEqual(response.data['count'], 6)
+        response = self.client.get('/users/prescriptions/?include_archived=true&page_size=10')
+        self.assertEqual(len(response.data['results']), 6)
+
+    def test_union_iteration_merges_ordered_querysets(self):
+        call_command('archive_appointments', batch_size=2, stdout=io.StringIO())
+        union = archive.union(Appointment.objects.all(), ArchivedAppointment.objects.all())
+        union = union.order_by('-date', '-time', '-id')
+
+        with mock.patch('heapq.merge', wraps=archive.heapq.merge) as merge:
+            self.assertEqual([row.id for row in union], self.ordered_ids)
+        merge.assert_called_once()
+        self.assertEqual([row.id for row in union[1:4]], self.ordered_ids[1:4])
+
+    def test_old_date_only_reads_archive_when_it_filters(self):
+        archived = Appointment.objects.exclude(pk=self.pending.pk).order_by('id').first()
+        call_command('archive_appointments', stdout=io.StringIO())
+        self.client.force_authenticate(self.patient)
+
+        # date không kèm status không lọc nên không kéo cả bảng lưu trữ vào
+        response = self.client.get('/users/appointments/', {'date': str(archived.date)})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.pending.id])
+
+        response = self.client.get('/users/appointments/', {'date': str(archived.date), 'status': 'exam_completed'})
+        self.assertEqual([row['id'] for row in response.data['results']], [archived.id])
+
+    def test_exports_of_old_ranges_include_archive(self):
+        call_command('archive_appointments', stdout=io.StringIO())
+        days = sorted(Appointment.objects.values_list('date', flat=True).union(
+            ArchivedAppointment.objects.values_list('date', flat=True)))
+        queryset = exports.appointment_queryset(days[0], days[-1])
+        ids = [row[0] for row in exports.iterate_rows(queryset, ['id'], chunk_size=2)]
+        self.assertEqual(ids, sorted(self.ordered_ids))
+
+
+# Cần alias 'replica' riêng (không mirror), vd. python manage.py test --settings=clinicapp.test_settings.
+# TransactionTestCase vì đọc trong transaction luôn về primary.
+@skipUnless('replica' in settings.DATABASES, 'Needs a separate replica database')
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTestCase(TransactionTestCase):
+    databases = {'default', 'replica'} & set(settings.DATABASES)
+
+    def setUp(self):
+        cache.clear()
+        self.patient = MyUser.objects.create(username='patient', fullname='patient', email='patient@clinic.vn')
+        doctor = MyUser.objects.create(username='doctor', fullname='doctor', email='doctor@clinic.vn', role='doctor')
+        Appointment.objects.create(patient=self.patient, doctor=doctor, date=date.today(), time=time(8),
+                                   status='confirmed')
+        self.client = self.client_for('first-token')
+
+    def client_for(self, token):
+        client = APIClient()
+        client.force_authenticate(self.patient)
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def test_reads_go_to_replica(self):
+        # Replica chưa nhận được dữ liệu vừa ghi vào primary
+        response = self.client.get('/users/appointments/')
+        self.assertEqual(response.data['results'], [])
+
+    def test_client_reads_from_primary_after_writing(self):
+        response = self.client.patch('/users/update-profile/', {'fullname': 'Bệnh nhân'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.client.get('/users/appointments/').data['results']), 1)
+        self.assertEqual(self.client_for('other-token').get('/users/appointments/').data['results'], [])
+
+    def test_reads_after_write_in_same_request_use_primary(self):
+        router = PrimaryReplicaRouter()
+        token = db_router._state.set(db_router.RoutingState('replica'))
+        try:
+            self.assertEqual(router.db_for_read(Appointment), 'replica')
+            self.assertEqual(router.db_for_read(AccessToken), 'default')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Appointment), 'default')
+            router.db_for_write(Appointment)
+            self.assertEqual(router.db_for_read(Appointment), 'default')
+        finally:
+            db_router._state.reset(token)
+
+    def test_caches_are_built_from_primary(self):
+        doctor = MyUser.objects.get(username='doctor')
+        Doctor.objects.create(user=doctor, speciality='Nội khoa')
+        medicine = Medicine.objects.create(name='Paracetamol', unit='Viên')
+
+        # Danh mục bác sĩ được cache nên không dựng từ replica (chưa có bác sĩ nào)
+        response = self.client.get('/doctors/')
+        self.assertEqual([item['user']['id'] for item in response.data['results']], [doctor.id])
+
+        token = db_router._state.set(db_router.RoutingState('replica'))
+        try:
+            self.assertEqual(slots.get_day(doctor.id, date.today())[1], 1 << 8 * 60)
+            self.assertEqual(search.search_medicines('para'), [medicine.id])
+        finally:
+            db_router._state.reset(token)
@@ -9,8 +9,14 @@ router.register(r'appointments', views.AppointmentViewSet, basename='appointment
 router.register(r'medicines', views.MedicineViewSet, basename='medicines')
 router.register(r'prescriptions', views.PrescriptionViewSet, basename='prescriptions')
 router.register(r'invoices', views.InvoiceViewSet, basename='invoices')
+router.register(r'stats', views.StatsViewSet, basename='stats')
+router.register(r'metrics', views.MetricsViewSet, basename='metrics')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('events/appointments/', views.appointment_events, name='appointment-events'),
+    path('async/doctors/', views.async_doctor_list, name='async-doctors-list'),
+    path('async/doctors/<int:pk>/introduce/', views.async_doctor_introduce, name='async-doctors-introduce'),
+    path('async/doctors/<int:pk>/time-slots/', views.async_doctor_time_slots, name='async-doctors-time-slots'),
     # path('report/', views.report_view, name='report_view'),
 ]
\ No newline at end of file
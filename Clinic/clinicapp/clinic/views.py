@@ -1,12 +1,26 @@
+import asyncio
+import functools
+import math
 from datetime import datetime, timedelta
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import Group
-from django.http import HttpResponseForbidden
+from django.core.paginator import InvalidPage
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse, HttpResponseForbidden, HttpResponseNotAllowed, JsonResponse, \
+    StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from oauth2_provider.contrib.rest_framework import OAuth2Authentication
 from rest_framework import viewsets, generics, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 # from django.shortcuts import render
 # from django.contrib.auth.decorators import login_required
 # from django.db.models import Sum
@@ -18,12 +32,22 @@ from .dao import (
     send_book_appointment_success_email,
     send_confirm_appointment_success_email,
     send_cancel_appointment_success_email,
-    is_max_appointment_per_day_reached
+    is_max_appointment_per_day_reached,
+    ais_max_appointment_per_day_reached,
+    get_fully_booked_dates,
+    reserve_appointment_day,
+    bulk_change_appointment_status,
+    confirm_appointment_email,
+    cancel_appointment_email
 )
+from . import archive, directory, events, exports, fast_serializers, metrics, slots, stats
 from .models import (
-    MyUser, Doctor, WorkSchedule, Appointment, Medicine, Prescription, PrescriptionDetail, Invoice
+    MyUser, Doctor, Appointment, Medicine, Prescription, PrescriptionDetail, Invoice,
+    ArchivedAppointment, ArchivedPrescription, ArchivedInvoice
 )
-from .perms import IsAdmin, IsDoctor, IsNurse, IsPatient
+from .paginators import AppointmentCursorPagination, CreatedDateCursorPagination
+from .perms import IsAdmin, IsDoctor, IsNurse, IsPatient, has_role, get_user_roles
+from .search import search_medicines
 from .serializers import (
     MyUserSerializer, MyUserListSerializer,
     DoctorSerializer, DoctorListSerializer, DoctorIntroduceSerializer,
@@ -32,8 +56,70 @@ from .serializers import (
     InvoiceSerializer, InvoiceListSerializer
 )
 
+MAX_SLOT_SEARCH_DAYS = 31
+MAX_SLOT_SEARCH_RESULTS = 100
+MAX_BULK_APPOINTMENTS = 200
+
 
 # Create your views here.
+# Khoảng thời gian báo cáo: period=month|quarter|year kèm year, month hoặc quarter (mặc định là kỳ hiện tại)
+def get_period(request):
+    period = request.query_params.get('period', 'month')
+    today = datetime.now().date()
+    try:
+        year = int(request.query_params.get('year', today.year))
+        if period == 'month':
+            number = int(request.query_params.get('month', today.month))
+        elif period == 'quarter':
+            number = int(request.query_params.get('quarter', (today.month - 1) // 3 + 1))
+        else:
+            number = None
+        return period, *stats.get_period_range(period, year, number)
+    except ValueError:
+        return None
+
+
+def invalid_period_response():
+    return Response({'error': 'Invalid period. Use period=month|quarter|year with year, month or quarter'},
+                    status=status.HTTP_400_BAD_REQUEST)
+
+
+def export_response(request, name, queryset, columns):
+    period = get_period(request)
+    if period is None:
+        return invalid_period_response()
+    period, from_date, to_date = period
+    file_type = request.query_params.get('type', 'csv')
+    filename = f'{name}-{from_date:%Y%m%d}-{to_date:%Y%m%d}.{file_type}'
+    if file_type == 'csv':
+        response = StreamingHttpResponse(exports.stream_csv(queryset(from_date, to_date), columns),
+                                         content_type='text/csv; charset=utf-8')
+    elif file_type == 'xlsx':
+        response = StreamingHttpResponse(
+            exports.stream_xlsx(queryset(from_date, to_date), columns),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+    else:
+        return Response({'error': 'Invalid type. Use type=csv|xlsx'}, status=status.HTTP_400_BAD_REQUEST)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+# Serialize trang hiện tại của một danh sách chỉ đọc, theo đường nhanh khi bật FAST_LIST_SERIALIZERS
+def serialize_list(view, queryset, serializer_class, fast_serializer):
+    if settings.FAST_LIST_SERIALIZERS:
+        # Các cột của thứ tự phân trang theo con trỏ phải có trong mỗi dòng để dựng con trỏ trang kế
+        ordering = [field.lstrip('-') for field in getattr(view.paginator, 'ordering', None) or ()]
+        queryset = fast_serializer.get_queryset(queryset, *ordering)
+        page = view.paginate_queryset(queryset)
+        # serialize() tự đo thời gian dựng dòng, không tính lúc nạp dòng từ DB
+        return fast_serializer.serialize(page if page is not None else queryset)
+
+    page = view.paginate_queryset(queryset)
+    with metrics.timer('serializer_time'):
+        return serializer_class(page if page is not None else queryset, many=True).data
+
+
 class MyUserViewSet(viewsets.ViewSet, generics.ListAPIView):
     queryset = MyUser.objects.filter(is_active=True).all()
     serializer_class = MyUserSerializer
@@ -45,7 +131,7 @@ class MyUserViewSet(viewsets.ViewSet, generics.ListAPIView):
                 permission_classes = [permissions.AllowAny]
             else:
                 permission_classes = [IsAdmin]
-        elif self.action in ['profile', 'update_profile', 'appointments', 'prescriptions', 'invoices']:
+        elif self.action in ['profile', 'update_profile', 'appointments', 'prescriptions', 'invoices', 'event_ticket']:
             permission_classes = [permissions.IsAuthenticated]
         elif self.action in ['list', ]:
             permission_classes = [IsAdmin]
@@ -60,13 +146,24 @@ class MyUserViewSet(viewsets.ViewSet, generics.ListAPIView):
 
         role = serializer.validated_data.get('role')
         user = serializer.save()
-        user.groups.add(Group.objects.get_or_create(name=role))
+        group, created = Group.objects.get_or_create(name=role)
+        user.groups.add(group)
         return Response(MyUserSerializer(user).data, status=status.HTTP_201_CREATED)
 
     @action(methods=['get'], url_path='profile', url_name='profile', detail=False)
     def profile(self, request):
         return Response(MyUserSerializer(request.user).data)
 
+    # Vé dùng một lần để mở luồng events/appointments/ bằng EventSource
+    @action(methods=['post'], url_path='event-ticket', url_name='event-ticket', detail=False)
+    def event_ticket(self, request):
+        if not event_channels(request.user):
+            return Response({'error': 'Only nurses and doctors can subscribe to appointment events'},
+                            status=status.HTTP_403_FORBIDDEN)
+        ticket = events.issue_stream_ticket(request.user.id)
+        return Response({'ticket': ticket, 'expires_in': events.STREAM_TICKET_SECONDS},
+                        status=status.HTTP_201_CREATED)
+
     @action(methods=['patch'], url_path='update-profile', url_name='update-profile', detail=False)
     def update_profile(self, request, *args, **kwargs):
         serializer = MyUserSerializer(data=request.data, instance=request.user, partial=True)
@@ -78,8 +175,8 @@ class MyUserViewSet(viewsets.ViewSet, generics.ListAPIView):
         role = request.data.get('role')
         if role and role != request.user.role:
             if IsAdmin().has_permission(request, self):
-                request.user.groups.clear()
-                request.user.groups.add(Group.objects.get_or_create(name=role))
+                group, created = Group.objects.get_or_create(name=role)
+                request.user.groups.set([group])
             else:
                 return Response({'error': 'You are not allowed to update role of this user'},
                                 status=status.HTTP_403_FORBIDDEN)
@@ -87,7 +184,8 @@ class MyUserViewSet(viewsets.ViewSet, generics.ListAPIView):
         request.user.save()
         return Response(MyUserSerializer(request.user).data, status=status.HTTP_200_OK)
 
-    @action(methods=['get'], url_path='appointments', url_name='appointments', detail=False)
+    @action(methods=['get'], url_path='appointments', url_name='appointments', detail=False,
+            pagination_class=AppointmentCursorPagination)
     def appointments(self, request, *args, **kwargs):
         app_status = request.query_params.get('status', None)
         app_date = request.query_params.get('date', None)
@@ -108,14 +206,15 @@ class MyUserViewSet(viewsets.ViewSet, generics.ListAPIView):
         if role_filter:
             filters.update(role_filter())
 
-        queryset = Appointment.objects.filter(**filters).all()
-        serializer = AppointmentListSerializer(queryset, many=True)
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = AppointmentListSerializer(page, many=True)
-        return self.get_paginated_response(serializer.data)
+        queryset = Appointment.objects.filter(**filters).select_related('patient', 'doctor')
+        # date chỉ lọc khi đi kèm status nên chỉ dựa vào date khi nó thực sự có trong điều kiện lọc
+        if archive.include_archived(request, filters.get('date')):
+            queryset = archive.union(queryset, ArchivedAppointment.objects.filter(**filters).select_related('patient', 'doctor'))
+        data = serialize_list(self, queryset, AppointmentListSerializer, fast_serializers.fast_appointment_list)
+        return self.get_paginated_response(data)
 
-    @action(methods=['get'], url_path='prescriptions', url_name='prescriptions', detail=False)
+    @action(methods=['get'], url_path='prescriptions', url_name='prescriptions', detail=False,
+            pagination_class=CreatedDateCursorPagination)
     def prescriptions(self, request, *args, **kwargs):
         date = request.query_params.get('date', None)
 
@@ -127,14 +226,14 @@ class MyUserViewSet(viewsets.ViewSet, generics.ListAPIView):
         if request.user.role == 'doctor':
             filters['doctor'] = request.user
 
-        queryset = Prescription.objects.filter(**filters).all()
-        serializer = PrescriptionListSerializer(queryset, many=True)
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = PrescriptionListSerializer(page, many=True)
-        return self.get_paginated_response(serializer.data)
+        queryset = Prescription.objects.filter(**filters).select_related('patient', 'doctor')
+        if archive.include_archived(request, date):
+            queryset = archive.union(queryset, ArchivedPrescription.objects.filter(**filters).select_related('patient', 'doctor'))
+        data = serialize_list(self, queryset, PrescriptionListSerializer, fast_serializers.fast_prescription_list)
+        return self.get_paginated_response(data)
 
-    @action(methods=['get'], url_path='invoices', url_name='invoices', detail=False)
+    @action(methods=['get'], url_path='invoices', url_name='invoices', detail=False,
+            pagination_class=CreatedDateCursorPagination)
     def invoices(self, request, *args, **kwargs):
         invoice_status = request.query_params.get('status', None)
         invoice_date = request.query_params.get('date', None)
@@ -148,26 +247,21 @@ class MyUserViewSet(viewsets.ViewSet, generics.ListAPIView):
         if request.user.role == 'patient':
             filters['patient'] = request.user
 
-        queryset = Invoice.objects.filter(**filters).all()
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = InvoiceListSerializer(page, many=True)
-        else:
-            serializer = InvoiceListSerializer(queryset, many=True)
+        queryset = Invoice.objects.filter(**filters).select_related('patient', 'created_by')
+        if archive.include_archived(request, invoice_date):
+            queryset = archive.union(queryset, ArchivedInvoice.objects.filter(**filters).select_related('patient', 'created_by'))
+        data = serialize_list(self, queryset, InvoiceListSerializer, fast_serializers.fast_invoice_list)
 
         # Xử lý lỗi
-        if not serializer.data:
+        if not data:
             return Response({'error': 'No invoices found'}, status=status.HTTP_404_NOT_FOUND)
 
-        return self.get_paginated_response(serializer.data)
+        return self.get_paginated_response(data)
 
     def list(self, request, *args, **kwargs):
-        queryset = MyUser.objects.filter(is_active=True).all()
-        serializer = MyUserListSerializer(queryset, many=True)
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = MyUserListSerializer(page, many=True)
-        return self.get_paginated_response(serializer.data)
+        queryset = MyUser.objects.filter(is_active=True).order_by('id')
+        data = serialize_list(self, queryset, MyUserListSerializer, fast_serializers.fast_user_list)
+        return self.get_paginated_response(data)
 
 
 class DoctorViewSet(viewsets.ViewSet, generics.ListAPIView):
@@ -176,24 +270,27 @@ class DoctorViewSet(viewsets.ViewSet, generics.ListAPIView):
     pagination_class = PageNumberPagination
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve', 'time_slots', 'introduce']:
+        if self.action in ['list', 'retrieve', 'time_slots', 'available_slots', 'introduce']:
             permission_classes = [permissions.IsAuthenticated]
         else:
             permission_classes = [IsAdmin]
         return [permission() for permission in permission_classes]
 
+    # Danh mục bác sĩ được cache theo trang/bác sĩ và làm mới bằng signal khi Doctor/MyUser thay đổi
     def list(self, request, *args, **kwargs):
-        queryset = Doctor.objects.all()
-        serializer = DoctorListSerializer(queryset, many=True)
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = DoctorListSerializer(page, many=True)
-        return self.get_paginated_response(serializer.data)
+        def build():
+            queryset = Doctor.objects.select_related('user').order_by('id')
+            data = serialize_list(self, queryset, DoctorListSerializer, fast_serializers.fast_doctor_list)
+            return self.get_paginated_response(data).data if self.paginator else data
+
+        return directory.cached_response(request, f'list:{request.build_absolute_uri()}', build)
 
     def retrieve(self, request, pk=None):
-        doctor = Doctor.objects.get(pk=pk)
-        serializer = DoctorSerializer(doctor)
-        return Response(serializer.data)
+        def build():
+            doctor = get_object_or_404(Doctor.objects.select_related('user'), pk=pk)
+            return DoctorSerializer(doctor).data
+
+        return directory.cached_response(request, f'detail:{pk}', build)
 
     @action(methods=['get'], url_path='time-slots', url_name='time-slots', detail=True)
     def time_slots(self, request, pk=None):
@@ -213,72 +310,74 @@ class DoctorViewSet(viewsets.ViewSet, generics.ListAPIView):
         if is_max_appointment_per_day_reached(date_obj):
             return Response({'error': 'Maximum appointment per day reached'}, status=status.HTTP_400_BAD_REQUEST)
 
-        work_schedules = WorkSchedule.objects.filter(
-            employee=doctor.user,
-            from_date__lte=date_obj,
-            to_date__gte=date_obj,
-            is_available=True
-        ).prefetch_related('shift')
-
-        booked_appointments = Appointment.objects.filter(
-            doctor=doctor.user,
-            date=date_obj,
-            status__in=['pending_confirmation', 'confirmed']
-        ).values_list('time', flat=True)
-
-        time_slots = []
-        for schedule in work_schedules:
-            for shift in schedule.shift.all():
-                current_time = datetime.combine(date_obj, shift.start_time)
-                end_time = datetime.combine(date_obj, shift.end_time)
-
-                while current_time <= end_time and current_time + timedelta(minutes=30) <= end_time:
-                    if current_time.time() not in booked_appointments:
-                        time_slots.append(current_time.strftime('%H:%M'))
-                    current_time += timedelta(minutes=30)
+        time_slots = slots.available_slots(doctor.user_id, date_obj)
 
         return Response({'available_time_slots': time_slots})
 
+    @action(methods=['get'], url_path='available-slots', url_name='available-slots', detail=False)
+    def available_slots(self, request):
+        speciality = request.query_params.get('speciality', None)
+        if speciality not in dict(Doctor.speciality_choices):
+            return Response({'error': 'Invalid speciality'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            from_date = datetime.strptime(request.query_params['from_date'], '%Y-%m-%d').date() \
+                if 'from_date' in request.query_params else datetime.now().date()
+            to_date = datetime.strptime(request.query_params['to_date'], '%Y-%m-%d').date() \
+                if 'to_date' in request.query_params else from_date + timedelta(days=6)
+            from_time = datetime.strptime(request.query_params.get('from_time', '00:00'), '%H:%M').time()
+            to_time = datetime.strptime(request.query_params.get('to_time', '23:59'), '%H:%M').time()
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return Response({'error': 'Invalid date, time or limit format'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if from_date > to_date or (to_date - from_date).days >= MAX_SLOT_SEARCH_DAYS:
+            return Response({'error': f'Date range must be between 1 and {MAX_SLOT_SEARCH_DAYS} days'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, MAX_SLOT_SEARCH_RESULTS))
+
+        doctors = {doctor.user_id: doctor for doctor in Doctor.objects.filter(speciality=speciality).select_related('user')}
+        results = slots.find_earliest(
+            list(doctors),
+            from_date,
+            to_date,
+            window=slots.window_mask(slots.minute_of(from_time), slots.minute_of(to_time) + 1),
+            limit=limit,
+            skip_dates=get_fully_booked_dates(from_date, to_date)
+        )
+
+        doctor_data = {}
+        available_slots = []
+        for date_obj, time_slot, doctor_id in results:
+            if doctor_id not in doctor_data:
+                doctor_data[doctor_id] = DoctorListSerializer(doctors[doctor_id]).data
+            available_slots.append({'date': date_obj, 'time': time_slot, 'doctor': doctor_data[doctor_id]})
+
+        return Response({'available_slots': available_slots})
+
     @action(methods=['get'], url_path='introduce', url_name='introduce', detail=True)
     def introduce(self, request, pk=None):
-        doctor = get_object_or_404(Doctor, pk=pk)
-        serializer = DoctorIntroduceSerializer(doctor)
-        return Response(serializer.data)
+        def build():
+            doctor = get_object_or_404(Doctor.objects.select_related('user'), pk=pk)
+            return DoctorIntroduceSerializer(doctor).data
 
+        return directory.cached_response(request, f'introduce:{pk}', build)
 
-def is_slot_available(date, time, doctor_id):
+
+def check_time_slot(date, time, doctor_id):
     try:
         date_obj = datetime.strptime(date, '%Y-%m-%d').date()
         time_obj = datetime.strptime(time, '%H:%M').time()
-    except ValueError:
-        return False
-
-    if is_max_appointment_per_day_reached(date_obj):
-        return False
-
-    # Kiểm tra lịch làm việc và lịch hẹn đã đặt
-    work_schedules = WorkSchedule.objects.filter(
-        employee_id=doctor_id,
-        from_date__lte=date_obj,
-        to_date__gte=date_obj,
-        is_available=True
-    ).prefetch_related('shift')
+        doctor_id = int(doctor_id)
+    except (TypeError, ValueError):
+        return Response({'error': 'Time slot is not available for the selected doctor'},
+                        status=status.HTTP_400_BAD_REQUEST)
 
-    for schedule in work_schedules:
-        for shift in schedule.shift.all():
-            start_time = datetime.combine(date_obj, shift.start_time)
-            end_time = datetime.combine(date_obj, shift.end_time)
-
-            if start_time <= datetime.combine(date_obj, time_obj) <= end_time:
-                if not Appointment.objects.filter(
-                        doctor_id=doctor_id,
-                        date=date_obj,
-                        time=time_obj,
-                        status__in=['pending_confirmation', 'confirmed']
-                ).exists():
-                    return True
-
-    return False
+    # Chỉ kiểm tra lịch làm việc, khung giờ đã có người đặt do ràng buộc unique khi lưu báo 409
+    if not slots.is_working_slot(doctor_id, date_obj, time_obj):
+        return Response({'error': 'Time slot is not available for the selected doctor'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    return None
 
 
 class AppointmentViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.RetrieveAPIView):
@@ -292,6 +391,8 @@ class AppointmentViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.Retr
             permission_classes = [permissions.IsAuthenticated]
         elif self.action in ['examination', 'complete_examination']:
             permission_classes = [IsDoctor]
+        elif self.action in ['bulk_confirm', 'bulk_cancel']:
+            permission_classes = [IsNurse]
         else:
             permission_classes = [IsAdmin]
         return [permission() for permission in permission_classes]
@@ -303,60 +404,125 @@ class AppointmentViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.Retr
         date = data.get('date')
         time = data.get('time')
 
+        if doctor is None:
+            return Response({'error': 'Doctor is required'}, status=status.HTTP_400_BAD_REQUEST)
+
         # Kiểm tra nếu time slot trống và hợp lệ cho bác sĩ
-        if not self.is_slot_available(date, time, doctor):
-            return Response({'error': 'Time slot is not available for the selected doctor'},
-                            status=status.HTTP_400_BAD_REQUEST)
+        error = check_time_slot(date, time, doctor)
+        if error is not None:
+            return error
 
         if patient is None:
             data['patient'] = request.user.id
-        if doctor is None:
-            return Response({'error': 'Doctor is required'}, status=status.HTTP_400_BAD_REQUEST)
 
         serializer = AppointmentSerializer(data=data)
         serializer.is_valid(raise_exception=True)
 
-        appointment = serializer.save()
-        send_book_appointment_success_email(appointment)
+        # Ràng buộc unique trên khung giờ đang hoạt động đảm bảo chỉ một lượt đặt thành công,
+        # dòng đếm theo ngày bị khoá để giới hạn số lịch hẹn mỗi ngày luôn chính xác
+        try:
+            with transaction.atomic():
+                if not reserve_appointment_day(serializer.validated_data['date']):
+                    return Response({'error': 'Maximum appointment per day reached'},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                appointment = serializer.save()
+                send_book_appointment_success_email(appointment)
+        except IntegrityError:
+            return Response({'error': 'Time slot has already been booked'}, status=status.HTTP_409_CONFLICT)
         return Response(AppointmentDetailSerializer(appointment).data, status=status.HTTP_201_CREATED)
 
+    # Xuất lịch hẹn theo tháng/năm: /appointments/export/?type=csv|xlsx&period=year&year=2024
+    @action(methods=['get'], url_path='export', url_name='export', detail=False)
+    def export(self, request):
+        return export_response(request, 'appointments', exports.appointment_queryset, exports.APPOINTMENT_COLUMNS)
+
     @action(methods=['post'], url_path='cancel', url_name='cancel', detail=True)
     def cancel(self, request, *args, **kwargs):
-        appointment = get_object_or_404(Appointment, pk=kwargs.get('pk'))
-        if IsPatient().has_permission(request, self) and appointment.patient != request.user:
+        appointment = get_object_or_404(Appointment.objects.select_related('patient', 'doctor'), pk=kwargs.get('pk'))
+        if IsPatient().has_permission(request, self) and appointment.patient_id != request.user.id:
             return Response({'error': 'You are not allowed to cancel this appointment'},
                             status=status.HTTP_403_FORBIDDEN)
         if appointment.status in ['pending_confirmation', 'confirmed']:
             appointment.status = 'cancelled'
             appointment.cancellation_reason = request.data.get('cancellation_reason', '')
-            appointment.save()
-
-            send_cancel_appointment_success_email(appointment)
+            with transaction.atomic():
+                appointment.save()
+                send_cancel_appointment_success_email(appointment)
             return Response(AppointmentSerializer(appointment).data)
         else:
             return Response({'error': 'Appointment cannot be cancelled'}, status=status.HTTP_400_BAD_REQUEST)
 
     @action(methods=['post'], url_path='confirm', url_name='confirm', detail=True)
     def confirm(self, request, *args, **kwargs):
-        appointment = get_object_or_404(Appointment, pk=kwargs.get('pk'))
+        appointment = get_object_or_404(Appointment.objects.select_related('patient', 'doctor'), pk=kwargs.get('pk'))
         if appointment.status == 'pending_confirmation':
-            if request.user.groups.filter(name='nurse').exists():
+            if has_role(request.user, 'nurse'):
                 appointment.status = 'confirmed'
                 appointment.nurse = request.user
-                appointment.save()
-
-                send_confirm_appointment_success_email(appointment)
+                with transaction.atomic():
+                    appointment.save()
+                    send_confirm_appointment_success_email(appointment)
                 return Response(AppointmentSerializer(appointment).data)
             else:
                 return Response({'error': 'Only nurses can confirm appointments'}, status=status.HTTP_403_FORBIDDEN)
         else:
             return Response({'error': 'Appointment cannot be confirmed'}, status=status.HTTP_400_BAD_REQUEST)
 
+    # Xác nhận/huỷ hàng loạt: {"ids": [...]} hoặc bộ lọc {"date": "YYYY-MM-DD", "doctor": id}
+    @action(methods=['post'], url_path='bulk-confirm', url_name='bulk-confirm', detail=False)
+    def bulk_confirm(self, request, *args, **kwargs):
+        return self.bulk_change_status(
+            request, ('pending_confirmation',), 'confirmed', confirm_appointment_email,
+            'Appointment cannot be confirmed', nurse=request.user
+        )
+
+    @action(methods=['post'], url_path='bulk-cancel', url_name='bulk-cancel', detail=False)
+    def bulk_cancel(self, request, *args, **kwargs):
+        return self.bulk_change_status(
+            request, Appointment.active_statuses, 'cancelled', cancel_appointment_email,
+            'Appointment cannot be cancelled', cancellation_reason=request.data.get('cancellation_reason', '')
+        )
+
+    def bulk_change_status(self, request, from_statuses, to_status, build_email, error, **values):
+        ids = request.data.get('ids')
+        if ids is not None:
+            if not isinstance(ids, list) or not all(isinstance(pk, int) for pk in ids):
+                return Response({'error': 'ids must be a list of appointment ids'}, status=status.HTTP_400_BAD_REQUEST)
+            if len(ids) > MAX_BULK_APPOINTMENTS:
+                return Response({'error': f'At most {MAX_BULK_APPOINTMENTS} appointments per request'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            queryset = Appointment.objects.filter(pk__in=ids)
+        else:
+            try:
+                filters = {'date': datetime.strptime(request.data['date'], '%Y-%m-%d').date()}
+                if request.data.get('doctor') is not None:
+                    filters['doctor_id'] = int(request.data['doctor'])
+            except (KeyError, TypeError, ValueError):
+                return Response({'error': 'Either ids or a valid date (and optional doctor) is required'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            # Số lịch hẹn trong một ngày đã bị giới hạn bởi MAX_APPOINTMENT_PER_DAY
+            queryset = Appointment.objects.filter(**filters)
+
+        with transaction.atomic():
+            appointments = bulk_change_appointment_status(queryset, from_statuses, to_status, build_email, **values)
+
+        results = [{'id': appointment.id, 'success': True, 'status': appointment.status}
+                   for appointment in appointments]
+        if ids is not None:
+            changed = {appointment.id for appointment in appointments}
+            current = dict(Appointment.objects.filter(pk__in=set(ids) - changed).values_list('id', 'status'))
+            results += [
+                {'id': pk, 'success': False, 'status': current[pk], 'error': error} if pk in current
+                else {'id': pk, 'success': False, 'error': 'Appointment not found'}
+                for pk in dict.fromkeys(ids) if pk not in changed
+            ]
+        return Response({'updated': len(appointments), 'results': results})
+
     @action(methods=['post'], url_path='examination', url_name='examination', detail=True)
     def examination(self, request, *args, **kwargs):
         appointment = get_object_or_404(Appointment, pk=kwargs.get('pk'))
         if appointment.status == 'confirmed':
-            if appointment.doctor == request.user:
+            if appointment.doctor_id == request.user.id:
                 appointment.status = 'examination_in_progress'
                 appointment.save()
                 return Response(AppointmentSerializer(appointment).data)
@@ -370,7 +536,7 @@ class AppointmentViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.Retr
     def complete_examination(self, request, *args, **kwargs):
         appointment = get_object_or_404(Appointment, pk=kwargs.get('pk'))
         if appointment.status == 'examination_in_progress':
-            if appointment.doctor == request.user:
+            if appointment.doctor_id == request.user.id:
                 appointment.status = 'exam_completed'
                 appointment.save()
                 return Response(AppointmentSerializer(appointment).data)
@@ -381,43 +547,15 @@ class AppointmentViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.Retr
             return Response({'error': 'Appointment cannot be completed'}, status=status.HTTP_400_BAD_REQUEST)
 
     def retrieve(self, request, *args, **kwargs):
-        appointment = get_object_or_404(Appointment, pk=kwargs.get('pk'))
+        appointment = get_object_or_404(
+            Appointment.objects.select_related('patient', 'doctor', 'nurse'), pk=kwargs.get('pk')
+        )
 
-        if IsPatient().has_permission(request, self) and appointment.patient != request.user:
+        if IsPatient().has_permission(request, self) and appointment.patient_id != request.user.id:
             return Response({'error': 'You are not allowed to view this appointment'}, status=status.HTTP_403_FORBIDDEN)
         serializer = AppointmentDetailSerializer(appointment)
         return Response(serializer.data)
 
-    def is_slot_available(self, date, time, doctor_id):
-        try:
-            date_obj = datetime.strptime(date, '%Y-%m-%d').date()
-            time_obj = datetime.strptime(time, '%H:%M').time()
-        except ValueError:
-            return False
-
-        # Kiểm tra lịch làm việc và lịch hẹn đã đặt
-        work_schedules = WorkSchedule.objects.filter(
-            employee_id=doctor_id,
-            from_date__lte=date_obj,
-            to_date__gte=date_obj,
-            is_available=True
-        ).prefetch_related('shift')
-
-        for schedule in work_schedules:
-            for shift in schedule.shift.all():
-                start_time = datetime.combine(date_obj, shift.start_time)
-                end_time = datetime.combine(date_obj, shift.end_time)
-
-                if start_time <= datetime.combine(date_obj, time_obj) <= end_time:
-                    if not Appointment.objects.filter(
-                            doctor_id=doctor_id,
-                            date=date_obj,
-                            time=time_obj
-                    ).exists():
-                        return True
-
-        return False
-
 
 class MedicineViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIView):
     queryset = Medicine.objects.filter(active=True).all()
@@ -433,17 +571,24 @@ class MedicineViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveA
 
     @action(methods=['get'], url_path='find', url_name='find', detail=False)
     def find(self, request, **kwargs):
-        kw = request.query_params.get('kw', None)
-        medicine = Medicine.objects.filter(name__icontains=kw)
-        serializer = MedicineSerializer(medicine, many=True)
-        page = self.paginate_queryset(medicine)
-        if page is not None:
-            serializer = MedicineSerializer(page, many=True)
+        kw = request.query_params.get('kw', '').strip()
+        if not kw:
+            return Response({'error': 'Missing kw parameter'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Tìm trên chỉ mục trong bộ nhớ (không dấu, theo tiền tố), phân trang trên toàn bộ kết quả
+        # để count đúng, chỉ nạp các thuốc của trang hiện tại
+        medicine_ids = search_medicines(kw)
+        page = self.paginate_queryset(medicine_ids)
+        if page is None:
+            page = medicine_ids
+        medicines = Medicine.objects.in_bulk(page)
+        serializer = MedicineSerializer([medicines[pk] for pk in page if pk in medicines], many=True)
         return self.get_paginated_response(serializer.data)
 
 
 class PrescriptionViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.RetrieveAPIView):
-    queryset = Prescription.objects.filter(active=True).all()
+    queryset = Prescription.objects.filter(active=True).select_related('patient', 'doctor') \
+        .prefetch_related(Prefetch('prescription_details', queryset=PrescriptionDetail.objects.select_related('medicine')))
     serializer_class = PrescriptionSerializer
 
     def get_permissions(self):
@@ -456,38 +601,21 @@ class PrescriptionViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.Ret
         return [permission() for permission in permission_classes]
 
     def create(self, request, *args, **kwargs):
-        data = request.data
-
-        if data.get('doctor') is None:
-            data['doctor'] = request.user.id
-
-        appointment = Appointment.objects.get(pk=data.get('appointment'))
+        appointment = get_object_or_404(Appointment.objects.select_related('patient'), pk=request.data.get('appointment'))
         if appointment.status != 'exam_completed':
             return Response({'error': 'Appointment is not completed yet'}, status=status.HTTP_400_BAD_REQUEST)
         if Prescription.objects.filter(appointment=appointment).exists():
             return Response({'error': 'Prescription already created for this appointment'},
                             status=status.HTTP_400_BAD_REQUEST)
-        if appointment.doctor != request.user:
+        if appointment.doctor_id != request.user.id:
             return Response({'error': 'You are not allowed to create prescription for this appointment'},
                             status=status.HTTP_403_FORBIDDEN)
-        if data.get('patient') is None:
-            data['patient'] = appointment.patient.id
 
-        serializer = PrescriptionSerializer(data=data)
+        serializer = PrescriptionSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        prescription = serializer.save()
-
-        for medicine_data in data.get('prescription_details', []):
-            medicine = Medicine.objects.get(pk=medicine_data['medicine'])
-            detail = PrescriptionDetail.objects.create(
-                prescription=prescription,
-                medicine=medicine,
-                quantity=medicine_data['quantity'],
-                morning_dose=medicine_data.get('morning_dose', 0),
-                afternoon_dose=medicine_data.get('afternoon_dose', 0),
-                evening_dose=medicine_data.get('evening_dose', 0),
-                note=medicine_data.get('note', None),
-            )
+        # Đơn thuốc và toàn bộ chi tiết được tạo trong một transaction (chi tiết dùng một lệnh bulk insert)
+        with transaction.atomic():
+            serializer.save(patient=appointment.patient, doctor=request.user)
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -513,10 +641,15 @@ class InvoiceViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.Retrieve
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    # Xuất hoá đơn theo tháng/năm: /invoices/export/?type=csv|xlsx&period=month&year=2024&month=1
+    @action(methods=['get'], url_path='export', url_name='export', detail=False)
+    def export(self, request):
+        return export_response(request, 'invoices', exports.invoice_queryset, exports.INVOICE_COLUMNS)
+
     @action(methods=['post'], url_path='pay', url_name='pay', detail=True)
     def pay(self, request, *args, **kwargs):
         try:
-            invoice = Invoice.objects.get(pk=kwargs.get('pk'))  # Lock row for update
+            invoice = Invoice.objects.select_related('patient', 'created_by').get(pk=kwargs.get('pk'))
         except Invoice.DoesNotExist:
             return Response({'error': 'Invoice not found'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -536,7 +669,7 @@ class InvoiceViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.Retrieve
 
     @action(methods=['post'], url_path='cancel', url_name='cancel', detail=True)
     def cancel(self, request, *args, **kwargs):
-        invoice = Invoice.objects.get(pk=kwargs.get('pk'))
+        invoice = Invoice.objects.select_related('patient', 'created_by').get(pk=kwargs.get('pk'))
         if invoice.status in ['pending', 'paid']:
             invoice.status = 'cancelled'
             invoice.save()
@@ -545,8 +678,8 @@ class InvoiceViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.Retrieve
             return Response({'error': 'Invoice cannot be cancelled'}, status=status.HTTP_400_BAD_REQUEST)
 
     def retrieve(self, request, *args, **kwargs):
-        invoice = get_object_or_404(Invoice, pk=kwargs.get('pk'))
-        if request.user.role == 'patient' and invoice.patient != request.user:
+        invoice = get_object_or_404(Invoice.objects.select_related('patient', 'created_by'), pk=kwargs.get('pk'))
+        if request.user.role == 'patient' and invoice.patient_id != request.user.id:
             return Response({'error': 'You are not allowed to view this invoice'}, status=status.HTTP_403_FORBIDDEN)
         serializer = InvoiceSerializer(invoice)
         return Response(serializer.data)
@@ -567,6 +700,169 @@ class InvoiceViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.Retrieve
                            status=status.HTTP_400_BAD_REQUEST)
 
 
+EVENT_HEARTBEAT_SECONDS = 15
+
+
+def authenticate_request(request):
+    result = OAuth2Authentication().authenticate(Request(request))
+    return None if result is None else result[0]
+
+
+def event_channels(user):
+    roles = get_user_roles(user)
+    channels = []
+    if 'nurse' in roles:
+        channels.append(events.NURSES_CHANNEL)
+    if 'doctor' in roles:
+        channels.append(events.doctor_channel(user.id))
+    return channels
+
+
+# Xác thực bằng vé lấy từ users/event-ticket/ (trình duyệt) hoặc header Authorization, không nhận ?access_token=
+def authenticate_event_stream(request):
+    ticket = request.GET.get('ticket')
+    if ticket:
+        user_id = events.consume_stream_ticket(ticket)
+        user = MyUser.objects.filter(pk=user_id, is_active=True).first() if user_id else None
+        if user is None:
+            raise AuthenticationFailed('Invalid or expired ticket')
+    elif 'HTTP_AUTHORIZATION' in request.META:
+        user = authenticate_request(request)
+    else:
+        user = None
+    if user is None:
+        return None, ()
+    return user, event_channels(user)
+
+
+# Luồng server-sent events thay cho việc y tá/bác sĩ liên tục hỏi lại danh sách chờ xác nhận.
+# Cần chạy qua ASGI (clinicapp/asgi.py) để mỗi kết nối không chiếm một thread.
+async def appointment_events(request):
+    try:
+        user, channels = await sync_to_async(authenticate_event_stream)(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({'error': str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+    if user is None:
+        return JsonResponse({'error': 'Authentication credentials were not provided'},
+                            status=status.HTTP_401_UNAUTHORIZED)
+    if not channels:
+        return JsonResponse({'error': 'Only nurses and doctors can subscribe to appointment events'},
+                            status=status.HTTP_403_FORBIDDEN)
+
+    subscription = events.get_broker().subscribe(channels)
+
+    async def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event = await subscription.get(EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': heartbeat\n\n'
+                    continue
+                yield f'event: appointment\ndata: {event}\n\n'
+        except ConnectionResetError:
+            return
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# View async cho các endpoint đọc nhiều của danh mục bác sĩ, phục vụ qua ASGI (clinicapp/asgi.py) tại /async/doctors/...
+# Trả cùng JSON với các action tương ứng của DoctorViewSet nhưng đọc DB/cache bằng API async của Django
+# nên worker không bị chặn trong lúc chờ, so sánh với WSGI bằng lệnh load_test.
+def async_api_view(view):
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        try:
+            user = await sync_to_async(authenticate_request)(request)
+        except AuthenticationFailed as e:
+            return JsonResponse({'detail': str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'},
+                                status=status.HTTP_401_UNAUTHORIZED)
+        try:
+            return await view(request, *args, **kwargs)
+        except Http404:
+            return JsonResponse({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        except InvalidPage:
+            return JsonResponse({'detail': 'Invalid page.'}, status=status.HTTP_404_NOT_FOUND)
+
+    return wrapper
+
+
+# Phân trang như PageNumberPagination (mặc định của REST_FRAMEWORK) cho queryset .values()
+async def apaginate(request, queryset, fast_serializer):
+    page_size = api_settings.PAGE_SIZE
+    try:
+        number = int(request.GET.get('page', 1))
+    except ValueError:
+        raise InvalidPage
+    count = await queryset.acount()
+    pages = max(1, math.ceil(count / page_size))
+    if not 1 <= number <= pages:
+        raise InvalidPage
+
+    rows = [row async for row in queryset[(number - 1) * page_size:number * page_size]]
+    url = request.build_absolute_uri()
+    previous = None
+    if number > 1:
+        previous = remove_query_param(url, 'page') if number == 2 else replace_query_param(url, 'page', number - 1)
+    return {
+        'count': count,
+        'next': replace_query_param(url, 'page', number + 1) if number < pages else None,
+        'previous': previous,
+        'results': fast_serializer.serialize(rows)
+    }
+
+
+@async_api_view
+async def async_doctor_list(request):
+    async def build():
+        queryset = fast_serializers.fast_doctor_list.get_queryset(Doctor.objects.order_by('id'))
+        return await apaginate(request, queryset, fast_serializers.fast_doctor_list)
+
+    return await directory.acached_response(request, f'list:{request.build_absolute_uri()}', build)
+
+
+@async_api_view
+async def async_doctor_introduce(request, pk):
+    async def build():
+        try:
+            doctor = await Doctor.objects.select_related('user').aget(pk=pk)
+        except Doctor.DoesNotExist:
+            raise Http404
+        return DoctorIntroduceSerializer(doctor).data
+
+    return await directory.acached_response(request, f'introduce:{pk}', build)
+
+
+@async_api_view
+async def async_doctor_time_slots(request, pk):
+    doctor_id = await Doctor.objects.filter(pk=pk).values_list('user_id', flat=True).afirst()
+    if doctor_id is None:
+        raise Http404
+
+    date_param = request.GET.get('date', None)
+    if not date_param:
+        return JsonResponse({'error': 'Missing date parameter'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        date_obj = datetime.strptime(date_param, '%Y-%m-%d').date()
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date format'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if await ais_max_appointment_per_day_reached(date_obj):
+        return JsonResponse({'error': 'Maximum appointment per day reached'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return JsonResponse({'available_time_slots': await slots.aavailable_slots(doctor_id, date_obj)})
+
+
 # Clinic Statistics
 #
 # def report_view(request):
@@ -574,3 +870,34 @@ class InvoiceViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.Retrieve
 #     #     return HttpResponseForbidden("Only admins can access this page.")
 #     return render(request, 'clinic/activity-stats.html')
 
+
+class StatsViewSet(viewsets.ViewSet):
+    # Đọc từ các bảng thống kê theo ngày (xem stats.py), không quét bảng Appointment/Invoice
+    permission_classes = [IsAdmin]
+
+    def respond(self, request, build):
+        period = get_period(request)
+        if period is None:
+            return invalid_period_response()
+        period, from_date, to_date = period
+        return Response({'period': period, **build(from_date, to_date, period)})
+
+    @action(methods=['get'], url_path='appointments', url_name='appointments', detail=False)
+    def appointments(self, request):
+        return self.respond(request, stats.appointment_stats)
+
+    @action(methods=['get'], url_path='revenue', url_name='revenue', detail=False)
+    def revenue(self, request):
+        return self.respond(request, stats.revenue_stats)
+
+    @action(methods=['get'], url_path='patients', url_name='patients', detail=False)
+    def patients(self, request):
+        return self.respond(request, stats.patient_stats)
+
+
+class MetricsViewSet(viewsets.ViewSet):
+    # Số liệu theo endpoint của process đang phục vụ request, định dạng text của Prometheus
+    permission_classes = [IsAdmin]
+
+    def list(self, request):
+        return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
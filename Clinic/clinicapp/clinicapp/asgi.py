@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'clinicapp.settings')
+# Settings bỏ các middleware chỉ chạy đồng bộ (debug toolbar) khỏi chuỗi middleware ASGI
+os.environ['CLINIC_ASGI'] = '1'
 
 application = get_asgi_application()
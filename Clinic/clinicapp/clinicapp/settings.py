@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'clinic.metrics.MetricsMiddleware',
+    'clinic.db_router.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,9 +55,13 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+# DebugToolbarMiddleware chỉ chạy đồng bộ: dưới ASGI nó buộc cả chuỗi middleware và các view async
+# chạy qua thread nên chỉ bật khi chạy WSGI (clinicapp/asgi.py đặt CLINIC_ASGI trước khi nạp settings)
+if DEBUG and not os.environ.get('CLINIC_ASGI'):
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'clinicapp.urls'
 
 TEMPLATES = [
@@ -88,6 +95,33 @@ DATABASES = {
     }
 }
 
+# Cache dùng cho chỉ mục khung giờ trống; khi chạy nhiều worker cần trỏ tới cache dùng chung (Redis/Memcached)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'clinic',
+    }
+}
+
+# Request đọc được gửi tới các replica (alias trong DATABASES), ghi luôn vào 'default', xem clinic/db_router.py.
+# Ví dụ: DATABASES['replica'] = {..., 'HOST': 'mysql-replica'}; DATABASE_REPLICAS = ['replica']
+DATABASE_ROUTERS = ['clinic.db_router.PrimaryReplicaRouter']
+DATABASE_REPLICAS = []
+# Sau khi ghi, client đọc từ primary trong khoảng này (lớn hơn độ trễ replication)
+REPLICA_STICKY_SECONDS = 5
+
+# Số lịch hẹn tối đa (chưa huỷ) mà phòng khám nhận trong một ngày
+MAX_APPOINTMENT_PER_DAY = 100
+
+# Lịch hẹn đã đóng (huỷ/đã khám) cũ hơn số ngày này được chuyển sang bảng lưu trữ (manage.py archive_appointments)
+ARCHIVE_AFTER_DAYS = 365
+
+# Danh sách chỉ đọc được serialize từ .values() thay vì model instance (xem clinic/fast_serializers.py)
+FAST_LIST_SERIALIZERS = True
+
+# Broker phát sự kiện lịch hẹn tới các luồng /events/appointments/ (xem clinic/events.py)
+EVENT_BROKER = 'clinic.events.LocalBroker'
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -147,15 +181,28 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'clinic.metrics.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 5
 }
 
 OAUTH2_PROVIDER = {
-    'OAUTH2_BACKEND_CLASS': 'oauth2_provider.oauth2_backends.JSONOAuthLibCore'
+    'OAUTH2_BACKEND_CLASS': 'oauth2_provider.oauth2_backends.JSONOAuthLibCore',
+    'OAUTH2_VALIDATOR_CLASS': 'clinic.oauth2.CachedOAuth2Validator',
 }
 
-MEDIA_ROOT = '%s/clinic/static/' % BASE_DIR
+# Lưu access token đã xác thực (kèm user) vào cache dùng chung ngoài LRU trong process, xem clinic/oauth2.py
+OAUTH2_TOKEN_SHARED_CACHE = True
+
+# Ảnh người dùng tải lên (LocalAvatarStorage) nằm ngoài thư mục static, phục vụ ở /media/ khi DEBUG
+MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_URL = '/media/'
+
+# Nơi lưu ảnh đại diện và sinh bản thu nhỏ; dùng clinic.avatars.LocalAvatarStorage khi không có Cloudinary
+AVATAR_STORAGE = 'clinic.avatars.CloudinaryAvatarStorage'
 
 CLIENT_ID = 'tqHm6y9DrpjfTT994u3tpPVrRKsmi1T8HlHJvbce'
 CLIENT_SECRET = 'wwKiKMqRlQ8QvRYGTmbDDg1Q8PlfRqzxIi7Bbigup4A1jSoPOoQGUcrQOEsu80JMcfjMMUeqhmcQCq25h9PjIaHEXIvU7nA7Ah2KhSnfhEWJWOySeS2KIiPBwjcMQ0K9'
@@ -0,0 +1,17 @@
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+# Chạy test trên hai CSDL SQLite thay cho MySQL primary và replica:
+#   python manage.py test --settings=clinicapp.test_settings
+# Replica không mirror primary nên test định tuyến phân biệt được dữ liệu đọc từ đâu.
+# DATABASE_REPLICAS để trống, test định tuyến tự bật bằng override_settings.
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+    },
+}